@@ -0,0 +1,93 @@
+"""
+Servicio de acceso asíncrono a MongoDB (pymongo AsyncMongoClient) para las vistas ASGI
+"""
+import asyncio
+from typing import List, Dict, Any, Optional, Tuple
+from pymongo import ASCENDING, AsyncMongoClient
+from . import mongo_service
+from .mongo_service import CAMPOS_LISTADO, obtener_marcas, pipeline_marcas, resultado_marcas
+from .query_runner import medir, opciones
+
+
+# El cliente asíncrono queda ligado al event loop en que se crea, así que hay
+# uno por loop. Bajo uvicorn hay un solo loop por worker; runserver con vistas
+# async corre cada request en un loop nuevo (asyncio.run). Cada cliente se
+# cierra en su propio loop cuando este termina (ver _cerrar_al_terminar).
+_clientes: Dict[asyncio.AbstractEventLoop, Tuple[AsyncMongoClient, asyncio.Task]] = {}
+
+
+def get_async_db():
+    """Base de datos asíncrona, o None si MongoDB no está disponible"""
+    # La disponibilidad la decide el cliente síncrono (un ping por proceso)
+    if mongo_service.get_db() is None:
+        return None
+
+    loop = asyncio.get_running_loop()
+    actual = _clientes.get(loop)
+    if actual is None:
+        # Loops cerrados sin pasar por asyncio.run: su cliente ya no se puede cerrar
+        for cerrado in [otro for otro in list(_clientes) if otro.is_closed()]:
+            _clientes.pop(cerrado, None)
+        uri, opciones = mongo_service.configuracion_mongo()
+        cliente = AsyncMongoClient(uri, event_listeners=[mongo_service.pool_stats], **opciones)
+        actual = _clientes[loop] = (cliente, loop.create_task(_cerrar_al_terminar(loop, cliente)))
+    return actual[0][mongo_service.MONGO_DB_NAME]
+
+
+async def _cerrar_al_terminar(loop: asyncio.AbstractEventLoop, cliente: AsyncMongoClient) -> None:
+    """
+    Espera sin fin: al terminar, asyncio.run (y el apagado de uvicorn) cancela
+    las tareas pendientes y espera a que terminen antes de cerrar el loop, así
+    que el cliente se cierra en el loop al que está ligado.
+    """
+    try:
+        await loop.create_future()
+    finally:
+        _clientes.pop(loop, None)
+        await cliente.close()
+
+
+async def agregar(collection, pipeline: List[Dict[str, Any]], consulta: str) -> List[Dict[str, Any]]:
+    """Ejecuta un pipeline de agregación con el presupuesto de `consulta` (ver query_runner)"""
+    kwargs = opciones(consulta)
+    with medir(consulta):
+        cursor = await collection.aggregate(pipeline, **kwargs)
+        return await cursor.to_list(None)
+
+
+async def buscar(cursor, consulta: str) -> List[Dict[str, Any]]:
+    """Aplica maxTimeMS/batchSize de `consulta` a un cursor de find y retorna todos los documentos"""
+    kwargs = opciones(consulta)
+    with medir(consulta):
+        return await cursor.max_time_ms(kwargs["maxTimeMS"]).batch_size(kwargs["batchSize"]).to_list(None)
+
+
+async def obtener_por_categoria_ordenado_async(coleccion: str, categoria: str, limit: int = 20) -> List[Dict[str, Any]]:
+    """Versión asíncrona de mongo_service.obtener_por_categoria_ordenado"""
+    adb = get_async_db()
+    if adb is None:
+        return []
+
+    cursor = (adb[coleccion]
+              .find({"categoria": categoria}, CAMPOS_LISTADO)
+              .sort("precio_valor", ASCENDING)
+              .limit(int(limit)))
+    docs = await buscar(cursor, "offers_by_category")
+    for d in docs:
+        d["_id"] = str(d["_id"])
+    return docs
+
+
+async def obtener_marcas_async(
+    coleccion: str,
+    with_counts: bool = False,
+    fuente: Optional[str] = None,
+    categoria: Optional[str] = None,
+):
+    """Versión asíncrona de mongo_service.obtener_marcas (mismos datos de ejemplo sin Mongo)"""
+    adb = get_async_db()
+    if adb is None:
+        return obtener_marcas(coleccion, with_counts=with_counts, fuente=fuente, categoria=categoria)
+
+    data = await agregar(adb[coleccion], pipeline_marcas(with_counts, fuente, categoria), "marcas")
+    return resultado_marcas(data, with_counts)
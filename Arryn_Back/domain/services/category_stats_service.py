@@ -0,0 +1,189 @@
+"""
+Servicio de estadísticas de precio precalculadas por categoría
+"""
+from datetime import datetime
+from typing import List, Dict, Any, Iterable, Optional
+from asgiref.sync import sync_to_async
+from pymongo import ASCENDING, UpdateOne
+from .mongo_service import get_db
+from .async_mongo_service import get_async_db
+from .events import publicar_ingesta
+from .percentiles import percentiles_ordenados
+from .query_runner import ejecutar_agregacion, medir, opciones
+
+
+STATS_COLLECTION = "categoria_stats"
+PERCENTILES = (25, 50, 75, 90)
+
+
+class CategoryStatsService:
+    """Servicio para mantener la colección categoria_stats"""
+
+    @staticmethod
+    def refrescar(categorias: Optional[Iterable[str]] = None) -> int:
+        """
+        Recalcula avg/min/max/count y percentiles de precio_valor para las
+        categorías indicadas (todas si es None). El recorrido ordenado por
+        precio usa el índice categoria_precio.
+
+        Returns:
+            Número de categorías actualizadas
+        """
+        db = get_db()
+        if db is None:
+            return 0
+
+        collection = db["archivos"]
+        stats = db[STATS_COLLECTION]
+        if categorias is None:
+            categorias = collection.distinct("categoria")
+
+        actualizadas, refrescadas = 0, set()
+        for categoria in {c for c in categorias if isinstance(c, str) and c}:
+            match = {"categoria": categoria, "precio_valor": {"$type": "number"}}
+            resumen = ejecutar_agregacion(collection, [
+                {"$match": match},
+                {"$group": {
+                    "_id": None,
+                    "precio_promedio": {"$avg": "$precio_valor"},
+                    "precio_min": {"$min": "$precio_valor"},
+                    "precio_max": {"$max": "$precio_valor"},
+                    "total": {"$sum": 1},
+                    "suma": {"$sum": "$precio_valor"},
+                }},
+            ], "category_stats")
+            if not resumen:
+                stats.delete_one({"categoria": categoria})
+                refrescadas.add(categoria)
+                continue
+
+            data = resumen[0]
+            limites = opciones("category_stats")
+            cursor = (collection
+                      .find(match, {"_id": 0, "precio_valor": 1})
+                      .sort("precio_valor", ASCENDING)
+                      .max_time_ms(limites["maxTimeMS"])
+                      .batch_size(limites["batchSize"]))
+            with medir("category_stats"):
+                percentiles = percentiles_ordenados((d["precio_valor"] for d in cursor), data["total"], PERCENTILES)
+            cursor.close()
+
+            stats.replace_one(
+                {"categoria": categoria},
+                {
+                    "categoria": categoria,
+                    "precio_promedio": data["precio_promedio"],
+                    "precio_min": data["precio_min"],
+                    "precio_max": data["precio_max"],
+                    "total": data["total"],
+                    "suma": data["suma"],
+                    "percentiles": {f"p{p}": valor for p, valor in percentiles.items()},
+                    "actualizado_en": datetime.now(),
+                },
+                upsert=True,
+            )
+            actualizadas += 1
+            refrescadas.add(categoria)
+
+        if refrescadas:
+            publicar_ingesta(STATS_COLLECTION, categorias=refrescadas)
+        return actualizadas
+
+    @staticmethod
+    def aplicar_deltas(docs: Iterable[Dict[str, Any]]) -> int:
+        """
+        Suma documentos recién insertados (modo insert, append) a las
+        estadísticas de su categoría con $inc/$min/$max, sin recorrer la
+        categoría. Los percentiles quedan como estaban hasta el próximo
+        refresh_categoria_stats. Las categorías sin estadísticas (o
+        guardadas sin `suma`) se recalculan completas con refrescar.
+
+        Returns:
+            Número de categorías actualizadas
+        """
+        db = get_db()
+        if db is None:
+            return 0
+
+        deltas: Dict[str, Dict[str, Any]] = {}
+        for doc in docs:
+            categoria, precio = doc.get("categoria"), doc.get("precio_valor")
+            if not isinstance(categoria, str) or not categoria:
+                continue
+            if isinstance(precio, bool) or not isinstance(precio, (int, float)):
+                continue
+            delta = deltas.setdefault(categoria, {"total": 0, "suma": 0, "precio_min": precio, "precio_max": precio})
+            delta["total"] += 1
+            delta["suma"] += precio
+            delta["precio_min"] = min(delta["precio_min"], precio)
+            delta["precio_max"] = max(delta["precio_max"], precio)
+        if not deltas:
+            return 0
+
+        stats = db[STATS_COLLECTION]
+        ahora = datetime.now()
+        categorias = list(deltas)
+        resultado = stats.bulk_write([
+            UpdateOne(
+                {"categoria": categoria, "suma": {"$type": "number"}},
+                {
+                    "$inc": {"total": deltas[categoria]["total"], "suma": deltas[categoria]["suma"]},
+                    "$min": {"precio_min": deltas[categoria]["precio_min"]},
+                    "$max": {"precio_max": deltas[categoria]["precio_max"]},
+                    "$set": {"actualizado_en": ahora},
+                },
+            )
+            for categoria in categorias
+        ], ordered=False)
+
+        # El promedio se recalcula desde los acumulados ya sumados, así que
+        # dos ingestas concurrentes no se pisan
+        stats.update_many(
+            {"categoria": {"$in": categorias}, "suma": {"$type": "number"}},
+            [{"$set": {"precio_promedio": {"$divide": ["$suma", "$total"]}}}],
+        )
+        actualizadas = resultado.matched_count
+        if actualizadas:
+            publicar_ingesta(STATS_COLLECTION, categorias=set(categorias))
+
+        if actualizadas < len(categorias):
+            existentes = {d["categoria"] for d in stats.find(
+                {"categoria": {"$in": categorias}, "suma": {"$type": "number"}}, {"_id": 0, "categoria": 1}
+            )}
+            faltantes = [categoria for categoria in categorias if categoria not in existentes]
+            actualizadas = len(existentes) + CategoryStatsService.refrescar(faltantes)
+        return actualizadas
+
+    @staticmethod
+    def asegurar(categoria: Optional[str] = None) -> None:
+        """Calcula las estadísticas si aún no existen (primer uso tras desplegar)"""
+        db = get_db()
+        if db is None:
+            return
+
+        filtro = {"categoria": categoria} if categoria else {}
+        if db[STATS_COLLECTION].count_documents(filtro, limit=1) == 0:
+            CategoryStatsService.refrescar([categoria] if categoria else None)
+
+    @staticmethod
+    async def asegurar_async(categoria: Optional[str] = None) -> None:
+        """Versión asíncrona de asegurar; el cálculo inicial (poco frecuente) corre en un hilo"""
+        adb = get_async_db()
+        if adb is None:
+            return
+
+        filtro = {"categoria": categoria} if categoria else {}
+        if await adb[STATS_COLLECTION].count_documents(filtro, limit=1) == 0:
+            await sync_to_async(CategoryStatsService.refrescar, thread_sensitive=False)(
+                [categoria] if categoria else None
+            )
+
+    @staticmethod
+    def obtener(categoria: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Retorna las estadísticas guardadas (de una categoría o de todas)"""
+        db = get_db()
+        if db is None:
+            return []
+
+        filtro = {"categoria": categoria} if categoria else {}
+        return list(db[STATS_COLLECTION].find(filtro, {"_id": 0}))
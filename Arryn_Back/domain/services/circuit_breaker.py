@@ -0,0 +1,407 @@
+"""
+Servicio de circuit breaker para las consultas a MongoDB con respaldo del último resultado válido
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from django.core.cache import cache
+from pymongo.errors import ConnectionFailure, ExecutionTimeout
+
+from .mongo_service import get_db
+from .async_mongo_service import get_async_db
+from .query_runner import DeadlineVencido, tiempo_restante_ms
+
+# Ventana (segundos) sobre la que se calcula la tasa de fallos
+MONGO_CB_WINDOW = float(os.getenv("MONGO_CB_WINDOW", 30))
+# Proporción de fallos en la ventana que abre el circuito
+MONGO_CB_FAILURE_RATE = float(os.getenv("MONGO_CB_FAILURE_RATE", 0.5))
+# Llamadas mínimas en la ventana antes de evaluar la tasa
+MONGO_CB_MIN_CALLS = int(os.getenv("MONGO_CB_MIN_CALLS", 10))
+# Segundos que el circuito queda abierto antes de probar de nuevo
+MONGO_CB_OPEN_SECONDS = float(os.getenv("MONGO_CB_OPEN_SECONDS", 15))
+# Consultas de prueba simultáneas permitidas en semiabierto
+MONGO_CB_HALF_OPEN_PROBES = int(os.getenv("MONGO_CB_HALF_OPEN_PROBES", 1))
+# Vida del último resultado válido de cada consulta
+MONGO_LKG_TIMEOUT = int(os.getenv("MONGO_LKG_TIMEOUT", 86400))
+# Intervalo mínimo entre escrituras del último resultado válido de una consulta
+MONGO_LKG_REFRESH_SECONDS = float(os.getenv("MONGO_LKG_REFRESH_SECONDS", 60))
+# Datos de ejemplo cuando no hay Mongo ni resultado guardado (solo desarrollo)
+MONGO_MOCK_FALLBACK = os.getenv("MONGO_MOCK_FALLBACK", os.getenv("DEBUG", "True")).lower() in ("true", "1", "yes")
+
+
+class MongoNoDisponible(Exception):
+    """MongoDB no responde y no hay un resultado válido guardado para la consulta"""
+
+    def __init__(self, mensaje: str, reintentar_en: Optional[float] = None):
+        super().__init__(mensaje)
+        self.reintentar_en = reintentar_en
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por tasa de fallos en una ventana deslizante.
+
+    Cerrado: las llamadas pasan y se registra su resultado; si en la ventana
+    hay al menos minimo_llamadas y la proporción de fallos llega al umbral,
+    se abre. Abierto: se rechazan sin intentar (fallan rápido) durante
+    tiempo_abierto. Semiabierto: pasan hasta `sondas` llamadas de prueba; un
+    éxito cierra el circuito y un fallo lo vuelve a abrir. Los éxitos que
+    llegan con el circuito abierto (llamadas iniciadas antes de abrirse) se
+    ignoran.
+    """
+    CERRADO = "cerrado"
+    ABIERTO = "abierto"
+    SEMIABIERTO = "semiabierto"
+
+    def __init__(self, nombre: str, ventana: float, umbral_fallos: float,
+                 minimo_llamadas: int, tiempo_abierto: float, sondas: int = 1):
+        self.nombre = nombre
+        self.ventana = ventana
+        self.umbral_fallos = umbral_fallos
+        self.minimo_llamadas = minimo_llamadas
+        self.tiempo_abierto = tiempo_abierto
+        self.sondas = sondas
+        self._lock = threading.Lock()
+        self._resultados = deque()  # (instante, exito)
+        self._estado = self.CERRADO
+        self._abierto_hasta = 0.0
+        self._sondas_en_curso = 0
+        self._inicio_sondas = 0.0
+        self._aperturas = 0
+
+    def permitir(self) -> bool:
+        """True si la llamada puede intentarse"""
+        with self._lock:
+            if self._estado == self.CERRADO:
+                return True
+            ahora = time.monotonic()
+            if self._estado == self.ABIERTO:
+                if ahora < self._abierto_hasta:
+                    return False
+                self._estado = self.SEMIABIERTO
+                self._sondas_en_curso = 0
+                self._inicio_sondas = ahora
+            elif ahora - self._inicio_sondas > self.tiempo_abierto:
+                # Sondas que nunca informaron (cancelada la request): se liberan
+                self._sondas_en_curso = 0
+                self._inicio_sondas = ahora
+            if self._sondas_en_curso < self.sondas:
+                self._sondas_en_curso += 1
+                return True
+            return False
+
+    def registrar_exito(self):
+        with self._lock:
+            if self._estado == self.ABIERTO:
+                # Llamada que empezó antes de abrirse el circuito: no es una sonda
+                return
+            if self._estado == self.SEMIABIERTO:
+                print(f"✅ Circuito {self.nombre} cerrado")
+                self._estado = self.CERRADO
+                self._resultados.clear()
+                return
+            self._agregar(True)
+
+    def registrar_fallo(self):
+        with self._lock:
+            if self._estado != self.CERRADO:
+                self._abrir()
+                return
+            self._agregar(False)
+            total = len(self._resultados)
+            fallos = sum(1 for _, exito in self._resultados if not exito)
+            if total >= self.minimo_llamadas and fallos / total >= self.umbral_fallos:
+                self._abrir()
+
+    def liberar(self):
+        """Resultado que no dice nada de la salud del recurso: solo libera la sonda tomada en permitir()"""
+        with self._lock:
+            if self._estado == self.SEMIABIERTO and self._sondas_en_curso > 0:
+                self._sondas_en_curso -= 1
+
+    def reintentar_en(self) -> float:
+        """Segundos hasta la próxima prueba (0 si el circuito no está abierto)"""
+        with self._lock:
+            if self._estado != self.ABIERTO:
+                return 0.0
+            return max(0.0, self._abierto_hasta - time.monotonic())
+
+    def estado(self) -> dict:
+        with self._lock:
+            self._purgar()
+            total = len(self._resultados)
+            fallos = sum(1 for _, exito in self._resultados if not exito)
+            return {
+                "estado": self._estado,
+                "llamadas_en_ventana": total,
+                "fallos_en_ventana": fallos,
+                "aperturas": self._aperturas,
+            }
+
+    def _abrir(self):
+        # Se llama con el lock tomado
+        if self._estado != self.ABIERTO:
+            print(f"⚠️  Circuito {self.nombre} abierto por {self.tiempo_abierto:.0f}s")
+            self._aperturas += 1
+        self._estado = self.ABIERTO
+        self._abierto_hasta = time.monotonic() + self.tiempo_abierto
+        self._resultados.clear()
+
+    def _agregar(self, exito: bool):
+        self._resultados.append((time.monotonic(), exito))
+        self._purgar()
+
+    def _purgar(self):
+        limite = time.monotonic() - self.ventana
+        while self._resultados and self._resultados[0][0] < limite:
+            self._resultados.popleft()
+
+
+# Compartido por todas las consultas a Mongo del proceso
+circuito_mongo = CircuitBreaker(
+    "mongo",
+    ventana=MONGO_CB_WINDOW,
+    umbral_fallos=MONGO_CB_FAILURE_RATE,
+    minimo_llamadas=MONGO_CB_MIN_CALLS,
+    tiempo_abierto=MONGO_CB_OPEN_SECONDS,
+    sondas=MONGO_CB_HALF_OPEN_PROBES,
+)
+
+# Antigüedad (segundos) del dato más viejo servido desde el respaldo en la
+# petición actual; la capa HTTP la expone como cabecera (StaleDataMiddleware)
+_edad_datos_obsoletos: ContextVar[Optional[float]] = ContextVar("edad_datos_obsoletos", default=None)
+# Si la petición actual sirvió datos de ejemplo (MONGO_MOCK_FALLBACK)
+_datos_ejemplo: ContextVar[bool] = ContextVar("datos_ejemplo", default=False)
+
+
+def reiniciar_obsolescencia():
+    _edad_datos_obsoletos.set(None)
+    _datos_ejemplo.set(False)
+
+
+def edad_datos_obsoletos() -> Optional[float]:
+    return _edad_datos_obsoletos.get()
+
+
+def sirvio_datos_ejemplo() -> bool:
+    return _datos_ejemplo.get()
+
+
+def _marcar_obsoleto(edad: float):
+    actual = _edad_datos_obsoletos.get()
+    _edad_datos_obsoletos.set(edad if actual is None else max(actual, edad))
+
+
+# Un circuito por consulta para sus timeouts de servidor (maxTimeMS): una
+# consulta que excede su presupuesto (p. ej. un reporte sobre una categoría
+# enorme) sirve su respaldo sin abrir el circuito de todas las demás
+_circuitos_consulta: Dict[str, CircuitBreaker] = {}
+_circuitos_consulta_lock = threading.Lock()
+
+
+def circuito_de_consulta(nombre: str) -> CircuitBreaker:
+    with _circuitos_consulta_lock:
+        circuito = _circuitos_consulta.get(nombre)
+        if circuito is None:
+            circuito = _circuitos_consulta[nombre] = CircuitBreaker(
+                f"mongo:{nombre}",
+                ventana=MONGO_CB_WINDOW,
+                umbral_fallos=MONGO_CB_FAILURE_RATE,
+                minimo_llamadas=MONGO_CB_MIN_CALLS,
+                tiempo_abierto=MONGO_CB_OPEN_SECONDS,
+                sondas=MONGO_CB_HALF_OPEN_PROBES,
+            )
+        return circuito
+
+
+def estado_circuitos_consulta() -> Dict[str, dict]:
+    with _circuitos_consulta_lock:
+        circuitos = dict(_circuitos_consulta)
+    return {nombre: circuito.estado() for nombre, circuito in sorted(circuitos.items())}
+
+
+# Tipos de falla de una consulta protegida
+FALLA_DEADLINE = "deadline"
+FALLA_CONSULTA = "consulta"
+FALLA_INFRAESTRUCTURA = "infraestructura"
+
+
+def tipo_de_falla(error: Exception) -> Optional[str]:
+    """
+    Clasifica el error de una consulta para los circuitos:
+        deadline: venció el deadline de la request (antes de consultar, o el
+            maxTimeMS recortado al tiempo que le quedaba); no cuenta
+        consulta: la consulta excedió su propio maxTimeMS; Mongo respondió,
+            cuenta solo en el circuito de esa consulta
+        infraestructura: Mongo caído o lento (red, pool agotado); cuenta en
+            el circuito compartido
+        None: error de la consulta (inválida); Mongo respondió
+    """
+    if isinstance(error, DeadlineVencido):
+        return FALLA_DEADLINE
+    if isinstance(error, ExecutionTimeout):
+        restante = tiempo_restante_ms()
+        return FALLA_DEADLINE if restante is not None and restante <= 0 else FALLA_CONSULTA
+    if isinstance(error, ConnectionFailure) or getattr(error, "timeout", False):
+        return FALLA_INFRAESTRUCTURA
+    return None
+
+
+def _permitir(circuito_consulta: CircuitBreaker) -> Optional[str]:
+    """Motivo para no intentar la consulta, o None si ambos circuitos la permiten"""
+    if not circuito_mongo.permitir():
+        return "MongoDB no disponible (circuito abierto)"
+    if not circuito_consulta.permitir():
+        circuito_mongo.liberar()
+        return f"La consulta {circuito_consulta.nombre} excede su maxTimeMS (circuito abierto)"
+    return None
+
+
+def _registrar(circuito_consulta: CircuitBreaker, falla: Optional[str]):
+    if falla == FALLA_DEADLINE:
+        circuito_mongo.liberar()
+        circuito_consulta.liberar()
+    elif falla == FALLA_INFRAESTRUCTURA:
+        circuito_mongo.registrar_fallo()
+        circuito_consulta.liberar()
+    else:
+        # Mongo respondió: para el circuito compartido cuenta como éxito
+        circuito_mongo.registrar_exito()
+        if falla == FALLA_CONSULTA:
+            circuito_consulta.registrar_fallo()
+        else:
+            circuito_consulta.registrar_exito()
+
+
+def _clave_respaldo(clave: tuple) -> str:
+    return "mongo_lkg_" + hashlib.blake2b(repr(clave).encode("utf-8"), digest_size=16).hexdigest()
+
+
+# Última escritura del respaldo por clave en este proceso (monotonic)
+_respaldos_guardados: Dict[str, float] = {}
+_respaldos_lock = threading.Lock()
+MAX_RESPALDOS_RECORDADOS = 10000
+
+
+def _toca_guardar(clave_cache: str) -> bool:
+    """Como mucho una escritura por clave cada MONGO_LKG_REFRESH_SECONDS en este proceso"""
+    ahora = time.monotonic()
+    with _respaldos_lock:
+        ultimo = _respaldos_guardados.get(clave_cache)
+        if ultimo is not None and ahora - ultimo < MONGO_LKG_REFRESH_SECONDS:
+            return False
+        if len(_respaldos_guardados) >= MAX_RESPALDOS_RECORDADOS:
+            _respaldos_guardados.clear()
+        _respaldos_guardados[clave_cache] = ahora
+        return True
+
+
+def _guardar_respaldo(clave: tuple, valor: Any):
+    clave_cache = _clave_respaldo(clave)
+    if not _toca_guardar(clave_cache):
+        return
+    try:
+        cache.set(clave_cache, {"valor": valor, "guardado": time.time()}, MONGO_LKG_TIMEOUT)
+    except Exception as e:
+        print(f"Error guardando último resultado válido: {e}")
+
+
+def _usar_respaldo(guardado: Optional[dict], datos_ejemplo: Callable[[], Any], motivo: str):
+    if guardado is not None:
+        _marcar_obsoleto(time.time() - guardado["guardado"])
+        return guardado["valor"]
+    if MONGO_MOCK_FALLBACK:
+        # No son datos de ninguna versión: la capa HTTP no debe cachearlos ni darles ETag
+        _datos_ejemplo.set(True)
+        return datos_ejemplo()
+    raise MongoNoDisponible(motivo, reintentar_en=circuito_mongo.reintentar_en() or MONGO_CB_OPEN_SECONDS)
+
+
+def _leer_respaldo(clave: tuple) -> Optional[dict]:
+    try:
+        return cache.get(_clave_respaldo(clave))
+    except Exception:
+        return None
+
+
+async def _leer_respaldo_async(clave: tuple) -> Optional[dict]:
+    try:
+        return await cache.aget(_clave_respaldo(clave))
+    except Exception:
+        return None
+
+
+async def _guardar_respaldo_async(clave: tuple, valor: Any):
+    clave_cache = _clave_respaldo(clave)
+    if not _toca_guardar(clave_cache):
+        return
+    try:
+        await cache.aset(clave_cache, {"valor": valor, "guardado": time.time()}, MONGO_LKG_TIMEOUT)
+    except Exception as e:
+        print(f"Error guardando último resultado válido: {e}")
+
+
+def consultar_protegido(clave: tuple, consulta: Callable[[Any], Any], datos_ejemplo: Callable[[], Any]):
+    """
+    Ejecuta consulta(db) bajo el circuit breaker compartido.
+
+    Con éxito guarda el resultado como último válido de `clave` (como
+    mucho una vez cada MONGO_LKG_REFRESH_SECONDS por proceso). Si Mongo
+    no está disponible, el circuito está abierto o la consulta falla por
+    red/timeout, retorna el último resultado válido (marcando la petición
+    como obsoleta); sin él, datos de ejemplo si MONGO_MOCK_FALLBACK y si no
+    lanza MongoNoDisponible. Otros errores (consulta inválida) se propagan.
+    """
+    db = get_db()
+    if db is None:
+        return _usar_respaldo(_leer_respaldo(clave), datos_ejemplo, "MongoDB no disponible")
+    circuito_consulta = circuito_de_consulta(clave[0])
+    motivo = _permitir(circuito_consulta)
+    if motivo is not None:
+        return _usar_respaldo(_leer_respaldo(clave), datos_ejemplo, motivo)
+
+    try:
+        resultado = consulta(db)
+    except Exception as e:
+        falla = tipo_de_falla(e)
+        _registrar(circuito_consulta, falla)
+        if falla is None:
+            raise
+        print(f"Error consultando Mongo ({clave[0]}): {e}")
+        return _usar_respaldo(_leer_respaldo(clave), datos_ejemplo, f"MongoDB no disponible: {e}")
+
+    _registrar(circuito_consulta, None)
+    _guardar_respaldo(clave, resultado)
+    return resultado
+
+
+async def consultar_protegido_async(clave: tuple, consulta: Callable[[Any], Awaitable[Any]],
+                                    datos_ejemplo: Callable[[], Any]):
+    """Versión asíncrona de consultar_protegido: consulta(adb) con la base de AsyncMongoClient"""
+    adb = get_async_db()
+    if adb is None:
+        return _usar_respaldo(await _leer_respaldo_async(clave), datos_ejemplo, "MongoDB no disponible")
+    circuito_consulta = circuito_de_consulta(clave[0])
+    motivo = _permitir(circuito_consulta)
+    if motivo is not None:
+        return _usar_respaldo(await _leer_respaldo_async(clave), datos_ejemplo, motivo)
+
+    try:
+        resultado = await consulta(adb)
+    except Exception as e:
+        falla = tipo_de_falla(e)
+        _registrar(circuito_consulta, falla)
+        if falla is None:
+            raise
+        print(f"Error consultando Mongo ({clave[0]}): {e}")
+        return _usar_respaldo(await _leer_respaldo_async(clave), datos_ejemplo,
+                              f"MongoDB no disponible: {e}")
+
+    _registrar(circuito_consulta, None)
+    await _guardar_respaldo_async(clave, resultado)
+    return resultado
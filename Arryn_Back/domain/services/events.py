@@ -0,0 +1,36 @@
+"""
+Eventos de dominio: aviso de cambios en los datos de productos
+"""
+from typing import Callable, Iterable, List, Optional
+
+
+# Firma: callback(coleccion, categorias, fuentes). categorias/fuentes None
+# significa "alcance desconocido" (p. ej. migraciones sobre toda la colección).
+_suscriptores_ingesta: List[Callable] = []
+
+
+def suscribir_ingesta(callback: Callable) -> None:
+    """Registra un callback que se ejecuta después de cada escritura de productos"""
+    if callback not in _suscriptores_ingesta:
+        _suscriptores_ingesta.append(callback)
+
+
+def publicar_ingesta(
+    coleccion: str,
+    categorias: Optional[Iterable[str]] = None,
+    fuentes: Optional[Iterable[str]] = None
+) -> None:
+    """
+    Notifica a los suscriptores que cambiaron documentos de `coleccion`.
+    Un suscriptor que falla no interrumpe la ingesta.
+    """
+    if categorias is not None:
+        categorias = {c for c in categorias if isinstance(c, str) and c}
+    if fuentes is not None:
+        fuentes = {f for f in fuentes if isinstance(f, str) and f}
+
+    for callback in list(_suscriptores_ingesta):
+        try:
+            callback(coleccion, categorias, fuentes)
+        except Exception as e:
+            print(f"Error en suscriptor de ingesta {getattr(callback, '__name__', callback)}: {e}")
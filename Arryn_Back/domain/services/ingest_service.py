@@ -0,0 +1,611 @@
+"""
+Servicio de ingesta masiva de productos en MongoDB
+"""
+import json
+import os
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Set, Tuple
+from urllib.parse import urlsplit, urlunsplit
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from .mongo_service import get_db
+from .circuit_breaker import MONGO_CB_OPEN_SECONDS, MongoNoDisponible
+from .category_stats_service import CategoryStatsService
+from .events import publicar_ingesta
+from .product_matching import generar_product_key
+from .search_service import normalizar_texto
+from .price_history_service import PRICE_HISTORY_COLLECTION, PRICE_HISTORY_ON_INGEST, PriceHistoryService, medicion
+from .store_rollup_service import ROLLUP_ON_INGEST, StoreRollupService, claves_de
+
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 1000))
+MAX_ERRORES_REPORTADOS = int(os.getenv("INGEST_MAX_ERRORES_REPORTADOS", 20))
+MAX_ERRORES_POR_LOTE = 5
+FORMATOS_FECHA = ("%Y-%m-%d %H:%M:%S", "%d/%m/%Y", "%d/%m/%Y %H:%M:%S", "%d-%m-%Y")
+CAMPOS_DERIVADOS = ("titulo_normalizado", "product_key")
+CAMPOS_ORIGEN = {"titulo": 1, "marca": 1, "detalles_adicionales": 1}
+STATS_ON_INGEST = os.getenv("CATEGORIA_STATS_ON_INGEST", "True").lower() in ("true", "1", "yes")
+
+
+def iterar_ndjson(
+    lineas: Iterable[bytes],
+    errores: List[Dict[str, Any]],
+    conteo: Optional[Dict[str, int]] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Parsea NDJSON línea por línea. Una línea puede traer un objeto o una
+    lista de objetos. Las líneas inválidas se registran en `errores`
+    (hasta MAX_ERRORES_REPORTADOS) y se omiten sin abortar la ingesta;
+    `conteo["invalidos"]` lleva el total aunque `errores` llegue al tope.
+    """
+    if conteo is None:
+        conteo = {}
+    conteo.setdefault("invalidos", 0)
+    for numero, linea in enumerate(lineas, start=1):
+        if isinstance(linea, bytes):
+            linea = linea.decode("utf-8")
+        linea = linea.strip()
+        if not linea:
+            continue
+        try:
+            data = json.loads(linea)
+        except json.JSONDecodeError as e:
+            conteo["invalidos"] += 1
+            _registrar_error(errores, {"linea": numero, "error": str(e)})
+            continue
+
+        for doc in (data if isinstance(data, list) else [data]):
+            if isinstance(doc, dict):
+                yield doc
+            else:
+                conteo["invalidos"] += 1
+                _registrar_error(errores, {"linea": numero, "error": "Se esperaba un objeto JSON"})
+
+
+def _registrar_error(errores: List[Dict[str, Any]], error: Dict[str, Any]) -> None:
+    if len(errores) < MAX_ERRORES_REPORTADOS:
+        errores.append(error)
+
+
+def _resumir_write_errors(error: BulkWriteError) -> List[str]:
+    return [
+        f"indice {err.get('index')}: {err.get('errmsg')}"
+        for err in error.details.get("writeErrors", [])[:MAX_ERRORES_POR_LOTE]
+    ]
+
+
+def normalizar_link(link: str) -> str:
+    """Normaliza un link para usarlo como identidad: esquema/host en minúsculas, sin fragmento ni '/' final"""
+    partes = urlsplit(link.strip())
+    path = partes.path.rstrip("/") or "/"
+    return urlunsplit((partes.scheme.lower(), partes.netloc.lower(), path, partes.query, ""))
+
+
+def identidad_producto(doc: Dict[str, Any]) -> Optional[str]:
+    """Identidad estable de un producto: 'fuente|link' normalizados, o None si falta alguno"""
+    fuente = doc.get("fuente")
+    link = doc.get("link")
+    if not isinstance(fuente, str) or not isinstance(link, str) or not fuente.strip() or not link.strip():
+        return None
+    return f"{fuente.strip().lower()}|{normalizar_link(link)}"
+
+
+def normalizar_fecha(valor: Any) -> Optional[datetime]:
+    """
+    Convierte fecha_extraccion a datetime (UTC, sin tzinfo, como lo guarda
+    pymongo). Acepta ISO 8601 y los formatos de FORMATOS_FECHA.
+    Retorna None si el valor no es una fecha reconocible.
+    """
+    if isinstance(valor, datetime):
+        fecha = valor
+    elif isinstance(valor, str) and valor.strip():
+        texto = valor.strip()
+        try:
+            fecha = datetime.fromisoformat(texto.replace("Z", "+00:00"))
+        except ValueError:
+            for formato in FORMATOS_FECHA:
+                try:
+                    fecha = datetime.strptime(texto, formato)
+                    break
+                except ValueError:
+                    continue
+            else:
+                return None
+    else:
+        return None
+
+    if fecha.tzinfo is not None:
+        fecha = fecha.astimezone(timezone.utc).replace(tzinfo=None)
+    return fecha
+
+
+def campos_derivados(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Campos calculados a partir del documento que usan los índices de búsqueda y emparejamiento"""
+    return {
+        "titulo_normalizado": normalizar_texto(doc.get("titulo")),
+        "product_key": generar_product_key(doc),
+    }
+
+
+def preparar_documento(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Normaliza un documento antes de guardarlo: fecha_extraccion pasa a Date
+    BSON (el texto original se conserva en fecha_extraccion_texto) y se
+    agregan los campos_derivados.
+    """
+    original = doc.get("fecha_extraccion")
+    if isinstance(original, str):
+        fecha = normalizar_fecha(original)
+        if fecha is not None:
+            doc["fecha_extraccion"] = fecha
+            doc["fecha_extraccion_texto"] = original
+    doc.update(campos_derivados(doc))
+    return doc
+
+
+def _en_lotes(docs: Iterable[Dict[str, Any]], batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    lote = []
+    for doc in docs:
+        lote.append(doc)
+        if len(lote) >= batch_size:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def _textos(docs: Iterable[Dict[str, Any]], campo: str) -> Set[str]:
+    """Valores de texto de `campo` (se omiten listas, objetos y demás tipos)"""
+    return {valor for valor in (doc.get(campo) for doc in docs) if isinstance(valor, str)}
+
+
+def _clave_candidata() -> Dict[str, Any]:
+    """
+    Expresión de agregación que agrupa los documentos que pueden compartir
+    identidad: fuente en minúsculas y link sin fragmento ni query, en
+    minúsculas y sin '/' final. Es más gruesa que identidad_producto (dos
+    documentos con la misma identidad siempre comparten clave candidata).
+    """
+    sin_fragmento = {"$arrayElemAt": [{"$split": [{"$trim": {"input": "$link"}}, "#"]}, 0]}
+    sin_query = {"$arrayElemAt": [{"$split": [sin_fragmento, "?"]}, 0]}
+    return {
+        "fuente": {"$toLower": {"$trim": {"input": "$fuente"}}},
+        "link": {"$rtrim": {"input": {"$toLower": sin_query}, "chars": "/"}},
+    }
+
+
+def _grupos_duplicados(collection, dry_run: bool) -> Iterator[Dict[str, Any]]:
+    """
+    Grupos {_id: identidad, ids, count} con más de un snapshot. En dry_run
+    el paso 1 no escribió `identidad`: la agregación agrupa por
+    _clave_candidata y solo dentro de cada grupo candidato se calcula la
+    identidad exacta (la guardada o la de fuente + link), así la memoria no
+    crece con la colección.
+    """
+    if not dry_run:
+        yield from collection.aggregate([
+            {"$match": {"identidad": {"$type": "string"}}},
+            {"$group": {"_id": "$identidad", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+        ], allowDiskUse=True)
+        return
+
+    candidatos = collection.aggregate([
+        # $expr: el $type de consulta también aceptaría arreglos con strings, que $trim rechaza
+        {"$match": {"$expr": {"$and": [
+            {"$eq": [{"$type": "$fuente"}, "string"]},
+            {"$eq": [{"$type": "$link"}, "string"]},
+        ]}}},
+        {"$group": {"_id": _clave_candidata(), "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True)
+    for candidato in candidatos:
+        ids_por_identidad: Dict[str, List[Any]] = {}
+        for doc in collection.find({"_id": {"$in": candidato["ids"]}}, {"identidad": 1, "fuente": 1, "link": 1}):
+            identidad = doc.get("identidad")
+            if not isinstance(identidad, str):
+                identidad = identidad_producto(doc)
+            if identidad is not None:
+                ids_por_identidad.setdefault(identidad, []).append(doc["_id"])
+        for identidad, ids in ids_por_identidad.items():
+            if len(ids) > 1:
+                yield {"_id": identidad, "ids": ids, "count": len(ids)}
+
+
+class IngestService:
+    """Servicio para ingesta de productos por lotes"""
+
+    CONTEOS = {
+        "insert": ("insertados", "fallidos"),
+        "upsert": ("nuevos", "actualizados", "cambios_precio", "sin_identidad", "fallidos"),
+    }
+
+    @staticmethod
+    def ingestar_ndjson(
+        coleccion: str,
+        lineas: Iterable[bytes],
+        batch_size: int = INGEST_BATCH_SIZE,
+        modo: str = "insert"
+    ) -> Dict[str, Any]:
+        """
+        Ingesta un cuerpo NDJSON leído línea por línea. La memoria usada
+        depende de batch_size y no del tamaño total del cuerpo.
+
+        Args:
+            coleccion: Colección destino
+            lineas: Iterable de líneas (p. ej. el request como stream)
+            batch_size: Documentos por operación bulk
+            modo: "insert" (append) o "upsert" (idempotente por fuente + link)
+
+        Returns:
+            Resumen con conteos, errores de parseo y errores por lote. Las
+            líneas que no se pudieron parsear cuentan como fallidos.
+        """
+        errores_parseo: List[Dict[str, Any]] = []
+        conteo: Dict[str, int] = {}
+        resumen = IngestService.ingestar(coleccion, iterar_ndjson(lineas, errores_parseo, conteo), batch_size, modo)
+        resumen["fallidos"] += conteo["invalidos"]
+        resumen["errores_parseo"] = errores_parseo
+        return resumen
+
+    @staticmethod
+    def ingestar(
+        coleccion: str,
+        docs: Iterable[Dict[str, Any]],
+        batch_size: int = INGEST_BATCH_SIZE,
+        modo: str = "insert"
+    ) -> Dict[str, Any]:
+        """
+        Ingesta documentos en lotes de tamaño fijo.
+
+        En modo "insert" cada lote va a insert_many no ordenado. En modo
+        "upsert" cada lote va a bulk_write de UpdateOne(upsert=True) por
+        identidad (fuente + link normalizados): la colección conserva solo
+        el último snapshot por producto y se cuentan los cambios de
+        precio_valor (el registro de cambios se deriva del historial de
+        precios con resolution=cambios).
+
+        En archivos cada producto con precio se registra además en el
+        historial de precios (PriceHistoryService) y se mantienen las
+        estadísticas por categoría (CategoryStatsService, si
+        STATS_ON_INGEST) y los acumulados diarios por tienda
+        (StoreRollupService): en modo insert se suman los documentos
+        insertados de cada lote; en modo upsert se recalculan al final solo
+        las categorías y buckets del snapshot nuevo y del reemplazado.
+
+        Returns:
+            Resumen con conteos sumados y errores por lote
+
+        Raises:
+            MongoNoDisponible: si no hay conexión a MongoDB al empezar
+        """
+        if modo not in IngestService.CONTEOS:
+            raise ValueError(f"Modo de ingesta inválido: {modo}")
+        if get_db() is None:
+            raise MongoNoDisponible("MongoDB no disponible", reintentar_en=MONGO_CB_OPEN_SECONDS)
+
+        procesar_lote = IngestService._upsert_lote if modo == "upsert" else IngestService._insertar_lote
+        resumen: Dict[str, Any] = {"modo": modo, "recibidos": 0, "lotes": 0, "lotes_con_error": []}
+        resumen.update({clave: 0 for clave in IngestService.CONTEOS[modo]})
+
+        categorias, fuentes, buckets, categorias_stats = set(), set(), set(), set()
+        docs = (preparar_documento(doc) for doc in docs)
+        for numero_lote, lote in enumerate(_en_lotes(docs, batch_size), start=1):
+            categorias.update(_textos(lote, "categoria"))
+            fuentes.update(_textos(lote, "fuente"))
+            conteos, errores = procesar_lote(coleccion, lote, buckets, categorias_stats)
+            resumen["lotes"] = numero_lote
+            resumen["recibidos"] += len(lote)
+            for clave, valor in conteos.items():
+                resumen[clave] += valor
+            if errores and len(resumen["lotes_con_error"]) < MAX_ERRORES_REPORTADOS:
+                resumen["lotes_con_error"].append({"lote": numero_lote, **conteos, "errores": errores})
+
+        if categorias_stats:
+            resumen["categorias_recalculadas"] = CategoryStatsService.refrescar(categorias_stats)
+        if buckets:
+            StoreRollupService.recalcular(buckets)
+        if resumen["recibidos"]:
+            publicar_ingesta(coleccion, categorias, fuentes)
+
+        return resumen
+
+    @staticmethod
+    def _insertar_lote(
+        coleccion: str,
+        lote: List[Dict[str, Any]],
+        buckets: Set[tuple],
+        categorias_stats: Set[str]
+    ) -> Tuple[Dict[str, int], List[str]]:
+        """
+        Inserta un lote y retorna (conteos, mensajes de error resumidos).
+        Agrega a `buckets` y `categorias_stats` lo que hay que recalcular
+        si falla la actualización incremental.
+        """
+        db = get_db()
+        if db is None:
+            return {"insertados": 0, "fallidos": len(lote)}, ["MongoDB no disponible"]
+
+        fallidos = set()
+        try:
+            result = db[coleccion].insert_many(lote, ordered=False)
+            insertados, errores = len(result.inserted_ids), []
+        except BulkWriteError as e:
+            insertados, errores = e.details.get("nInserted", 0), _resumir_write_errors(e)
+            fallidos = {err.get("index") for err in e.details.get("writeErrors", [])}
+        except Exception as e:
+            return {"insertados": 0, "fallidos": len(lote)}, [str(e)]
+
+        insertados_lote = [doc for indice, doc in enumerate(lote) if indice not in fallidos]
+        if coleccion == "archivos" and STATS_ON_INGEST:
+            try:
+                CategoryStatsService.aplicar_deltas(insertados_lote)
+            except Exception as e:
+                categorias_stats.update(_textos(insertados_lote, "categoria"))
+                errores.append(f"estadísticas por categoría: {e}")
+        if coleccion == "archivos" and ROLLUP_ON_INGEST:
+            try:
+                StoreRollupService.aplicar_deltas(insertados_lote)
+            except Exception as e:
+                # El bucket queda desactualizado: se recalcula al final de la ingesta
+                buckets.update(claves_de(lote))
+                errores.append(f"acumulados por tienda: {e}")
+        if coleccion == "archivos" and PRICE_HISTORY_ON_INGEST:
+            try:
+                PriceHistoryService.registrar(medicion(doc, identidad_producto(doc)) for doc in insertados_lote)
+            except Exception as e:
+                errores.append(f"historial de precios: {e}")
+
+        return {"insertados": insertados, "fallidos": len(lote) - insertados}, errores
+
+    @staticmethod
+    def _upsert_lote(
+        coleccion: str,
+        lote: List[Dict[str, Any]],
+        buckets: Set[tuple],
+        categorias_stats: Set[str]
+    ) -> Tuple[Dict[str, int], List[str]]:
+        """
+        Upsert de un lote por identidad y registro de cambios de precio.
+        Agrega a `buckets` y `categorias_stats` los acumulados por tienda y
+        las categorías que hay que recalcular.
+        """
+        por_identidad: Dict[str, Dict[str, Any]] = {}
+        sin_identidad = 0
+        for doc in lote:
+            identidad = identidad_producto(doc)
+            if identidad is None:
+                sin_identidad += 1
+                continue
+            doc.pop("_id", None)
+            doc["identidad"] = identidad
+            # Si el mismo producto viene repetido en el lote, gana el último
+            por_identidad[identidad] = doc
+
+        conteos = {"nuevos": 0, "actualizados": 0, "cambios_precio": 0,
+                   "sin_identidad": sin_identidad, "fallidos": 0}
+        if not por_identidad:
+            return conteos, []
+        db = get_db()
+        if db is None:
+            conteos["fallidos"] = len(por_identidad)
+            return conteos, ["MongoDB no disponible"]
+
+        collection = db[coleccion]
+        identidades = list(por_identidad)
+        previos = {
+            d["identidad"]: d
+            for d in collection.find(
+                {"identidad": {"$in": identidades}},
+                {"_id": 0, "identidad": 1, "precio_valor": 1, "fuente": 1, "categoria": 1, "fecha_extraccion": 1}
+            )
+        }
+        precios_previos = {identidad: d.get("precio_valor") for identidad, d in previos.items()}
+
+        ahora = datetime.now()
+        operaciones = [
+            UpdateOne(
+                {"identidad": identidad},
+                {"$set": {**doc, "actualizado_en": ahora}, "$setOnInsert": {"creado_en": ahora}},
+                upsert=True,
+            )
+            for identidad, doc in por_identidad.items()
+        ]
+
+        fallidas = set()
+        errores: List[str] = []
+        try:
+            result = collection.bulk_write(operaciones, ordered=False)
+            detalles = result.bulk_api_result
+        except BulkWriteError as e:
+            detalles = e.details
+            fallidas = {err.get("index") for err in detalles.get("writeErrors", [])}
+            errores = _resumir_write_errors(e)
+        except Exception as e:
+            conteos["fallidos"] = len(operaciones)
+            return conteos, [str(e)]
+
+        conteos["nuevos"] = detalles.get("nUpserted", 0)
+        conteos["actualizados"] = detalles.get("nModified", 0)
+        conteos["fallidos"] = len(fallidas)
+        if coleccion == "archivos":
+            for indice, (identidad, doc) in enumerate(por_identidad.items()):
+                if indice in fallidas:
+                    continue
+                afectados = [doc, previos.get(identidad, {})]
+                if ROLLUP_ON_INGEST:
+                    buckets.update(claves_de(afectados))
+                if STATS_ON_INGEST:
+                    categorias_stats.update(_textos(afectados, "categoria"))
+        if coleccion == "archivos" and PRICE_HISTORY_ON_INGEST:
+            try:
+                PriceHistoryService.registrar(
+                    medicion(doc, identidad)
+                    for indice, (identidad, doc) in enumerate(por_identidad.items()) if indice not in fallidas
+                )
+            except Exception as e:
+                errores.append(f"historial de precios: {e}")
+
+        # El registro de cambios se deriva de precios_ts (resolution=cambios)
+        conteos["cambios_precio"] = sum(
+            1 for indice, (identidad, doc) in enumerate(por_identidad.items())
+            if indice not in fallidas
+            and (identidad not in precios_previos or precios_previos[identidad] != doc.get("precio_valor"))
+        )
+
+        return conteos, errores[:MAX_ERRORES_POR_LOTE]
+
+    @staticmethod
+    def deduplicar(coleccion: str, batch_size: int = INGEST_BATCH_SIZE, dry_run: bool = False) -> Dict[str, int]:
+        """
+        Migra documentos previos al modo upsert: asigna `identidad` a los que
+        no la tienen y conserva solo el snapshot más reciente (mayor _id) por
+        identidad. Para no perder la historia, los snapshots del grupo se
+        registran como mediciones en el historial de precios (precios_ts)
+        si el producto aún no tiene mediciones (p. ej. no se ejecutó antes
+        backfill_price_history).
+
+        Returns:
+            Conteos de documentos marcados, grupos duplicados, eliminados y
+            mediciones registradas
+        """
+        resumen = {"identidades_asignadas": 0, "grupos_duplicados": 0, "eliminados": 0, "mediciones_registradas": 0}
+        db = get_db()
+        if db is None:
+            return resumen
+
+        collection = db[coleccion]
+        buckets = set()
+
+        # 1) Asignar identidad por lotes (keyset sobre _id, reanudable)
+        ultimo_id = None
+        while True:
+            filtro: Dict[str, Any] = {"identidad": {"$exists": False}}
+            if ultimo_id is not None:
+                filtro["_id"] = {"$gt": ultimo_id}
+            lote = list(collection.find(filtro, {"fuente": 1, "link": 1}).sort("_id", 1).limit(batch_size))
+            if not lote:
+                break
+            ultimo_id = lote[-1]["_id"]
+            operaciones = [
+                UpdateOne({"_id": doc["_id"]}, {"$set": {"identidad": identidad}})
+                for doc in lote
+                if (identidad := identidad_producto(doc)) is not None
+            ]
+            resumen["identidades_asignadas"] += len(operaciones)
+            if operaciones and not dry_run:
+                collection.bulk_write(operaciones, ordered=False)
+
+        # 2) Colapsar duplicados conservando el último snapshot
+        for grupo in _grupos_duplicados(collection, dry_run):
+            resumen["grupos_duplicados"] += 1
+            snapshots = list(collection.find(
+                {"_id": {"$in": grupo["ids"]}},
+                {"fuente": 1, "link": 1, "product_key": 1, "precio_valor": 1, "moneda": 1,
+                 "fecha_extraccion": 1, "categoria": 1}
+            ).sort("_id", 1))
+
+            mediciones = []
+            if not db[PRICE_HISTORY_COLLECTION].count_documents({"producto.identidad": grupo["_id"]}, limit=1):
+                for snap in snapshots:
+                    registro = medicion(snap, grupo["_id"])
+                    if registro is not None:
+                        if not isinstance(snap.get("fecha_extraccion"), datetime):
+                            registro["fecha"] = snap["_id"].generation_time.replace(tzinfo=None)
+                        mediciones.append(registro)
+
+            obsoletos = [snap["_id"] for snap in snapshots[:-1]]
+            buckets.update(claves_de(snapshots[:-1]))
+            resumen["mediciones_registradas"] += len(mediciones)
+            resumen["eliminados"] += len(obsoletos)
+            if not dry_run:
+                PriceHistoryService.registrar(mediciones)
+                collection.delete_many({"_id": {"$in": obsoletos}})
+
+        if resumen["eliminados"] and not dry_run:
+            if coleccion == "archivos":
+                StoreRollupService.recalcular(buckets)
+            publicar_ingesta(coleccion)
+        return resumen
+
+    @staticmethod
+    def migrar_fechas(coleccion: str, batch_size: int = INGEST_BATCH_SIZE, dry_run: bool = False) -> Dict[str, int]:
+        """
+        Convierte fecha_extraccion de string a Date en documentos existentes.
+        Procesa por lotes en orden de _id; los documentos ya migrados dejan
+        de coincidir con el filtro, por lo que se puede interrumpir y
+        re-ejecutar sin repetir trabajo.
+
+        Returns:
+            Conteos de documentos migrados y no reconocidos
+        """
+        resumen = {"migrados": 0, "no_reconocidos": 0}
+        db = get_db()
+        if db is None:
+            return resumen
+
+        collection = db[coleccion]
+        ultimo_id = None
+        while True:
+            filtro: Dict[str, Any] = {"fecha_extraccion": {"$type": "string"}}
+            if ultimo_id is not None:
+                filtro["_id"] = {"$gt": ultimo_id}
+            lote = list(collection.find(filtro, {"fecha_extraccion": 1}).sort("_id", 1).limit(batch_size))
+            if not lote:
+                break
+            ultimo_id = lote[-1]["_id"]
+
+            operaciones = []
+            for doc in lote:
+                fecha = normalizar_fecha(doc["fecha_extraccion"])
+                if fecha is None:
+                    resumen["no_reconocidos"] += 1
+                    continue
+                operaciones.append(UpdateOne(
+                    {"_id": doc["_id"], "fecha_extraccion": doc["fecha_extraccion"]},
+                    {"$set": {"fecha_extraccion": fecha, "fecha_extraccion_texto": doc["fecha_extraccion"]}},
+                ))
+
+            resumen["migrados"] += len(operaciones)
+            if operaciones and not dry_run:
+                collection.bulk_write(operaciones, ordered=False)
+
+        if resumen["migrados"] and not dry_run:
+            publicar_ingesta(coleccion)
+        return resumen
+
+    @staticmethod
+    def rellenar_derivados(coleccion: str, batch_size: int = INGEST_BATCH_SIZE, recalcular: bool = False) -> int:
+        """
+        Calcula campos_derivados en documentos que no los tienen (o en todos
+        si recalcular=True). Reanudable igual que migrar_fechas.
+
+        Returns:
+            Número de documentos actualizados
+        """
+        db = get_db()
+        if db is None:
+            return 0
+
+        collection = db[coleccion]
+        faltantes = {"$or": [{campo: {"$exists": False}} for campo in CAMPOS_DERIVADOS]}
+        actualizados = 0
+        ultimo_id = None
+        while True:
+            filtro: Dict[str, Any] = {} if recalcular else dict(faltantes)
+            if ultimo_id is not None:
+                filtro["_id"] = {"$gt": ultimo_id}
+            lote = list(collection.find(filtro, CAMPOS_ORIGEN).sort("_id", 1).limit(batch_size))
+            if not lote:
+                break
+            ultimo_id = lote[-1]["_id"]
+
+            collection.bulk_write([
+                UpdateOne({"_id": doc["_id"]}, {"$set": campos_derivados(doc)})
+                for doc in lote
+            ], ordered=False)
+            actualizados += len(lote)
+
+        if actualizados:
+            publicar_ingesta(coleccion)
+        return actualizados
@@ -0,0 +1,204 @@
+"""
+Declaración de índices de MongoDB y verificación de planes de consulta
+"""
+from datetime import datetime
+from typing import List, Dict, Any
+from pymongo import ASCENDING, TEXT
+from .mongo_service import get_db
+from .price_history_service import PRICE_HISTORY_COLLECTION, asegurar_coleccion
+
+
+# Índices declarados por colección. Cada entrada: (keys, opciones de create_index)
+INDEXES: Dict[str, List[tuple]] = {
+    "archivos": [
+        # obtener_por_categoria_ordenado, OffersByCategoryView, best-prices, ranked-offers
+        ([("categoria", ASCENDING), ("precio_valor", ASCENDING)], {"name": "categoria_precio"}),
+        # best-prices con marcas favoritas: un tramo del índice por marca, ya ordenado por precio
+        ([("categoria", ASCENDING), ("marca", ASCENDING), ("precio_valor", ASCENDING)], {
+            "name": "categoria_marca_precio",
+        }),
+        # trending-offers y reportes por ventana de fecha
+        ([("fecha_extraccion", ASCENDING), ("categoria", ASCENDING)], {"name": "fecha_categoria"}),
+        # obtener_marcas filtrado por fuente/categoría
+        ([("fuente", ASCENDING), ("categoria", ASCENDING), ("marca", ASCENDING)], {"name": "fuente_categoria_marca"}),
+        # búsqueda de productos (price-comparison); sin stemming, el texto ya viene normalizado
+        ([("titulo_normalizado", TEXT)], {"name": "titulo_texto", "default_language": "none"}),
+        # mismo producto entre tiendas (price-comparison, trending)
+        ([("product_key", ASCENDING), ("precio_valor", ASCENDING)], {"name": "product_key_precio"}),
+        # ingesta en modo upsert
+        ([("identidad", ASCENDING)], {
+            "name": "identidad_unica",
+            "unique": True,
+            "partialFilterExpression": {"identidad": {"$type": "string"}},
+        }),
+    ],
+    "categoria_stats": [
+        ([("categoria", ASCENDING)], {"name": "categoria_unica", "unique": True}),
+    ],
+    "reporte_tiendas_diario": [
+        # deltas de ingesta y recálculo por bucket; reporte de tiendas sin categoría (ventana por día)
+        ([("dia", ASCENDING), ("fuente", ASCENDING), ("categoria", ASCENDING)], {
+            "name": "dia_fuente_categoria_unica",
+            "unique": True,
+        }),
+        # reporte de tiendas filtrado por categoría
+        ([("categoria", ASCENDING), ("dia", ASCENDING)], {"name": "categoria_dia"}),
+    ],
+    # Serie de tiempo: se crea en asegurar_coleccion antes de sus índices
+    PRICE_HISTORY_COLLECTION: [
+        # historial de un producto en una tienda
+        ([("producto.identidad", ASCENDING), ("fecha", ASCENDING)], {"name": "identidad_fecha"}),
+        # historial del mismo producto entre tiendas
+        ([("producto.product_key", ASCENDING), ("fecha", ASCENDING)], {"name": "product_key_fecha"}),
+    ],
+}
+
+# Consultas representativas de los servicios que deben resolverse con IXSCAN
+QUERY_PLANS: List[Dict[str, Any]] = [
+    {
+        "nombre": "obtener_por_categoria_ordenado",
+        "coleccion": "archivos",
+        "filtro": {"categoria": "Smart TV"},
+        "sort": [("precio_valor", ASCENDING)],
+    },
+    {
+        "nombre": "get_best_prices_by_category_preferencias",
+        "coleccion": "archivos",
+        "filtro": {
+            "categoria": "Smart TV",
+            "marca": {"$in": ["SAMSUNG", "LG"]},
+            "precio_valor": {"$exists": True, "$ne": None, "$gte": 1000000, "$lte": 3000000},
+        },
+        "sort": [("precio_valor", ASCENDING)],
+    },
+    {
+        "nombre": "rank_offers_by_value",
+        "coleccion": "archivos",
+        "filtro": {"categoria": "Smart TV", "precio_valor": {"$exists": True, "$ne": None}},
+    },
+    {
+        "nombre": "generate_store_comparison_report",
+        "coleccion": "reporte_tiendas_diario",
+        "filtro": {"dia": {"$gte": datetime(2025, 1, 1)}},
+    },
+    {
+        "nombre": "generate_store_comparison_report_categoria",
+        "coleccion": "reporte_tiendas_diario",
+        "filtro": {"categoria": "Smart TV", "dia": {"$gte": datetime(2025, 1, 1)}},
+    },
+    {
+        "nombre": "recalcular_acumulados_tienda",
+        "coleccion": "archivos",
+        "filtro": {
+            "fuente": "exito",
+            "categoria": "Smart TV",
+            "fecha_extraccion": {"$gte": datetime(2025, 1, 1), "$lt": datetime(2025, 1, 2)},
+        },
+    },
+    {
+        "nombre": "generate_price_analysis_report",
+        "coleccion": "archivos",
+        "filtro": {
+            "categoria": "Smart TV",
+            "fecha_extraccion": {"$gte": datetime(2025, 1, 1)},
+            "precio_valor": {"$exists": True, "$ne": None},
+        },
+    },
+    {
+        "nombre": "obtener_marcas",
+        "coleccion": "archivos",
+        "filtro": {"fuente": "exito", "categoria": "Smart TV", "marca": {"$type": "string", "$ne": ""}},
+    },
+    {
+        "nombre": "get_price_comparison",
+        "coleccion": "archivos",
+        "filtro": {"$text": {"$search": '"smart" "tv"'}},
+    },
+    {
+        "nombre": "comparacion_por_product_key",
+        "coleccion": "archivos",
+        "filtro": {"product_key": {"$in": ["samsung:un55au7000"]}, "precio_valor": {"$exists": True, "$ne": None}},
+    },
+    {
+        "nombre": "historial_precios_producto",
+        "coleccion": PRICE_HISTORY_COLLECTION,
+        "filtro": {"producto.identidad": "exito|https://www.exito.com/p", "fecha": {"$gte": datetime(2025, 1, 1)}},
+    },
+    {
+        "nombre": "upsert_por_identidad",
+        "coleccion": "archivos",
+        "filtro": {"identidad": {"$in": ["exito|https://www.exito.com/p"]}},
+    },
+]
+
+
+def asegurar_indices() -> List[Dict[str, Any]]:
+    """
+    Crea los índices declarados que falten. Un índice se considera
+    existente si hay uno con las mismas keys, aunque tenga otro nombre.
+
+    Returns:
+        Lista de {coleccion, nombre, keys, estado} con estado "existente" o "creado"
+    """
+    db = get_db()
+    if db is None:
+        return []
+
+    asegurar_coleccion(db)
+    resultados = []
+    for coleccion, indices in INDEXES.items():
+        collection = db[coleccion]
+        existentes = {
+            tuple((campo, int(direccion) if isinstance(direccion, (int, float)) else direccion)
+                  for campo, direccion in info["key"]): nombre
+            for nombre, info in collection.index_information().items()
+        }
+        for keys, opciones in indices:
+            # Los índices de texto se reportan con keys internas (_fts, _ftsx)
+            clave = (("_fts", "text"), ("_ftsx", 1)) if any(d == TEXT for _, d in keys) else tuple(keys)
+            nombre_existente = existentes.get(clave)
+            if nombre_existente:
+                estado, nombre = "existente", nombre_existente
+            else:
+                nombre = collection.create_index(keys, **opciones)
+                estado = "creado"
+            resultados.append({"coleccion": coleccion, "nombre": nombre, "keys": keys, "estado": estado})
+    return resultados
+
+
+def _etapas_del_plan(plan: Any) -> List[str]:
+    """Recorre un plan de explain() y retorna todas las etapas encontradas"""
+    etapas = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            etapas.append(plan["stage"])
+        for valor in plan.values():
+            etapas.extend(_etapas_del_plan(valor))
+    elif isinstance(plan, list):
+        for valor in plan:
+            etapas.extend(_etapas_del_plan(valor))
+    return etapas
+
+
+def verificar_planes() -> List[Dict[str, Any]]:
+    """
+    Ejecuta explain() sobre QUERY_PLANS y reporta si el plan ganador
+    usa un índice (IXSCAN) o recorre la colección (COLLSCAN).
+    """
+    db = get_db()
+    if db is None:
+        return []
+
+    resultados = []
+    for consulta in QUERY_PLANS:
+        cursor = db[consulta["coleccion"]].find(consulta["filtro"])
+        if consulta.get("sort"):
+            cursor = cursor.sort(consulta["sort"])
+        explain = cursor.limit(1).explain()
+        etapas = _etapas_del_plan(explain.get("queryPlanner", {}).get("winningPlan", {}))
+        resultados.append({
+            "nombre": consulta["nombre"],
+            "etapas": etapas,
+            "usa_indice": "IXSCAN" in etapas and "COLLSCAN" not in etapas,
+        })
+    return resultados
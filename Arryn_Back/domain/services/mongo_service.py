@@ -1,90 +1,303 @@
 import os
 import ssl
-from django.conf import settings
+import threading
+import time
+import pymongo
 from pymongo import MongoClient, ASCENDING
+from pymongo.monitoring import ConnectionPoolListener
 from bson import ObjectId  # para manejar los IDs de Mongo
+from .events import publicar_ingesta
+from .query_runner import ejecutar_agregacion, ejecutar_busqueda
 
-try:
-    # Configuration from environment variables
-    MONGO_HOST = os.getenv("MONGO_HOST", "localhost")
-    mongo_port_str = os.getenv("MONGO_PORT", "27017").strip()
-    MONGO_PORT = int(mongo_port_str if mongo_port_str else "27017")
-    MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "arryn_products_db")
-    MONGO_TIMEOUT = int(os.getenv("MONGO_CONNECTION_TIMEOUT", 5000))
-    MONGO_USER = os.getenv("MONGO_USER")
-    MONGO_PASSWORD = os.getenv("MONGO_PASSWORD")
-    MONGO_AUTH_DB = os.getenv("MONGO_AUTH_DB", MONGO_DB_NAME)
-    
-    # Use MongoDB Atlas URL if MONGO_HOST is empty, otherwise use local config
-    mongodb_url = os.getenv("MONGODB_URL")
-    
+# Configuration from environment variables
+MONGO_HOST = os.getenv("MONGO_HOST", "localhost")
+mongo_port_str = os.getenv("MONGO_PORT", "27017").strip()
+MONGO_PORT = int(mongo_port_str if mongo_port_str else "27017")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "arryn_products_db")
+MONGO_TIMEOUT = int(os.getenv("MONGO_CONNECTION_TIMEOUT", 5000))
+MONGO_USER = os.getenv("MONGO_USER")
+MONGO_PASSWORD = os.getenv("MONGO_PASSWORD")
+MONGO_AUTH_DB = os.getenv("MONGO_AUTH_DB", MONGO_DB_NAME)
+
+# Use MongoDB Atlas URL if MONGO_HOST is empty, otherwise use local config
+mongodb_url = os.getenv("MONGODB_URL")
+
+# Pool de conexiones (por proceso). Con workers gevent cada greenlet que
+# consulta Mongo toma una conexión del pool; con maxPoolSize=1 todas las
+# requests del worker se serializaban sobre un único socket.
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 50))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 60000))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000))
+# Segundos entre reintentos de conexión mientras MongoDB no responde
+MONGO_RECHECK_INTERVAL = float(os.getenv("MONGO_RECHECK_INTERVAL", 30))
+# Timeout del ping del readiness check (segundos)
+MONGO_READINESS_TIMEOUT = float(os.getenv("MONGO_READINESS_TIMEOUT", 2))
+
+
+class EstadisticasPool(ConnectionPoolListener):
+    """Contadores del pool de conexiones del proceso (ver estadisticas_pool)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self._lock:
+            self.creadas = 0
+            self.cerradas = 0
+            self.checkouts = 0
+            self.checkins = 0
+            self.solicitudes = 0
+            self.fallos = {}
+            self.pool_cleared = 0
+            self.max_en_uso = 0
+            self.espera_total = 0.0
+            self.espera_max = 0.0
+
+    def _sumar(self, campo):
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._sumar("pool_cleared")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._sumar("creadas")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._sumar("cerradas")
+
+    def connection_check_out_started(self, event):
+        self._sumar("solicitudes")
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            razon = str(event.reason)
+            self.fallos[razon] = self.fallos.get(razon, 0) + 1
+
+    def connection_checked_out(self, event):
+        # duration (segundos esperando la conexión) existe desde pymongo 4.7
+        espera = getattr(event, "duration", None) or 0.0
+        with self._lock:
+            self.checkouts += 1
+            self.max_en_uso = max(self.max_en_uso, self.checkouts - self.checkins)
+            self.espera_total += espera
+            self.espera_max = max(self.espera_max, espera)
+
+    def connection_checked_in(self, event):
+        self._sumar("checkins")
+
+    def resumen(self):
+        with self._lock:
+            fallidas = sum(self.fallos.values())
+            return {
+                "abiertas": self.creadas - self.cerradas,
+                "en_uso": self.checkouts - self.checkins,
+                "max_en_uso": self.max_en_uso,
+                "esperando": max(0, self.solicitudes - self.checkouts - fallidas),
+                "creadas": self.creadas,
+                "cerradas": self.cerradas,
+                "checkouts": self.checkouts,
+                "checkouts_fallidos": dict(self.fallos),
+                "pool_cleared": self.pool_cleared,
+                "espera_promedio_ms": round(self.espera_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "espera_max_ms": round(self.espera_max * 1000, 3),
+            }
+
+
+pool_stats = EstadisticasPool()
+
+
+def configuracion_mongo():
+    """
+    URI y opciones del cliente según las variables de entorno (MongoDB Atlas
+    si MONGO_HOST está vacío). La comparten el cliente síncrono y el asíncrono.
+    """
+    opciones = {
+        "serverSelectionTimeoutMS": MONGO_TIMEOUT,
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    }
     if not MONGO_HOST or MONGO_HOST.strip() == "":
         # Using MongoDB Atlas
-        if mongodb_url:
-            # Simplified SSL configuration for Docker + MongoDB Atlas
-            client = MongoClient(
-                mongodb_url,
-                serverSelectionTimeoutMS=MONGO_TIMEOUT,
-                ssl=True,
-                ssl_cert_reqs=ssl.CERT_NONE,  # Disable certificate validation
-                retryWrites=True,
-                maxPoolSize=1  # Reduce connection pool for Docker
-            )
-            print(f"✅ MongoDB Atlas conectado: {mongodb_url[:50]}...")
-        else:
+        if not mongodb_url:
             raise Exception("Neither MONGO_HOST nor MONGODB_URL configured")
+        # Simplified SSL configuration for Docker + MongoDB Atlas
+        return mongodb_url, {
+            **opciones,
+            "ssl": True,
+            "ssl_cert_reqs": ssl.CERT_NONE,  # Disable certificate validation
+            "retryWrites": True,
+        }
+
+    # Using local MongoDB
+    if MONGO_USER and MONGO_PASSWORD:
+        mongo_uri = f"mongodb://{MONGO_USER}:{MONGO_PASSWORD}@{MONGO_HOST}:{MONGO_PORT}/{MONGO_AUTH_DB}"
     else:
-        # Using local MongoDB
-        if MONGO_USER and MONGO_PASSWORD:
-            mongo_uri = f"mongodb://{MONGO_USER}:{MONGO_PASSWORD}@{MONGO_HOST}:{MONGO_PORT}/{MONGO_AUTH_DB}"
-        else:
-            mongo_uri = f"mongodb://{MONGO_HOST}:{MONGO_PORT}/"
-        client = MongoClient(mongo_uri, serverSelectionTimeoutMS=MONGO_TIMEOUT)
-        print(f"✅ MongoDB conectado: {MONGO_HOST}:{MONGO_PORT}/{MONGO_DB_NAME}")
-
-    # Test de conexión
-    client.admin.command('ping')
-    db = client[MONGO_DB_NAME]
-    MONGO_AVAILABLE = True
-except Exception as e:
-    print(f"⚠️  MongoDB no disponible: {e}")
-    db = None
-    MONGO_AVAILABLE = False
+        mongo_uri = f"mongodb://{MONGO_HOST}:{MONGO_PORT}/"
+    return mongo_uri, opciones
+
+
+# Cliente del proceso: se crea en el primer uso y no al importar, así
+# gunicorn puede hacer fork (preload) sin heredar sockets abiertos y el
+# arranque no se bloquea esperando a MongoDB. Si el PID cambió (proceso
+# hijo de un fork) se descarta el cliente heredado y se crea uno nuevo.
+_client = None
+_client_pid = None
+_disponible = False
+_ultimo_intento = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """MongoClient del proceso (creado de forma diferida; None si no hay configuración)"""
+    global _client, _client_pid, _disponible, _ultimo_intento
+    if _client is not None and _client_pid == os.getpid():
+        return _client
+
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client, _client_pid = None, os.getpid()
+            _disponible, _ultimo_intento = False, None
+            pool_stats.reiniciar()
+            try:
+                mongo_uri, mongo_options = configuracion_mongo()
+                _client = MongoClient(mongo_uri, event_listeners=[pool_stats], **mongo_options)
+            except Exception as e:
+                print(f"⚠️  MongoDB no configurado: {e}")
+    return _client
+
+
+def get_db():
+    """
+    Base de datos de la aplicación, o None si MongoDB no está disponible.
+    El primer uso hace un ping; si falla se reintenta recién pasados
+    MONGO_RECHECK_INTERVAL segundos y mientras tanto se retorna None sin
+    esperar al timeout de selección de servidor en cada request.
+    """
+    global _disponible, _ultimo_intento
+    client = get_client()
+    if client is None:
+        return None
+    if _disponible:
+        return client[MONGO_DB_NAME]
+
+    with _client_lock:
+        if not _disponible:
+            ahora = time.monotonic()
+            if _ultimo_intento is not None and ahora - _ultimo_intento < MONGO_RECHECK_INTERVAL:
+                return None
+            _ultimo_intento = ahora
+            try:
+                client.admin.command('ping')
+                _disponible = True
+                if MONGO_HOST and MONGO_HOST.strip():
+                    print(f"✅ MongoDB conectado: {MONGO_HOST}:{MONGO_PORT}/{MONGO_DB_NAME}")
+                else:
+                    print(f"✅ MongoDB Atlas conectado: {mongodb_url[:50]}...")
+            except Exception as e:
+                print(f"⚠️  MongoDB no disponible: {e}")
+                return None
+    return client[MONGO_DB_NAME]
+
+
+def verificar_mongo(timeout: float = MONGO_READINESS_TIMEOUT):
+    """
+    Ping explícito a MongoDB para el readiness check. No usa el estado
+    cacheado de get_db(); si el servidor responde lo marca como disponible.
+    """
+    global _disponible
+    client = get_client()
+    if client is None:
+        return {"disponible": False, "error": "MongoDB no configurado"}
+
+    inicio = time.perf_counter()
+    try:
+        with pymongo.timeout(timeout):
+            client.admin.command('ping')
+    except Exception as e:
+        return {"disponible": False, "error": f"{type(e).__name__}: {str(e)[:200]}"}
+    _disponible = True
+    return {"disponible": True, "latencia_ms": round((time.perf_counter() - inicio) * 1000, 1)}
+
+
+def estadisticas_pool():
+    """Configuración y uso actual del pool de conexiones de este proceso"""
+    return {
+        "pid": os.getpid(),
+        "cliente_creado": _client is not None and _client_pid == os.getpid(),
+        "disponible": _disponible,
+        "configuracion": {
+            "max_pool_size": MONGO_MAX_POOL_SIZE,
+            "min_pool_size": MONGO_MIN_POOL_SIZE,
+            "max_idle_time_ms": MONGO_MAX_IDLE_TIME_MS,
+            "wait_queue_timeout_ms": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        },
+        "conexiones": pool_stats.resumen(),
+    }
+
+# Campos de producto que retornan los listados por categoría
+CAMPOS_LISTADO = {"_id": 1, "titulo": 1, "marca": 1, "precio_texto": 1, "precio_valor": 1, "moneda": 1,
+                  "categoria": 1, "imagen": 1, "link": 1, "fuente": 1, "fecha_extraccion": 1}
 
 def obtener_por_categoria_ordenado(coleccion, categoria, limit=20):
-    if not MONGO_AVAILABLE or db is None:
+    db = get_db()
+    if db is None:
         return []
         
     collection = db[coleccion]
     cursor = (collection
-              .find({"categoria": categoria}, {"_id": 1, "titulo": 1, "marca": 1, "precio_texto": 1,
-                                               "precio_valor": 1, "moneda": 1, "categoria": 1,
-                                               "imagen": 1, "link": 1, "fuente": 1, "fecha_extraccion": 1})
+              .find({"categoria": categoria}, CAMPOS_LISTADO)
               .sort("precio_valor", ASCENDING)
               .limit(int(limit)))
-    docs = list(cursor)
+    docs = ejecutar_busqueda(cursor, "offers_by_category")
     for d in docs:
         d["_id"] = str(d["_id"])
     return docs
 
 def guardar_json(coleccion, data):
-    if not MONGO_AVAILABLE or db is None:
+    db = get_db()
+    if db is None:
         return ["mock_id_1", "mock_id_2"] if isinstance(data, list) else "mock_id_1"
         
     collection = db[coleccion]
+    docs = data if isinstance(data, list) else [data]
 
     # Si es lista de JSONs
     if isinstance(data, list):
         result = collection.insert_many(data)
-        return [str(_id) for _id in result.inserted_ids]
-
+        ids = [str(_id) for _id in result.inserted_ids]
     # Si es un solo JSON
-    result = collection.insert_one(data)
-    return str(result.inserted_id)
+    else:
+        result = collection.insert_one(data)
+        ids = str(result.inserted_id)
+
+    publicar_ingesta(
+        coleccion,
+        categorias={doc.get("categoria") for doc in docs},
+        fuentes={doc.get("fuente") for doc in docs},
+    )
+    return ids
 
 
 def obtener_json(coleccion):
-    if not MONGO_AVAILABLE or db is None:
+    db = get_db()
+    if db is None:
         return []
         
     collection = db[coleccion]
@@ -96,8 +309,55 @@ def obtener_json(coleccion):
     return docs
 
 
+def obtener_json_paginado(coleccion, after=None, limit=100, projection=None):
+    """
+    Página de documentos ordenada por _id (keyset pagination).
+    Retorna (docs, next_after); next_after es None cuando no hay más páginas.
+    """
+    db = get_db()
+    if db is None:
+        return [], None
+
+    collection = db[coleccion]
+    filtro = {}
+    if after:
+        filtro["_id"] = {"$gt": ObjectId(after)}
+
+    cursor = (collection
+              .find(filtro, projection)
+              .sort("_id", ASCENDING)
+              .limit(int(limit)))
+    docs = list(cursor)
+    for d in docs:
+        d["_id"] = str(d["_id"])
+
+    next_after = docs[-1]["_id"] if len(docs) == int(limit) else None
+    return docs, next_after
+
+
+def iterar_json(coleccion, filtro=None, projection=None, batch_size=500):
+    """
+    Itera la colección sin materializarla: el cursor trae lotes de batch_size
+    documentos y cada documento se entrega con su _id convertido a string.
+    """
+    db = get_db()
+    if db is None:
+        return
+
+    collection = db[coleccion]
+    cursor = collection.find(filtro or {}, projection, batch_size=int(batch_size))
+    try:
+        for doc in cursor:
+            if "_id" in doc:
+                doc["_id"] = str(doc["_id"])
+            yield doc
+    finally:
+        cursor.close()
+
+
 def obtener_por_id(coleccion, id):
-    if not MONGO_AVAILABLE or db is None:
+    db = get_db()
+    if db is None:
         return None
         
     collection = db[coleccion]
@@ -121,7 +381,8 @@ def obtener_marcas(
     Normaliza marcas a MAYÚSCULAS + trim para evitar duplicados ("Nike", " NIKE ").
     Soporta filtros opcionales por fuente y categoría.
     """
-    if not MONGO_AVAILABLE or db is None:
+    db = get_db()
+    if db is None:
         # Datos de ejemplo cuando MongoDB no está disponible
         sample_brands = ["NIKE", "ADIDAS", "PUMA", "REEBOK"]
         if with_counts:
@@ -129,8 +390,12 @@ def obtener_marcas(
             return sample_brands, sample_counts
         return sample_brands, {}
     
-    col = db[coleccion]
+    data = ejecutar_agregacion(db[coleccion], pipeline_marcas(with_counts, fuente, categoria), "marcas")
+    return resultado_marcas(data, with_counts)
 
+
+def pipeline_marcas(with_counts: bool, fuente: str | None, categoria: str | None) -> list:
+    """Pipeline de obtener_marcas (compartido con la versión asíncrona)"""
     match: dict = {"marca": {"$type": "string", "$ne": ""}}
     if fuente:
         match["fuente"] = fuente
@@ -138,7 +403,7 @@ def obtener_marcas(
         match["categoria"] = categoria
 
     if with_counts:
-        pipeline = [
+        return [
             {"$match": match},
             {"$group": {
                 "_id": {"$trim": {"input": {"$toUpper": "$marca"}}},
@@ -147,22 +412,24 @@ def obtener_marcas(
             {"$match": {"_id": {"$ne": None, "$ne": ""}}},
             {"$sort": {"_id": 1}}
         ]
-        data = list(col.aggregate(pipeline))
-        brands = [d["_id"] for d in data]
-        counts = {d["_id"]: d["count"] for d in data}
-        return brands, counts
 
     # Solo distintas sin conteo
-    pipeline = [
+    return [
         {"$match": match},
         {"$group": {"_id": {"$trim": {"input": {"$toUpper": "$marca"}}}}},
         {"$match": {"_id": {"$ne": None, "$ne": ""}}},
         {"$sort": {"_id": 1}},
         {"$project": {"_id": 0, "marca": "$_id"}}
     ]
-    data = list(col.aggregate(pipeline))
-    brands = [d["marca"] for d in data]
-    return brands, {}
+
+
+def resultado_marcas(data: list, with_counts: bool):
+    """(brands, counts) a partir del resultado de pipeline_marcas"""
+    if with_counts:
+        brands = [d["_id"] for d in data]
+        counts = {d["_id"]: d["count"] for d in data}
+        return brands, counts
+    return [d["marca"] for d in data], {}
 
 
 def obtener_categorias(
@@ -172,7 +439,8 @@ def obtener_categorias(
     Retorna lista de categorías distintas ordenadas alfabéticamente.
     Normaliza valores repetidos por diferencias de mayúsculas/minúsculas.
     """
-    if not MONGO_AVAILABLE or db is None:
+    db = get_db()
+    if db is None:
         return [
             "Smart TV",
             "Celulares",
@@ -210,5 +478,5 @@ def obtener_categorias(
         {"$sort": {"categoria": 1}},
         {"$project": {"_id": 0, "categoria": "$categoria"}},
     ]
-    data = list(col.aggregate(pipeline))
+    data = ejecutar_agregacion(col, pipeline, "categorias")
     return [d["categoria"] for d in data]
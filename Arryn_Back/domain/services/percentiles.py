@@ -0,0 +1,106 @@
+"""
+Servicio de percentiles exactos sobre recorridos de precios ordenados
+"""
+import math
+from typing import Any, Dict, Iterable
+
+
+class RecorridoOrdenado:
+    """
+    Percentiles exactos (interpolación lineal, mismo criterio que
+    numpy.percentile por defecto) y conteos de valores <= cada corte, en una
+    sola pasada sobre valores ya ordenados (un cursor con sort por el campo
+    indexado) y sin materializar la lista.
+
+    Solo se guardan los valores de las posiciones que intervienen en la
+    interpolación. Los cortes son percentiles cuyo umbral se usa para contar;
+    como los valores vienen ordenados, el conteo de un corte queda resuelto
+    en el primer valor que lo supera, así que el recorrido termina ahí.
+
+    Uso: llamar agregar(valor) mientras retorne True y luego resultado().
+    """
+
+    def __init__(self, total: int, percentiles: Iterable[float], cortes: Iterable[float] = ()):
+        self.total = total
+        self.cortes = tuple(cortes)
+        self._posiciones = {}
+        for p in set(percentiles) | set(self.cortes):
+            k = (total - 1) * p / 100
+            self._posiciones[p] = (k, math.floor(k), math.ceil(k))
+        self._percentiles = tuple(percentiles)
+        self._necesarias = {f for _, f, _ in self._posiciones.values()} | {c for _, _, c in self._posiciones.values()}
+        self._ultima_necesaria = max(self._necesarias, default=-1)
+        self._encontrados: Dict[int, Any] = {}
+        self._umbrales: Dict[float, float] = {}
+        self._conteos: Dict[float, int] = {}
+        self._indice = 0
+        self._ultimo = None
+
+    def agregar(self, valor) -> bool:
+        """Procesa el siguiente valor; retorna False cuando ya no hace falta seguir"""
+        indice = self._indice
+        self._indice += 1
+        self._ultimo = valor
+        if indice in self._necesarias:
+            self._encontrados[indice] = valor
+            for p in self.cortes:
+                if p not in self._umbrales and self._posiciones[p][2] == indice:
+                    self._umbrales[p] = self._interpolar(p)
+
+        # Los valores hasta la posición del umbral son <= umbral por estar ordenados
+        for p, umbral in self._umbrales.items():
+            if p not in self._conteos and indice > self._posiciones[p][1] and valor > umbral:
+                self._conteos[p] = indice
+
+        if indice < self._ultima_necesaria:
+            return True
+        return len(self._conteos) < len(self.cortes)
+
+    def resultado(self) -> Dict[str, Dict[float, Any]]:
+        """{"percentiles": {p: valor}, "hasta_corte": {p: cantidad de valores <= percentil p}}"""
+        if self.total <= 0 or self._indice == 0:
+            return {
+                "percentiles": {p: 0 for p in self._percentiles},
+                "hasta_corte": {p: 0 for p in self.cortes},
+            }
+        return {
+            "percentiles": {p: self._interpolar(p) for p in self._percentiles},
+            "hasta_corte": {p: self._conteos.get(p, self._indice) for p in self.cortes},
+        }
+
+    def _interpolar(self, p: float):
+        k, f, c = self._posiciones[p]
+        # Si el cursor trae menos valores que `total` (ingesta concurrente), se usa el último visto
+        inferior = self._encontrados.get(f, self._ultimo)
+        if f == c:
+            return inferior
+        return inferior * (c - k) + self._encontrados.get(c, self._ultimo) * (k - f)
+
+
+def recorrer_ordenado(valores: Iterable[Any], total: int, percentiles: Iterable[float],
+                      cortes: Iterable[float] = ()) -> Dict[str, Dict[float, Any]]:
+    """Percentiles y conteos por corte de `valores` (ordenados ascendentemente); ver RecorridoOrdenado"""
+    recorrido = RecorridoOrdenado(total, percentiles, cortes)
+    for valor in valores:
+        if not recorrido.agregar(valor):
+            break
+    return recorrido.resultado()
+
+
+async def recorrer_ordenado_async(valores, total: int, percentiles: Iterable[float],
+                                  cortes: Iterable[float] = ()) -> Dict[str, Dict[float, Any]]:
+    """Versión de recorrer_ordenado para cursores asíncronos (async for)"""
+    recorrido = RecorridoOrdenado(total, percentiles, cortes)
+    async for valor in valores:
+        if not recorrido.agregar(valor):
+            break
+    return recorrido.resultado()
+
+
+def percentiles_ordenados(valores: Iterable[float], total: int, percentiles: Iterable[float]) -> Dict[float, float]:
+    """
+    Percentiles con interpolación lineal sobre valores ya ordenados, en una
+    sola pasada y sin materializar la lista.
+    """
+    return recorrer_ordenado(valores, total, percentiles)["percentiles"]
+
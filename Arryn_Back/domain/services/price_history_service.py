@@ -0,0 +1,205 @@
+"""
+Servicio de historial de precios por producto en una colección de series de tiempo de MongoDB
+"""
+import os
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Iterable, Optional
+from pymongo.errors import CollectionInvalid
+from .mongo_service import get_db
+from .circuit_breaker import consultar_protegido
+from .query_runner import ejecutar_agregacion, ejecutar_busqueda
+
+
+PRICE_HISTORY_COLLECTION = "precios_ts"
+PRICE_HISTORY_ON_INGEST = os.getenv("PRICE_HISTORY_ON_INGEST", "True").lower() in ("true", "1", "yes")
+# Días que se conservan las mediciones (0: sin vencimiento)
+PRICE_HISTORY_RETENTION_DAYS = int(os.getenv("PRICE_HISTORY_RETENTION_DAYS", 0))
+MAX_DIAS_HISTORIAL = 365
+RESOLUCIONES = ("punto", "dia", "cambios")
+
+# Una medición por observación de precio. MongoDB agrupa internamente las
+# mediciones con el mismo `producto` en buckets comprimidos por rango de
+# tiempo: el historial de un producto lee unos pocos buckets en lugar de
+# snapshots completos de archivos.
+OPCIONES_SERIE = {
+    "timeseries": {"timeField": "fecha", "metaField": "producto", "granularity": "hours"},
+}
+
+_coleccion_creada = False
+
+
+def asegurar_coleccion(db) -> bool:
+    """
+    Crea la colección de series de tiempo si no existe. Debe existir antes
+    del primer insert o de crear índices: un insert sobre una colección
+    inexistente la crea como colección común.
+
+    Returns:
+        True si se creó en esta llamada
+    """
+    global _coleccion_creada
+    if _coleccion_creada:
+        return False
+    if db.list_collection_names(filter={"name": PRICE_HISTORY_COLLECTION}):
+        _coleccion_creada = True
+        return False
+
+    opciones = dict(OPCIONES_SERIE)
+    if PRICE_HISTORY_RETENTION_DAYS > 0:
+        opciones["expireAfterSeconds"] = PRICE_HISTORY_RETENTION_DAYS * 86400
+    try:
+        db.create_collection(PRICE_HISTORY_COLLECTION, **opciones)
+    except CollectionInvalid:
+        # Otro proceso la creó primero
+        pass
+    _coleccion_creada = True
+    return True
+
+
+def medicion(doc: Dict[str, Any], identidad: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Medición de series de tiempo para un producto ingestado, o None si no tiene identidad o precio"""
+    precio = doc.get("precio_valor")
+    if identidad is None or isinstance(precio, bool) or not isinstance(precio, (int, float)):
+        return None
+    fecha = doc.get("fecha_extraccion")
+    return {
+        "fecha": fecha if isinstance(fecha, datetime) else datetime.now(),
+        "producto": {
+            "identidad": identidad,
+            "fuente": doc.get("fuente"),
+            "product_key": doc.get("product_key"),
+        },
+        "precio_valor": precio,
+        "moneda": doc.get("moneda"),
+    }
+
+
+def _filtro(identidad: Optional[str], product_key: Optional[str], dias: int) -> Dict[str, Any]:
+    filtro: Dict[str, Any] = {"fecha": {"$gte": datetime.now() - timedelta(days=dias)}}
+    if identidad:
+        filtro["producto.identidad"] = identidad
+    else:
+        filtro["producto.product_key"] = product_key
+    return filtro
+
+
+def _pipeline_diario(filtro: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Un punto por producto y día: primer, último, mínimo, máximo y promedio del precio"""
+    return [
+        {"$match": filtro},
+        {"$sort": {"fecha": 1}},
+        {
+            "$group": {
+                "_id": {
+                    "identidad": "$producto.identidad",
+                    "dia": {"$dateTrunc": {"date": "$fecha", "unit": "day"}},
+                },
+                "producto": {"$first": "$producto"},
+                "apertura": {"$first": "$precio_valor"},
+                "cierre": {"$last": "$precio_valor"},
+                "precio_min": {"$min": "$precio_valor"},
+                "precio_max": {"$max": "$precio_valor"},
+                "precio_promedio": {"$avg": "$precio_valor"},
+                "mediciones": {"$sum": 1},
+                "moneda": {"$last": "$moneda"},
+            }
+        },
+        {"$sort": {"_id.dia": 1}},
+    ]
+
+
+def _series(puntos: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Agrupa los puntos (ya ordenados por fecha) en una serie por producto"""
+    series: Dict[str, Dict[str, Any]] = {}
+    for punto in puntos:
+        producto = punto.pop("producto")
+        serie = series.setdefault(producto["identidad"], {**producto, "puntos": []})
+        serie["puntos"].append(punto)
+    return sorted(series.values(), key=lambda s: (str(s.get("fuente")), s["identidad"]))
+
+
+def _solo_cambios(series: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Deja en cada serie solo las mediciones cuyo precio difiere de la anterior"""
+    for serie in series:
+        cambios, precio_anterior = [], None
+        for indice, punto in enumerate(serie["puntos"]):
+            if indice == 0 or punto.get("precio_valor") != precio_anterior:
+                cambios.append({**punto, "precio_anterior": precio_anterior})
+            precio_anterior = punto.get("precio_valor")
+        serie["puntos"] = cambios
+    return series
+
+
+class PriceHistoryService:
+    """Servicio para registrar y consultar el historial de precios (colección precios_ts)"""
+
+    @staticmethod
+    def registrar(mediciones: Iterable[Optional[Dict[str, Any]]]) -> int:
+        """
+        Inserta mediciones (ver medicion); las None se ignoran.
+
+        Returns:
+            Número de mediciones insertadas
+        """
+        mediciones = [m for m in mediciones if m is not None]
+        db = get_db()
+        if db is None or not mediciones:
+            return 0
+
+        asegurar_coleccion(db)
+        db[PRICE_HISTORY_COLLECTION].insert_many(mediciones, ordered=False)
+        return len(mediciones)
+
+    @staticmethod
+    def historial(
+        identidad: Optional[str] = None,
+        product_key: Optional[str] = None,
+        dias: int = 30,
+        resolucion: str = "punto"
+    ) -> Dict[str, Any]:
+        """
+        Historial de precios de un producto (por identidad: una tienda) o de
+        un product_key (el mismo producto en todas las tiendas).
+
+        Args:
+            identidad: 'fuente|link' del producto
+            product_key: Clave de emparejamiento entre tiendas
+            dias: Ventana hacia atrás (máximo MAX_DIAS_HISTORIAL)
+            resolucion: "punto" (cada medición), "dia" (resumen diario) o
+                "cambios" (registro de cambios de precio: solo las mediciones
+                cuyo precio difiere de la anterior, con precio_anterior)
+
+        Returns:
+            Series por producto con sus puntos ordenados por fecha
+        """
+        if not identidad and not product_key:
+            raise ValueError("Se requiere identidad o product_key")
+        if resolucion not in RESOLUCIONES:
+            raise ValueError(f"Resolución inválida: {resolucion}")
+        dias = max(1, min(dias, MAX_DIAS_HISTORIAL))
+        filtro = _filtro(identidad, product_key, dias)
+
+        def consulta(db):
+            collection = db[PRICE_HISTORY_COLLECTION]
+            if resolucion == "dia":
+                puntos = ejecutar_agregacion(collection, _pipeline_diario(filtro), "price_history")
+                for punto in puntos:
+                    punto["fecha"] = punto.pop("_id")["dia"]
+            else:
+                cursor = collection.find(filtro, {"_id": 0}).sort("fecha", 1)
+                puntos = ejecutar_busqueda(cursor, "price_history")
+            series = _series(puntos)
+            return {
+                "identidad": identidad,
+                "product_key": product_key,
+                "dias": dias,
+                "resolucion": resolucion,
+                "series": _solo_cambios(series) if resolucion == "cambios" else series,
+            }
+
+        return consultar_protegido(
+            ("price_history", identidad, product_key, dias, resolucion),
+            consulta,
+            lambda: {"identidad": identidad, "product_key": product_key, "dias": dias,
+                     "resolucion": resolucion, "series": []},
+        )
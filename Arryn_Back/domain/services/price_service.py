@@ -2,10 +2,16 @@
 Servicio para manejo de precios y personalización de ofertas
 """
 from typing import List, Dict, Any, Optional
-from .mongo_service import db, MONGO_AVAILABLE
+from .circuit_breaker import consultar_protegido
+from .query_runner import ejecutar_agregacion, ejecutar_busqueda
+from .search_service import ProductSearchService, consulta_texto, MAX_RESULTADOS
 from bson import ObjectId
 
 
+MAX_CANDIDATOS_BUSQUEDA = 50
+MAX_PRODUCT_KEYS = 5
+
+
 class PricePersonalizationService:
     """Servicio para personalización de precios y ofertas"""
     
@@ -26,10 +32,7 @@ class PricePersonalizationService:
         Returns:
             Lista de productos con mejores precios
         """
-        if not MONGO_AVAILABLE or db is None:
-            return _get_mock_best_prices(categoria, limit)
-        
-        try:
+        def consulta(db):
             collection = db["archivos"]
             
             # Filtro base por categoría
@@ -73,43 +76,66 @@ class PricePersonalizationService:
                 }
             ]
             
-            results = list(collection.aggregate(pipeline))
+            results = ejecutar_agregacion(collection, pipeline, "best_prices")
             
             # Convertir ObjectId a string
             for result in results:
                 result["_id"] = str(result["_id"])
                 
             return results
-            
-        except Exception as e:
-            print(f"Error en get_best_prices_by_category: {e}")
-            return _get_mock_best_prices(categoria, limit)
+
+        return consultar_protegido(
+            ("best_prices", categoria, sorted((user_preferences or {}).items()), limit),
+            consulta,
+            lambda: _get_mock_best_prices(categoria, limit),
+        )
     
     @staticmethod
-    def get_price_comparison(product_title: str) -> Dict[str, Any]:
+    def get_price_comparison(product_title: Optional[str] = None, product_key: Optional[str] = None) -> Dict[str, Any]:
         """
         Compara precios del mismo producto en diferentes tiendas
         
         Args:
             product_title: Título del producto a comparar
+            product_key: Clave canónica del producto (si se conoce, evita la búsqueda)
             
         Returns:
             Comparación de precios entre tiendas
         """
-        if not MONGO_AVAILABLE or db is None:
-            return _get_mock_price_comparison(product_title)
-        
-        try:
+        def consulta(db):
             collection = db["archivos"]
             
-            # Búsqueda por similitud de título (usando regex)
-            pipeline = [
-                {
-                    "$match": {
-                        "titulo": {"$regex": product_title, "$options": "i"},
-                        "precio_valor": {"$exists": True, "$ne": None}
+            if product_key:
+                claves = [product_key]
+            elif consulta_texto(product_title):
+                claves = PricePersonalizationService._product_keys_candidatas(collection, product_title)
+            else:
+                return {"error": "No se encontraron productos similares"}
+
+            if claves:
+                # Mismo producto entre tiendas: igualdad indexada por product_key
+                etapas_busqueda = [
+                    {
+                        "$match": {
+                            "product_key": {"$in": claves},
+                            "precio_valor": {"$exists": True, "$ne": None}
+                        }
                     }
-                },
+                ]
+            else:
+                # Documentos sin product_key aún: búsqueda de texto por relevancia
+                etapas_busqueda = [
+                    {
+                        "$match": {
+                            **ProductSearchService.match_busqueda(product_title),
+                            "precio_valor": {"$exists": True, "$ne": None}
+                        }
+                    },
+                    {"$sort": {"score": {"$meta": "textScore"}}},
+                    {"$limit": MAX_RESULTADOS},
+                ]
+
+            pipeline = etapas_busqueda + [
                 {
                     "$group": {
                         "_id": "$fuente",
@@ -120,6 +146,7 @@ class PricePersonalizationService:
                         "productos": {
                             "$push": {
                                 "titulo": "$titulo",
+                                "product_key": "$product_key",
                                 "precio_valor": "$precio_valor",
                                 "precio_texto": "$precio_texto",
                                 "link": "$link",
@@ -131,7 +158,7 @@ class PricePersonalizationService:
                 {"$sort": {"precio_min": 1}}
             ]
             
-            results = list(collection.aggregate(pipeline))
+            results = ejecutar_agregacion(collection, pipeline, "price_comparison")
             
             if not results:
                 return {"error": "No se encontraron productos similares"}
@@ -143,6 +170,7 @@ class PricePersonalizationService:
             
             return {
                 "product_searched": product_title,
+                "product_keys": claves,
                 "total_results": len(all_prices),
                 "price_range": {
                     "min": min(all_prices),
@@ -152,10 +180,30 @@ class PricePersonalizationService:
                 "stores": results,
                 "best_deal": results[0] if results else None
             }
-            
-        except Exception as e:
-            print(f"Error en get_price_comparison: {e}")
-            return _get_mock_price_comparison(product_title)
+
+        return consultar_protegido(
+            ("price_comparison", product_title, product_key),
+            consulta,
+            lambda: _get_mock_price_comparison(product_title or product_key),
+        )
+
+    @staticmethod
+    def _product_keys_candidatas(collection, product_title: str) -> List[str]:
+        """product_key de los resultados más relevantes de la búsqueda de texto, sin repetir"""
+        cursor = (collection
+                  .find(
+                      {**ProductSearchService.match_busqueda(product_title), "product_key": {"$type": "string"}},
+                      {"_id": 0, "product_key": 1, "score": {"$meta": "textScore"}}
+                  )
+                  .sort([("score", {"$meta": "textScore"})])
+                  .limit(MAX_CANDIDATOS_BUSQUEDA))
+        claves: List[str] = []
+        for doc in ejecutar_busqueda(cursor, "price_comparison"):
+            if doc["product_key"] not in claves:
+                claves.append(doc["product_key"])
+            if len(claves) >= MAX_PRODUCT_KEYS:
+                break
+        return claves
 
 
 def _get_mock_best_prices(categoria: str, limit: int) -> List[Dict[str, Any]]:
@@ -0,0 +1,73 @@
+"""
+Motor de emparejamiento de productos entre tiendas (product_key canónico)
+"""
+import hashlib
+import re
+from typing import Dict, Any, Optional
+from .parse_details import parse_details
+from .search_service import normalizar_texto
+
+
+# Tokens alfanuméricos con letras y dígitos (p. ej. UN55AU7000, SM-A155M, 65Q80C)
+_CANDIDATO_MODELO = re.compile(r"[A-Za-z0-9]+(?:-[A-Za-z0-9]+)*")
+# Especificaciones que parecen modelos pero no lo son (128GB, 4K, 60HZ, 5000MAH, 55PULGADAS...)
+_ESPECIFICACION = re.compile(r"^\d+(?:[.,]\d+)?(gb|tb|mb|hz|mhz|ghz|mp|mah|w|v|k|p|pulgadas|pulg|in|cm|mm|kg|g|l|ml)$")
+_CLAVES_MODELO = ("modelo", "model", "referencia", "ref", "sku")
+_STOPWORDS = {
+    "de", "del", "la", "el", "los", "las", "y", "con", "para", "en", "por", "a", "un", "una",
+    "the", "and", "with", "for", "nuevo", "original", "oferta", "color",
+}
+MIN_LARGO_MODELO = 5
+
+
+def _es_modelo(token: str) -> bool:
+    limpio = token.replace("-", "").lower()
+    return (len(limpio) >= MIN_LARGO_MODELO
+            and any(c.isdigit() for c in limpio)
+            and any(c.isalpha() for c in limpio)
+            and not _ESPECIFICACION.match(limpio))
+
+
+def extraer_modelo(doc: Dict[str, Any]) -> Optional[str]:
+    """
+    Número de modelo del producto: primero un campo explícito en
+    detalles_adicionales ("Modelo: ..."), si no el candidato más largo del
+    título. Se retorna en minúsculas y sin guiones.
+    """
+    detalles = doc.get("detalles_adicionales")
+    if isinstance(detalles, str):
+        for clave, valor in parse_details(detalles).items():
+            if normalizar_texto(clave) in _CLAVES_MODELO:
+                candidatos = [t for t in _CANDIDATO_MODELO.findall(valor) if _es_modelo(t)]
+                if candidatos:
+                    return max(candidatos, key=len).replace("-", "").lower()
+
+    titulo = doc.get("titulo")
+    if isinstance(titulo, str):
+        candidatos = [t for t in _CANDIDATO_MODELO.findall(titulo) if _es_modelo(t)]
+        if candidatos:
+            return max(candidatos, key=len).replace("-", "").lower()
+
+    return None
+
+
+def generar_product_key(doc: Dict[str, Any]) -> Optional[str]:
+    """
+    Clave canónica de producto, igual para el mismo producto en distintas
+    tiendas:
+        "<marca>:<modelo>"           si se encuentra número de modelo
+        "<marca>:t:<hash de tokens>" si no, con los tokens significativos del título
+    Retorna None si el documento no tiene título.
+    """
+    marca = normalizar_texto(doc.get("marca")).replace(" ", "") or "-"
+    modelo = extraer_modelo(doc)
+    if modelo:
+        return f"{marca}:{modelo}"
+
+    tokens = set(normalizar_texto(doc.get("titulo")).split())
+    tokens -= _STOPWORDS
+    tokens -= set(normalizar_texto(doc.get("marca")).split())
+    if not tokens:
+        return None
+    firma = hashlib.blake2b(" ".join(sorted(tokens)).encode("utf-8"), digest_size=8).hexdigest()
+    return f"{marca}:t:{firma}"
@@ -0,0 +1,176 @@
+"""
+Servicio de ejecución de consultas a MongoDB con límites de tiempo por consulta y deadline de la request
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from pymongo.errors import ExecutionTimeout
+
+# maxTimeMS por defecto: Mongo aborta la consulta en el servidor al vencer,
+# aunque el worker que la pidió ya no exista (timeout de gunicorn)
+MONGO_MAX_TIME_MS = int(os.getenv("MONGO_MAX_TIME_MS", 5000))
+MONGO_BATCH_SIZE = int(os.getenv("MONGO_BATCH_SIZE", 500))
+# Consultas más lentas que esto se informan por consola
+MONGO_SLOW_QUERY_MS = float(os.getenv("MONGO_SLOW_QUERY_MS", 1000))
+
+# Presupuesto por consulta: max_time_ms, batch_size y allow_disk_use (los
+# reportes agrupan toda la ventana de fechas y pueden necesitar disco; los
+# listados no, y es preferible que fallen a que ocupen el servidor)
+PRESUPUESTOS: Dict[str, Dict[str, Any]] = {
+    "best_prices": {"max_time_ms": 3000},
+    "price_comparison": {"max_time_ms": 5000},
+    "ranked_offers": {"max_time_ms": 5000},
+    "trending_offers": {"max_time_ms": 5000},
+    # Lee los acumulados diarios de reporte_tiendas_diario, no los productos
+    "store_comparison_report": {"max_time_ms": 5000},
+    "price_analysis_report": {"max_time_ms": 15000, "allow_disk_use": True},
+    # Recorrido de precios ordenado por índice para los percentiles del análisis
+    "price_analysis_distribution": {"max_time_ms": 15000, "batch_size": 2000},
+    "marcas": {"max_time_ms": 5000},
+    "categorias": {"max_time_ms": 5000},
+    "offers_by_category": {"max_time_ms": 3000},
+    "search": {"max_time_ms": 3000},
+    "price_history": {"max_time_ms": 3000},
+    # Recalculo de estadísticas (ingesta, o primera request de una categoría)
+    "category_stats": {"max_time_ms": 60000, "batch_size": 2000},
+    # Acumulados por tienda: buckets tocados por una ingesta, o reconstrucción completa
+    "store_rollup": {"max_time_ms": 30000, "batch_size": 2000},
+    "store_rollup_rebuild": {"max_time_ms": 600000, "batch_size": 5000},
+    # Carga del snapshot columnar de RANKING_ENGINE=snapshot (en un hilo, fuera de la request)
+    "ranking_snapshot": {"max_time_ms": 600000, "batch_size": 5000},
+}
+
+
+def parse_time_limits(value: str) -> Dict[str, int]:
+    """'price_comparison:3000,search:2000' -> {'price_comparison': 3000, 'search': 2000}"""
+    limites = {}
+    for item in filter(None, (parte.strip() for parte in value.split(","))):
+        nombre, _, ms = item.rpartition(":")
+        if nombre and ms.isdigit():
+            limites[nombre] = int(ms)
+    return limites
+
+
+for _nombre, _ms in parse_time_limits(os.getenv("MONGO_QUERY_TIME_LIMITS", "")).items():
+    PRESUPUESTOS.setdefault(_nombre, {})["max_time_ms"] = _ms
+
+
+class DeadlineVencido(ExecutionTimeout):
+    """El deadline de la request venció antes de consultar: no dice nada de la salud de Mongo"""
+
+
+# Instante (time.monotonic) en que vence la request actual; lo fija la capa
+# HTTP (RequestDeadlineMiddleware). None fuera de una request (comandos, ingesta)
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline_request", default=None)
+
+
+def establecer_deadline(segundos: Optional[float]):
+    """Fija el deadline de la request actual a `segundos` desde ahora (None lo quita)"""
+    _deadline.set(None if segundos is None else time.monotonic() + segundos)
+
+
+def tiempo_restante_ms() -> Optional[int]:
+    """Milisegundos hasta el deadline de la request (None si no hay deadline)"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return int((deadline - time.monotonic()) * 1000)
+
+
+def opciones(consulta: str, batch_size: Optional[int] = None) -> Dict[str, Any]:
+    """
+    maxTimeMS, batchSize y allowDiskUse para `consulta`. maxTimeMS es el
+    menor entre su presupuesto y lo que queda del deadline de la request;
+    si el deadline ya venció lanza ExecutionTimeout sin ir a Mongo.
+    """
+    presupuesto = PRESUPUESTOS.get(consulta, {})
+    max_time_ms = presupuesto.get("max_time_ms", MONGO_MAX_TIME_MS)
+    restante = tiempo_restante_ms()
+    if restante is not None:
+        if restante <= 0:
+            _estadisticas.registrar(consulta, 0.0, "timeout")
+            raise DeadlineVencido(f"Deadline de la request vencido antes de consultar ({consulta})", code=50)
+        max_time_ms = min(max_time_ms, restante)
+    return {
+        "maxTimeMS": max_time_ms,
+        "batchSize": batch_size or presupuesto.get("batch_size", MONGO_BATCH_SIZE),
+        "allowDiskUse": presupuesto.get("allow_disk_use", False),
+    }
+
+
+class EstadisticasConsultas:
+    """Tiempos por consulta del proceso (ver estadisticas_consultas)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._datos: Dict[str, Dict[str, float]] = {}
+
+    def registrar(self, consulta: str, duracion_ms: float, resultado: str):
+        with self._lock:
+            datos = self._datos.setdefault(consulta, {
+                "llamadas": 0, "errores": 0, "timeouts": 0, "total_ms": 0.0, "max_ms": 0.0,
+            })
+            datos["llamadas"] += 1
+            datos["total_ms"] += duracion_ms
+            datos["max_ms"] = max(datos["max_ms"], duracion_ms)
+            if resultado == "timeout":
+                datos["timeouts"] += 1
+            elif resultado == "error":
+                datos["errores"] += 1
+
+    def resumen(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                consulta: {
+                    "llamadas": int(datos["llamadas"]),
+                    "errores": int(datos["errores"]),
+                    "timeouts": int(datos["timeouts"]),
+                    "promedio_ms": round(datos["total_ms"] / datos["llamadas"], 1),
+                    "max_ms": round(datos["max_ms"], 1),
+                    "max_time_ms": PRESUPUESTOS.get(consulta, {}).get("max_time_ms", MONGO_MAX_TIME_MS),
+                }
+                for consulta, datos in sorted(self._datos.items())
+            }
+
+
+_estadisticas = EstadisticasConsultas()
+
+
+def estadisticas_consultas() -> Dict[str, Dict[str, Any]]:
+    return _estadisticas.resumen()
+
+
+@contextmanager
+def medir(consulta: str):
+    """Registra la duración y el resultado (ok, error, timeout) de una consulta"""
+    inicio = time.perf_counter()
+    resultado = "ok"
+    try:
+        yield
+    except Exception as e:
+        resultado = "timeout" if getattr(e, "timeout", False) else "error"
+        raise
+    finally:
+        duracion_ms = (time.perf_counter() - inicio) * 1000
+        _estadisticas.registrar(consulta, duracion_ms, resultado)
+        if duracion_ms >= MONGO_SLOW_QUERY_MS:
+            print(f"⚠️  Consulta lenta a Mongo ({consulta}): {duracion_ms:.0f} ms")
+
+
+def ejecutar_agregacion(collection, pipeline: List[Dict[str, Any]], consulta: str,
+                        batch_size: Optional[int] = None) -> List[Dict[str, Any]]:
+    """collection.aggregate con el presupuesto de `consulta`; retorna todos los documentos"""
+    kwargs = opciones(consulta, batch_size)
+    with medir(consulta):
+        return list(collection.aggregate(pipeline, **kwargs))
+
+
+def ejecutar_busqueda(cursor, consulta: str, batch_size: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Aplica maxTimeMS/batchSize de `consulta` a un cursor de find y retorna todos los documentos"""
+    kwargs = opciones(consulta, batch_size)
+    with medir(consulta):
+        return list(cursor.max_time_ms(kwargs["maxTimeMS"]).batch_size(kwargs["batchSize"]))
@@ -2,8 +2,16 @@
 Servicio para ranking de ofertas por valor y algoritmos de recomendación
 """
 from typing import List, Dict, Any, Optional
-from .mongo_service import db, MONGO_AVAILABLE
-from datetime import datetime, timedelta
+from asgiref.sync import sync_to_async
+from .async_mongo_service import agregar, buscar
+from .circuit_breaker import consultar_protegido, consultar_protegido_async
+from .mongo_service import get_db
+from .query_runner import ejecutar_agregacion, ejecutar_busqueda
+from .category_stats_service import CategoryStatsService, STATS_COLLECTION
+from .report_service import inicio_periodo
+from .ranking_snapshot_service import CAMPOS_RANKING, combinar, ids_de, motor_snapshot
+from .scoring_models import ModeloScoring, clave_preferencias, obtener_modelo, vector_preferencias
+from datetime import datetime
 import math
 
 
@@ -14,7 +22,9 @@ class OfferRankingService:
     def rank_offers_by_value(
         categoria: Optional[str] = None,
         user_id: Optional[int] = None,
-        limit: int = 20
+        limit: int = 20,
+        modelo: Optional[str] = None,
+        preferencias: Optional[Dict[str, Any]] = None
     ) -> List[Dict[str, Any]]:
         """
         Rankea ofertas por valor usando algoritmo personalizado
@@ -23,140 +33,65 @@ class OfferRankingService:
             categoria: Filtrar por categoría específica
             user_id: ID del usuario para personalización
             limit: Número máximo de resultados
+            modelo: Modelo de scoring registrado (RANKING_DEFAULT_MODEL si es None)
+            preferencias: Preferencias del usuario (marcas_favoritas,
+                categorias_favoritas, precio_min, precio_max) que evalúa el modelo
             
         Returns:
             Lista de ofertas rankeadas por valor
+
+        Raises:
+            ValueError: Si el modelo no existe
         """
-        if not MONGO_AVAILABLE or db is None:
-            return _get_mock_ranked_offers(categoria, limit)
-        
-        try:
-            collection = db["archivos"]
-            
-            # Filtro base
-            match_filter = {"precio_valor": {"$exists": True, "$ne": None}}
-            if categoria:
-                match_filter["categoria"] = {"$eq": categoria}
-            
-            pipeline = [
-                {"$match": match_filter},
-                {
-                    "$addFields": {
-                        "dias_desde_extraccion": {
-                            "$divide": [
-                                {"$subtract": [datetime.now(), {"$dateFromString": {"dateString": "$fecha_extraccion"}}]},
-                                86400000  # milisegundos en un día
-                            ]
-                        }
-                    }
-                },
-                {
-                    "$addFields": {
-                        "score_freshness": {
-                            "$cond": {
-                                "if": {"$lte": ["$dias_desde_extraccion", 1]},
-                                "then": 1.0,
-                                "else": {
-                                    "$divide": [
-                                        1,
-                                        {"$add": [1, {"$multiply": ["$dias_desde_extraccion", 0.1]}]}
-                                    ]
-                                }
-                            }
-                        }
-                    }
-                },
-                {
-                    "$lookup": {
-                        "from": "archivos",
-                        "let": {"current_categoria": "$categoria"},
-                        "pipeline": [
-                            {"$match": {"$expr": {"$eq": ["$categoria", "$$current_categoria"]}}},
-                            {"$group": {
-                                "_id": None,
-                                "precio_promedio": {"$avg": "$precio_valor"},
-                                "precio_min": {"$min": "$precio_valor"},
-                                "precio_max": {"$max": "$precio_valor"}
-                            }}
-                        ],
-                        "as": "categoria_stats"
-                    }
-                },
-                {
-                    "$addFields": {
-                        "categoria_stats": {"$arrayElemAt": ["$categoria_stats", 0]}
-                    }
-                },
-                {
-                    "$addFields": {
-                        "score_precio": {
-                            "$cond": {
-                                "if": {"$gt": ["$categoria_stats.precio_max", "$categoria_stats.precio_min"]},
-                                "then": {
-                                    "$divide": [
-                                        {"$subtract": ["$categoria_stats.precio_max", "$precio_valor"]},
-                                        {"$subtract": ["$categoria_stats.precio_max", "$categoria_stats.precio_min"]}
-                                    ]
-                                },
-                                "else": 0.5
-                            }
-                        }
-                    }
-                },
-                {
-                    "$addFields": {
-                        "score_total": {
-                            "$add": [
-                                {"$multiply": ["$score_precio", 0.6]},      # 60% peso al precio
-                                {"$multiply": ["$score_freshness", 0.4]}    # 40% peso a la frescura
-                            ]
-                        }
-                    }
-                },
-                {"$sort": {"score_total": -1}},
-                {"$limit": limit},
-                {
-                    "$project": {
-                        "_id": 1,
-                        "titulo": 1,
-                        "marca": 1,
-                        "precio_texto": 1,
-                        "precio_valor": 1,
-                        "moneda": 1,
-                        "categoria": 1,
-                        "imagen": 1,
-                        "link": 1,
-                        "fuente": 1,
-                        "fecha_extraccion": 1,
-                        "score_total": 1,
-                        "score_precio": 1,
-                        "score_freshness": 1,
-                        "ahorro_vs_promedio": {
-                            "$subtract": ["$categoria_stats.precio_promedio", "$precio_valor"]
-                        },
-                        "percentil_precio": {
-                            "$multiply": [{"$subtract": [1, "$score_precio"]}, 100]
-                        }
-                    }
-                }
-            ]
-            
-            results = list(collection.aggregate(pipeline))
-            
-            # Convertir ObjectId a string y limpiar datos
-            for result in results:
-                result["_id"] = str(result["_id"])
-                result["score_total"] = round(result.get("score_total", 0), 3)
-                result["score_precio"] = round(result.get("score_precio", 0), 3)
-                result["score_freshness"] = round(result.get("score_freshness", 0), 3)
-                result["ahorro_vs_promedio"] = round(result.get("ahorro_vs_promedio", 0), 2)
-                result["percentil_precio"] = round(result.get("percentil_precio", 0), 1)
-                
-            return results
-            
-        except Exception as e:
-            print(f"Error en rank_offers_by_value: {e}")
-            return _get_mock_ranked_offers(categoria, limit)
+        modelo_scoring = obtener_modelo(modelo)
+        vector = vector_preferencias(preferencias)
+
+        def consulta(db):
+            snapshot = motor_snapshot.obtener(db) if motor_snapshot.activo() else None
+            if snapshot is not None:
+                resultados = snapshot.ranking_por_valor(categoria, limit, datetime.now(), modelo_scoring, vector)
+                return _limpiar_ranking(_documentos_snapshot(db, resultados, "ranked_offers", CAMPOS_RANKING))
+            CategoryStatsService.asegurar(categoria)
+            pipeline = _pipeline_ranking(categoria, limit, modelo_scoring, vector)
+            return _limpiar_ranking(ejecutar_agregacion(db["archivos"], pipeline, "ranked_offers"))
+
+        return consultar_protegido(
+            ("ranked_offers", categoria, limit, modelo_scoring.nombre, clave_preferencias(vector)),
+            consulta,
+            lambda: _get_mock_ranked_offers(categoria, limit),
+        )
+
+    @staticmethod
+    async def rank_offers_by_value_async(
+        categoria: Optional[str] = None,
+        user_id: Optional[int] = None,
+        limit: int = 20,
+        modelo: Optional[str] = None,
+        preferencias: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Versión asíncrona de rank_offers_by_value para las vistas ASGI"""
+        modelo_scoring = obtener_modelo(modelo)
+        vector = vector_preferencias(preferencias)
+
+        async def consulta(adb):
+            snapshot = None
+            if motor_snapshot.activo():
+                # Lee la generación de la cache síncrona; el snapshot se construye en un hilo con el cliente síncrono
+                snapshot = await sync_to_async(motor_snapshot.obtener, thread_sensitive=False)(get_db())
+            if snapshot is not None:
+                resultados = snapshot.ranking_por_valor(categoria, limit, datetime.now(), modelo_scoring, vector)
+                return _limpiar_ranking(
+                    await _documentos_snapshot_async(adb, resultados, "ranked_offers", CAMPOS_RANKING)
+                )
+            await CategoryStatsService.asegurar_async(categoria)
+            pipeline = _pipeline_ranking(categoria, limit, modelo_scoring, vector)
+            return _limpiar_ranking(await agregar(adb["archivos"], pipeline, "ranked_offers"))
+
+        return await consultar_protegido_async(
+            ("ranked_offers", categoria, limit, modelo_scoring.nombre, clave_preferencias(vector)),
+            consulta,
+            lambda: _get_mock_ranked_offers(categoria, limit),
+        )
     
     @staticmethod
     def get_trending_offers(timeframe_days: int = 7, limit: int = 15) -> List[Dict[str, Any]]:
@@ -170,77 +105,226 @@ class OfferRankingService:
         Returns:
             Lista de ofertas trending
         """
-        if not MONGO_AVAILABLE or db is None:
-            return _get_mock_trending_offers(limit)
-        
-        try:
-            collection = db["archivos"]
-            start_date = datetime.now() - timedelta(days=timeframe_days)
-            
-            pipeline = [
-                {
-                    "$match": {
-                        "fecha_extraccion": {"$gte": start_date.strftime("%Y-%m-%d")},
-                        "precio_valor": {"$exists": True, "$ne": None}
-                    }
-                },
-                {
-                    "$group": {
-                        "_id": {
-                            "titulo_normalizado": {"$toLower": "$titulo"},
-                            "marca": "$marca"
+        def consulta(db):
+            snapshot = motor_snapshot.obtener(db) if motor_snapshot.activo() else None
+            if snapshot is not None:
+                resultados = snapshot.trending(timeframe_days, limit, datetime.now())
+                return _limpiar_trending(_documentos_snapshot(db, resultados, "trending_offers"))
+            return _limpiar_trending(ejecutar_agregacion(db["archivos"], _pipeline_trending(timeframe_days, limit), "trending_offers"))
+
+        return consultar_protegido(
+            ("trending_offers", timeframe_days, limit),
+            consulta,
+            lambda: _get_mock_trending_offers(limit),
+        )
+
+    @staticmethod
+    async def get_trending_offers_async(timeframe_days: int = 7, limit: int = 15) -> List[Dict[str, Any]]:
+        """Versión asíncrona de get_trending_offers para las vistas ASGI"""
+        async def consulta(adb):
+            snapshot = None
+            if motor_snapshot.activo():
+                snapshot = await sync_to_async(motor_snapshot.obtener, thread_sensitive=False)(get_db())
+            if snapshot is not None:
+                resultados = snapshot.trending(timeframe_days, limit, datetime.now())
+                return _limpiar_trending(await _documentos_snapshot_async(adb, resultados, "trending_offers"))
+            return _limpiar_trending(await agregar(adb["archivos"], _pipeline_trending(timeframe_days, limit), "trending_offers"))
+
+        return await consultar_protegido_async(
+            ("trending_offers", timeframe_days, limit),
+            consulta,
+            lambda: _get_mock_trending_offers(limit),
+        )
+
+
+def _documentos_snapshot(db, resultados, consulta: str, proyeccion: Optional[Dict[str, int]] = None):
+    """Documentos de archivos de los resultados del snapshot, en orden y con los campos calculados"""
+    ids = ids_de(resultados)
+    cursor = db["archivos"].find({"_id": {"$in": ids}}, proyeccion)
+    return combinar(ejecutar_busqueda(cursor, consulta), ids, resultados)
+
+
+async def _documentos_snapshot_async(adb, resultados, consulta: str, proyeccion: Optional[Dict[str, int]] = None):
+    """Versión asíncrona de _documentos_snapshot"""
+    ids = ids_de(resultados)
+    cursor = adb["archivos"].find({"_id": {"$in": ids}}, proyeccion)
+    return combinar(await buscar(cursor, consulta), ids, resultados)
+
+
+def _pipeline_ranking(
+    categoria: Optional[str],
+    limit: int,
+    modelo: Optional[ModeloScoring] = None,
+    preferencias: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Pipeline de rank_offers_by_value (compartido por la versión síncrona y la
+    asíncrona). Los scores salen de las etapas del modelo: con cualquier
+    modelo o preferencias es una sola agregación.
+    """
+    modelo = modelo or obtener_modelo()
+    # Filtro base
+    match_filter = {"precio_valor": {"$exists": True, "$ne": None}}
+    if categoria:
+        match_filter["categoria"] = {"$eq": categoria}
+    
+    return [
+        {"$match": match_filter},
+        {
+            "$addFields": {
+                "dias_desde_extraccion": {
+                    "$divide": [
+                        # fecha_extraccion es Date; $convert solo actúa sobre documentos sin migrar
+                        {"$subtract": [datetime.now(), {"$convert": {
+                            "input": "$fecha_extraccion", "to": "date", "onError": None, "onNull": None
+                        }}]},
+                        86400000  # milisegundos en un día
+                    ]
+                }
+            }
+        },
+        modelo.etapa_frescura(),
+        {
+            # Estadísticas precalculadas: join por igualdad contra categoria_stats
+            "$lookup": {
+                "from": STATS_COLLECTION,
+                "localField": "categoria",
+                "foreignField": "categoria",
+                "as": "categoria_stats"
+            }
+        },
+        {
+            "$addFields": {
+                "categoria_stats": {"$arrayElemAt": ["$categoria_stats", 0]}
+            }
+        },
+        {
+            "$addFields": {
+                "score_precio": {
+                    "$cond": {
+                        "if": {"$gt": ["$categoria_stats.precio_max", "$categoria_stats.precio_min"]},
+                        "then": {
+                            "$divide": [
+                                {"$subtract": ["$categoria_stats.precio_max", "$precio_valor"]},
+                                {"$subtract": ["$categoria_stats.precio_max", "$categoria_stats.precio_min"]}
+                            ]
                         },
-                        "count": {"$sum": 1},
-                        "precio_min": {"$min": "$precio_valor"},
-                        "precio_promedio": {"$avg": "$precio_valor"},
-                        "fuentes": {"$addToSet": "$fuente"},
-                        "ultimo_documento": {"$last": "$$ROOT"}
+                        "else": 0.5
                     }
+                }
+            }
+        },
+        modelo.etapa_score(preferencias),
+        {"$sort": {"score_total": -1}},
+        {"$limit": limit},
+        {
+            "$project": {
+                "_id": 1,
+                "titulo": 1,
+                "marca": 1,
+                "precio_texto": 1,
+                "precio_valor": 1,
+                "moneda": 1,
+                "categoria": 1,
+                "imagen": 1,
+                "link": 1,
+                "fuente": 1,
+                "fecha_extraccion": 1,
+                "score_total": 1,
+                "score_precio": 1,
+                "score_freshness": 1,
+                "ahorro_vs_promedio": {
+                    "$subtract": ["$categoria_stats.precio_promedio", "$precio_valor"]
                 },
-                {
-                    "$addFields": {
-                        "score_trending": {
-                            "$add": [
-                                {"$multiply": ["$count", 0.4]},          # 40% por frecuencia
-                                {"$multiply": [{"$size": "$fuentes"}, 0.3]}, # 30% por múltiples fuentes
-                                {"$divide": [1000, "$precio_min"]}       # 30% inversamente proporcional al precio
-                            ]
-                        }
-                    }
+                "percentil_precio": {
+                    "$multiply": [{"$subtract": [1, "$score_precio"]}, 100]
+                }
+            }
+        }
+    ]
+
+
+def _limpiar_ranking(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Convertir ObjectId a string y redondear scores"""
+    for result in results:
+        result["_id"] = str(result["_id"])
+        result["score_total"] = round(result.get("score_total", 0), 3)
+        result["score_precio"] = round(result.get("score_precio", 0), 3)
+        result["score_freshness"] = round(result.get("score_freshness", 0), 3)
+        # Sin estadísticas de la categoría (p. ej. categoría vacía) el ahorro es null
+        result["ahorro_vs_promedio"] = round(result.get("ahorro_vs_promedio") or 0, 2)
+        result["percentil_precio"] = round(result.get("percentil_precio", 0), 1)
+
+    return results
+
+
+def _pipeline_trending(timeframe_days: int, limit: int) -> List[Dict[str, Any]]:
+    """Pipeline de get_trending_offers (compartido por la versión síncrona y la asíncrona)"""
+    start_date = inicio_periodo(timeframe_days)
+    
+    return [
+        {
+            "$match": {
+                "fecha_extraccion": {"$gte": start_date},
+                "precio_valor": {"$exists": True, "$ne": None}
+            }
+        },
+        {
+            "$group": {
+                # Mismo producto entre tiendas por product_key; título + marca si aún no lo tiene
+                "_id": {
+                    "$ifNull": [
+                        "$product_key",
+                        {"titulo_normalizado": {"$toLower": "$titulo"}, "marca": "$marca"}
+                    ]
                 },
-                {"$sort": {"score_trending": -1}},
-                {"$limit": limit},
-                {
-                    "$replaceRoot": {
-                        "newRoot": {
-                            "$mergeObjects": [
-                                "$ultimo_documento",
-                                {
-                                    "trending_score": "$score_trending",
-                                    "apariciones": "$count",
-                                    "fuentes_count": {"$size": "$fuentes"},
-                                    "precio_min_encontrado": "$precio_min",
-                                    "precio_promedio_encontrado": "$precio_promedio"
-                                }
-                            ]
+                "count": {"$sum": 1},
+                "precio_min": {"$min": "$precio_valor"},
+                "precio_promedio": {"$avg": "$precio_valor"},
+                "fuentes": {"$addToSet": "$fuente"},
+                "ultimo_documento": {"$last": "$$ROOT"}
+            }
+        },
+        {
+            "$addFields": {
+                "score_trending": {
+                    "$add": [
+                        {"$multiply": ["$count", 0.4]},          # 40% por frecuencia
+                        {"$multiply": [{"$size": "$fuentes"}, 0.3]}, # 30% por múltiples fuentes
+                        {"$divide": [1000, "$precio_min"]}       # 30% inversamente proporcional al precio
+                    ]
+                }
+            }
+        },
+        {"$sort": {"score_trending": -1}},
+        {"$limit": limit},
+        {
+            "$replaceRoot": {
+                "newRoot": {
+                    "$mergeObjects": [
+                        "$ultimo_documento",
+                        {
+                            "trending_score": "$score_trending",
+                            "apariciones": "$count",
+                            "fuentes_count": {"$size": "$fuentes"},
+                            "precio_min_encontrado": "$precio_min",
+                            "precio_promedio_encontrado": "$precio_promedio"
                         }
-                    }
+                    ]
                 }
-            ]
-            
-            results = list(collection.aggregate(pipeline))
-            
-            # Limpiar datos
-            for result in results:
-                result["_id"] = str(result["_id"])
-                result["trending_score"] = round(result.get("trending_score", 0), 2)
-                result["precio_promedio_encontrado"] = round(result.get("precio_promedio_encontrado", 0), 2)
-                
-            return results
-            
-        except Exception as e:
-            print(f"Error en get_trending_offers: {e}")
-            return _get_mock_trending_offers(limit)
+            }
+        }
+    ]
+
+
+def _limpiar_trending(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Convertir ObjectId a string y redondear scores"""
+    for result in results:
+        result["_id"] = str(result["_id"])
+        result["trending_score"] = round(result.get("trending_score", 0), 2)
+        result["precio_promedio_encontrado"] = round(result.get("precio_promedio_encontrado", 0), 2)
+
+    return results
 
 
 def _get_mock_ranked_offers(categoria: Optional[str], limit: int) -> List[Dict[str, Any]]:
@@ -0,0 +1,424 @@
+"""
+Servicio de ranking en memoria sobre un snapshot columnar de archivos (opcional, requiere NumPy)
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+
+from bson import ObjectId
+from django.core.cache import cache
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional: sin él se usa siempre el pipeline de Mongo
+    np = None
+
+from .events import suscribir_ingesta
+from .mongo_service import get_db
+from .query_runner import medir, opciones
+from .report_service import inicio_periodo
+from .scoring_models import ModeloScoring, obtener_modelo
+
+# "mongo" (pipelines de agregación) o "snapshot" (este motor)
+RANKING_ENGINE = os.getenv("RANKING_ENGINE", "mongo").lower()
+# Edad máxima del snapshot; una ingesta en archivos lo deja desactualizado antes
+RANKING_SNAPSHOT_TTL = float(os.getenv("RANKING_SNAPSHOT_TTL", 300))
+# Generación de archivos en la cache compartida (todos los workers)
+CLAVE_GENERACION = "ranking_snapshot_generacion"
+
+EPOCA = datetime(1970, 1, 1)
+CAMPOS_SNAPSHOT = {
+    "_id": 1, "precio_valor": 1, "categoria": 1, "fecha_extraccion": 1,
+    "product_key": 1, "titulo": 1, "marca": 1, "fuente": 1,
+}
+# Campos del $project de _pipeline_ranking
+CAMPOS_RANKING = {
+    "_id": 1, "titulo": 1, "marca": 1, "precio_texto": 1, "precio_valor": 1, "moneda": 1,
+    "categoria": 1, "imagen": 1, "link": 1, "fuente": 1, "fecha_extraccion": 1,
+}
+_AUSENTE = object()
+
+
+def _milisegundos(fecha: datetime) -> int:
+    """Milisegundos desde la época de un datetime naive (UTC y precisión de BSON Date, como en Mongo)"""
+    return (fecha - EPOCA) // timedelta(milliseconds=1)
+
+
+def _codigo(codigos: Dict[Any, int], valor: Any) -> int:
+    codigo = codigos.get(valor)
+    if codigo is None:
+        codigo = codigos[valor] = len(codigos)
+    return codigo
+
+
+def _marca_normalizada(marca: Any) -> str:
+    """Misma normalización que {"$toUpper": "$marca"} de los modelos de scoring"""
+    return "" if marca is None else str(marca).upper()
+
+
+def _clave_trending(doc: Dict[str, Any]) -> Any:
+    """Misma clave que el $group de _pipeline_trending: product_key, o título en minúsculas + marca"""
+    product_key = doc.get("product_key")
+    if product_key is not None:
+        return ("product_key", product_key)
+    titulo = doc.get("titulo")
+    return ("titulo_marca", "" if titulo is None else str(titulo).lower(), doc.get("marca", _AUSENTE))
+
+
+class SnapshotCatalogo:
+    """
+    Columnas de los productos de archivos con precio numérico, en orden de
+    _id: _id (12 bytes), precio, código de categoría, fecha (milisegundos,
+    NaN si no es Date), código de producto para trending, código de fuente
+    (-1 si no tiene) y código de marca en mayúsculas. Las estadísticas por categoría (mínimo, máximo,
+    promedio) y los índices de cada categoría se calculan al construirlo.
+    """
+
+    def __init__(self, docs):
+        codigos_categoria: Dict[Any, int] = {}
+        codigos_grupo: Dict[Any, int] = {}
+        codigos_fuente: Dict[Any, int] = {}
+        codigos_marca: Dict[str, int] = {}
+        ids, precios, categorias, fechas, grupos, fuentes, marcas = [], [], [], [], [], [], []
+        for doc in docs:
+            precio = doc.get("precio_valor")
+            if isinstance(precio, bool) or not isinstance(precio, (int, float)):
+                continue
+            fecha = doc.get("fecha_extraccion")
+            ids.append(doc["_id"].binary)
+            precios.append(precio)
+            categorias.append(_codigo(codigos_categoria, doc.get("categoria")))
+            fechas.append(_milisegundos(fecha) if isinstance(fecha, datetime) else np.nan)
+            grupos.append(_codigo(codigos_grupo, _clave_trending(doc)))
+            fuentes.append(_codigo(codigos_fuente, doc["fuente"]) if "fuente" in doc else -1)
+            marcas.append(_codigo(codigos_marca, _marca_normalizada(doc.get("marca"))))
+
+        self.construido_en = time.monotonic()
+        # Generación compartida de archivos al iniciar la carga (ver MotorRankingSnapshot)
+        self.generacion: Optional[int] = None
+        self.ids = np.frombuffer(b"".join(ids), dtype="V12")
+        self.precio = np.array(precios, dtype=np.float64)
+        self.categoria = np.array(categorias, dtype=np.int32)
+        self.fecha = np.array(fechas, dtype=np.float64)
+        self.grupo = np.array(grupos, dtype=np.int32)
+        self.fuente = np.array(fuentes, dtype=np.int32)
+        self.marca = np.array(marcas, dtype=np.int32)
+        self.codigos_categoria = codigos_categoria
+        self.codigos_marca = codigos_marca
+        self.total_grupos = len(codigos_grupo)
+        self.total_fuentes = len(codigos_fuente)
+
+        # Estadísticas por categoría (las mismas que guarda categoria_stats)
+        total_categorias = len(codigos_categoria)
+        conteo = np.bincount(self.categoria, minlength=total_categorias)
+        suma = np.bincount(self.categoria, weights=self.precio, minlength=total_categorias)
+        self.cat_min = np.full(total_categorias, np.inf)
+        self.cat_max = np.full(total_categorias, -np.inf)
+        np.minimum.at(self.cat_min, self.categoria, self.precio)
+        np.maximum.at(self.cat_max, self.categoria, self.precio)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.cat_promedio = suma / conteo
+        # categoria_stats solo tiene categorías de texto: las demás no tienen estadísticas
+        self.cat_con_stats = np.array(
+            [isinstance(c, str) and bool(c) for c in codigos_categoria], dtype=bool
+        ) if total_categorias else np.zeros(0, dtype=bool)
+
+        orden = np.argsort(self.categoria, kind="stable")
+        cortes = np.cumsum(conteo)[:-1]
+        self.indices_categoria = dict(zip(codigos_categoria, np.split(orden, cortes)))
+
+    def __len__(self):
+        return len(self.precio)
+
+    @classmethod
+    def desde_mongo(cls, db) -> "SnapshotCatalogo":
+        limites = opciones("ranking_snapshot")
+        cursor = (db["archivos"]
+                  .find({"precio_valor": {"$type": "number"}}, CAMPOS_SNAPSHOT)
+                  .sort("_id", 1)
+                  .max_time_ms(limites["maxTimeMS"])
+                  .batch_size(limites["batchSize"]))
+        with medir("ranking_snapshot"):
+            return cls(cursor)
+
+    def ranking_por_valor(
+        self,
+        categoria: Optional[str],
+        limit: int,
+        ahora: datetime,
+        modelo: Optional[ModeloScoring] = None,
+        preferencias: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[bytes, Dict[str, Any]]]:
+        """
+        Mismo cálculo que _pipeline_ranking con el modelo de scoring (score
+        de precio contra el mínimo/máximo de la categoría, frescura, boosts
+        de marca y preferencias). Retorna (id, campos calculados) de los
+        `limit` mejores; los empates se ordenan por _id.
+        """
+        modelo = modelo or obtener_modelo()
+        if categoria:
+            indices = self.indices_categoria.get(categoria)
+            if indices is None:
+                return []
+        else:
+            indices = np.arange(len(self))
+        if limit <= 0 or not len(indices):
+            return []
+
+        precio = self.precio[indices]
+        codigo = self.categoria[indices]
+        # Sin fecha Date, $lte null 1 es verdadero en Mongo: frescura 1.0
+        dias = (_milisegundos(ahora) - self.fecha[indices]) / 86400000
+        score_freshness = _frescura(modelo, dias)
+
+        con_stats = self.cat_con_stats[codigo]
+        cat_min, cat_max = self.cat_min[codigo], self.cat_max[codigo]
+        rango = cat_max - cat_min
+        with np.errstate(invalid="ignore", divide="ignore"):
+            score_precio = np.where(con_stats & (rango > 0), (cat_max - precio) / rango, 0.5)
+        # Mismo orden de sumas que el $add del modelo
+        score_total = score_precio * modelo.peso_precio + score_freshness * modelo.peso_frescura
+        if modelo.boost_marcas:
+            boosts = np.array([modelo.boost_marcas.get(m, 0.0) for m in self.codigos_marca], dtype=np.float64)
+            score_total = score_total + boosts[self.marca[indices]]
+        for factor, peso in modelo.factores_activos(preferencias):
+            score_total = score_total + np.where(self._cumple(factor, preferencias, indices), peso, 0.0)
+
+        mejores = _top_k(score_total, limit)
+        return [
+            (
+                self.ids[indices[i]].tobytes(),
+                {
+                    "score_total": float(score_total[i]),
+                    "score_precio": float(score_precio[i]),
+                    "score_freshness": float(score_freshness[i]),
+                    "ahorro_vs_promedio": float(self.cat_promedio[codigo[i]] - precio[i]) if con_stats[i] else None,
+                    "percentil_precio": float((1 - score_precio[i]) * 100),
+                },
+            )
+            for i in mejores
+        ]
+
+    def _cumple(self, factor: str, preferencias: Dict[str, Any], indices):
+        """Máscara de las ofertas que cumplen un factor de preferencia"""
+        if factor == "marca":
+            codigos = [self.codigos_marca[m] for m in preferencias["marcas"] if m in self.codigos_marca]
+            return np.isin(self.marca[indices], codigos)
+        if factor == "categoria":
+            codigos = [self.codigos_categoria[c] for c in preferencias["categorias"] if c in self.codigos_categoria]
+            return np.isin(self.categoria[indices], codigos)
+        precio = self.precio[indices]
+        return (precio >= preferencias.get("precio_min", -np.inf)) & (precio <= preferencias.get("precio_max", np.inf))
+
+    def trending(self, timeframe_days: int, limit: int, ahora: datetime) -> List[Tuple[bytes, Dict[str, Any]]]:
+        """
+        Mismo cálculo que _pipeline_trending: productos agrupados por
+        product_key (o título + marca) con extracción desde el inicio del
+        día timeframe_days atrás, score 0.4 x apariciones + 0.3 x fuentes +
+        1000 / precio mínimo. Retorna (id del último documento del grupo,
+        campos calculados).
+        """
+        inicio = inicio_periodo(timeframe_days, ahora)
+        with np.errstate(invalid="ignore"):
+            indices = np.flatnonzero(self.fecha >= _milisegundos(inicio))
+        if limit <= 0 or not len(indices):
+            return []
+
+        grupo = self.grupo[indices]
+        precio = self.precio[indices]
+        apariciones = np.bincount(grupo, minlength=self.total_grupos)
+        suma = np.bincount(grupo, weights=precio, minlength=self.total_grupos)
+        precio_min = np.full(self.total_grupos, np.inf)
+        np.minimum.at(precio_min, grupo, precio)
+
+        # Fuentes distintas por grupo: pares (grupo, fuente) únicos
+        con_fuente = self.fuente[indices] >= 0
+        pares = np.unique(grupo[con_fuente].astype(np.int64) * max(self.total_fuentes, 1) + self.fuente[indices][con_fuente])
+        fuentes = np.bincount(pares // max(self.total_fuentes, 1), minlength=self.total_grupos)
+
+        # Último documento del grupo: el de fecha más reciente (orden del índice fecha_categoria)
+        orden = np.lexsort((indices, self.fecha[indices], grupo))
+        ultimos = orden[np.flatnonzero(np.diff(np.append(grupo[orden], -1)))]
+        ultimo_por_grupo = dict(zip(grupo[ultimos].tolist(), indices[ultimos].tolist()))
+
+        presentes = np.flatnonzero(apariciones)
+        with np.errstate(divide="ignore"):
+            score = apariciones[presentes] * 0.4 + fuentes[presentes] * 0.3 + 1000 / precio_min[presentes]
+
+        resultado = []
+        for i in _top_k(score, limit):
+            g = int(presentes[i])
+            resultado.append((
+                self.ids[ultimo_por_grupo[g]].tobytes(),
+                {
+                    "trending_score": float(score[i]),
+                    "apariciones": int(apariciones[g]),
+                    "fuentes_count": int(fuentes[g]),
+                    "precio_min_encontrado": float(precio_min[g]),
+                    "precio_promedio_encontrado": float(suma[g] / apariciones[g]),
+                },
+            ))
+        return resultado
+
+
+def _frescura(modelo: ModeloScoring, dias):
+    """Curva de frescura del modelo (ver scoring_models.DECAIMIENTOS)"""
+    tasa = modelo.tasa_decaimiento
+    with np.errstate(invalid="ignore", over="ignore"):
+        if modelo.decaimiento == "exponencial":
+            curva = np.exp(-tasa * dias)
+        elif modelo.decaimiento == "lineal":
+            curva = np.maximum(0, 1 - dias * tasa)
+        else:
+            curva = 1 / (1 + dias * tasa)
+        # Sin fecha Date, $lte null x es verdadero en Mongo: frescura 1.0
+        return np.where(np.isnan(dias) | (dias <= modelo.dias_gracia), 1.0, curva)
+
+
+def _top_k(score, limit: int):
+    """Posiciones de los `limit` mayores scores, de mayor a menor (empates por posición)"""
+    if limit < len(score):
+        candidatos = np.argpartition(-score, limit - 1)[:limit]
+        # argpartition no garantiza qué empatados en el corte entran: se completan por posición
+        corte = score[candidatos].min()
+        candidatos = np.union1d(np.flatnonzero(score > corte), np.flatnonzero(score == corte))
+    else:
+        candidatos = np.arange(len(score))
+    orden = np.lexsort((candidatos, -score[candidatos]))
+    return candidatos[orden][:limit]
+
+
+class MotorRankingSnapshot:
+    """
+    Mantiene el snapshot del proceso. Se construye siempre en un hilo (al
+    arrancar con precalentar, o en la primera consulta) y no dentro de la
+    request: mientras no existe, obtener retorna None y se usa el pipeline.
+
+    Cada ingesta en archivos incrementa una generación en la cache
+    compartida, así todos los workers se enteran, no solo el que ingestó.
+    Un snapshot de una generación anterior no se usa (obtener retorna None
+    y se responde con el pipeline, con datos al día) mientras se
+    reconstruye: la misma ingesta ya incrementó los tags de la cache de
+    respuestas, y un ranking viejo quedaría guardado con la versión nueva.
+    Vencido solo por RANKING_SNAPSHOT_TTL se sigue usando mientras se
+    reconstruye.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._snapshot: Optional[SnapshotCatalogo] = None
+        self._lock = threading.Lock()
+        self._reconstruyendo = False
+
+    def activo(self) -> bool:
+        return RANKING_ENGINE == "snapshot" and np is not None
+
+    def invalidar(self, coleccion, categorias=None, fuentes=None):
+        """Suscriptor de ingesta: una escritura en archivos incrementa la generación compartida"""
+        if coleccion != "archivos":
+            return
+        try:
+            cache.incr(CLAVE_GENERACION)
+        except ValueError:
+            if not cache.add(CLAVE_GENERACION, _semilla(), timeout=None):
+                cache.incr(CLAVE_GENERACION)
+        except Exception as e:
+            print(f"Error incrementando generación del snapshot de ranking: {e}")
+
+    def obtener(self, db) -> Optional[SnapshotCatalogo]:
+        """Snapshot al día con la generación compartida, o None (usar el pipeline de Mongo)"""
+        snapshot = self._snapshot
+        generacion = _generacion_actual()
+        if snapshot is None:
+            self._reconstruir_en_fondo(db)
+            return None
+
+        # Sin cache disponible (generacion None) solo limita el TTL
+        desactualizado = generacion is not None and snapshot.generacion != generacion
+        if desactualizado or time.monotonic() - snapshot.construido_en > self.ttl:
+            self._reconstruir_en_fondo(db)
+        return None if desactualizado else snapshot
+
+    def precalentar(self) -> None:
+        """Construye el snapshot en segundo plano al arrancar el worker (ver ApiConfig.ready)"""
+        if self.activo():
+            self._reconstruir_en_fondo(None)
+
+    def _reconstruir_en_fondo(self, db):
+        with self._lock:
+            if self._reconstruyendo:
+                return
+            self._reconstruyendo = True
+        # Fuera de la request: el hilo no hereda su deadline y usa el presupuesto "ranking_snapshot"
+        threading.Thread(target=self._reconstruir, args=(db,), name="ranking-snapshot", daemon=True).start()
+
+    def _reconstruir(self, db):
+        try:
+            db = db if db is not None else get_db()
+            if db is None:
+                return
+            # Se lee antes del recorrido: una ingesta durante la carga deja el snapshot desactualizado
+            generacion = _generacion_actual()
+            snapshot = SnapshotCatalogo.desde_mongo(db)
+            snapshot.generacion = generacion
+            self._snapshot = snapshot
+        except Exception as e:
+            print(f"Error reconstruyendo snapshot de ranking: {e}")
+        finally:
+            self._reconstruyendo = False
+
+    def estado(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        generacion = _generacion_actual()
+        return {
+            "activo": self.activo(),
+            "numpy": np is not None,
+            "productos": len(snapshot) if snapshot is not None else 0,
+            "edad_segundos": round(time.monotonic() - snapshot.construido_en, 1) if snapshot is not None else None,
+            "desactualizado": snapshot is not None and generacion is not None and snapshot.generacion != generacion,
+            "reconstruyendo": self._reconstruyendo,
+        }
+
+
+def _semilla() -> int:
+    # Si la clave se pierde (eviction, reinicio de Redis) vuelve con un valor
+    # que ningún snapshot tiene, así todos se reconstruyen
+    return time.time_ns()
+
+
+def _generacion_actual() -> Optional[int]:
+    """Generación compartida de archivos para el snapshot (None si la cache no responde)"""
+    try:
+        generacion = cache.get(CLAVE_GENERACION)
+        if generacion is None:
+            cache.add(CLAVE_GENERACION, _semilla(), timeout=None)
+            generacion = cache.get(CLAVE_GENERACION)
+        return generacion
+    except Exception as e:
+        print(f"Error leyendo generación del snapshot de ranking: {e}")
+        return None
+
+
+motor_snapshot = MotorRankingSnapshot(RANKING_SNAPSHOT_TTL)
+suscribir_ingesta(motor_snapshot.invalidar)
+
+if RANKING_ENGINE == "snapshot" and np is None:
+    print("⚠️  RANKING_ENGINE=snapshot requiere NumPy (pip install numpy); se usa el pipeline de Mongo")
+
+
+def ids_de(resultados: List[Tuple[bytes, Dict[str, Any]]]) -> List[ObjectId]:
+    """ObjectId de los resultados del snapshot, en orden de ranking"""
+    return [ObjectId(binario) for binario, _ in resultados]
+
+
+def combinar(docs: List[Dict[str, Any]], ids: List[ObjectId],
+             resultados: List[Tuple[bytes, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Documentos en orden de ranking con sus campos calculados (omite los borrados desde el snapshot)"""
+    por_id = {doc["_id"]: doc for doc in docs}
+    return [
+        {**por_id[oid], **campos}
+        for oid, (_, campos) in zip(ids, resultados)
+        if oid in por_id
+    ]
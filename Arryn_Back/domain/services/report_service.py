@@ -2,10 +2,18 @@
 Servicio para generación de reportes básicos entre tiendas
 """
 from typing import List, Dict, Any, Optional
-from .mongo_service import db, MONGO_AVAILABLE
+from .async_mongo_service import agregar
+from .circuit_breaker import consultar_protegido, consultar_protegido_async
+from .percentiles import recorrer_ordenado, recorrer_ordenado_async
+from .query_runner import ejecutar_agregacion, medir, opciones
+from .store_rollup_service import StoreRollupService
 from datetime import datetime, timedelta
 from collections import defaultdict
-import math
+from pymongo import ASCENDING
+
+# Percentiles del reporte y cortes de los rangos económico/medio/premium
+PERCENTILES_REPORTE = (25, 50, 75, 90)
+CORTES_RANGOS = (33, 66)
 
 
 class ReportService:
@@ -26,79 +34,41 @@ class ReportService:
         Returns:
             Reporte completo de comparación entre tiendas
         """
-        if not MONGO_AVAILABLE or db is None:
-            return _get_mock_store_report(categoria)
-        
-        try:
-            collection = db["archivos"]
-            start_date = datetime.now() - timedelta(days=days_back)
-            
-            # Filtro base
-            match_filter = {
-                "fecha_extraccion": {"$gte": start_date.strftime("%Y-%m-%d")},
-                "precio_valor": {"$exists": True, "$ne": None}
-            }
-            if categoria:
-                match_filter["categoria"] = categoria
-            
-            pipeline = [
-                {"$match": match_filter},
-                {
-                    "$group": {
-                        "_id": "$fuente",
-                        "total_productos": {"$sum": 1},
-                        "precio_promedio": {"$avg": "$precio_valor"},
-                        "precio_min": {"$min": "$precio_valor"},
-                        "precio_max": {"$max": "$precio_valor"},
-                        "categorias": {"$addToSet": "$categoria"},
-                        "marcas": {"$addToSet": "$marca"},
-                        "ultima_actualizacion": {"$max": "$fecha_extraccion"}
-                    }
-                },
-                {
-                    "$addFields": {
-                        "total_categorias": {"$size": "$categorias"},
-                        "total_marcas": {"$size": "$marcas"},
-                        "rango_precios": {"$subtract": ["$precio_max", "$precio_min"]}
-                    }
-                },
-                {"$sort": {"total_productos": -1}}
-            ]
-            
-            stores_data = list(collection.aggregate(pipeline))
-            
-            # Calcular estadísticas generales
-            total_productos = sum(store["total_productos"] for store in stores_data)
-            total_tiendas = len(stores_data)
-            
-            # Calcular mejor tienda por diferentes métricas
-            mejor_por_precio = min(stores_data, key=lambda x: x["precio_promedio"]) if stores_data else None
-            mejor_por_variedad = max(stores_data, key=lambda x: x["total_productos"]) if stores_data else None
-            
-            return {
-                "periodo_analisis": {
-                    "fecha_inicio": start_date.strftime("%Y-%m-%d"),
-                    "fecha_fin": datetime.now().strftime("%Y-%m-%d"),
-                    "dias_analizados": days_back
-                },
-                "resumen_general": {
-                    "total_tiendas": total_tiendas,
-                    "total_productos": total_productos,
-                    "categoria_filtro": categoria,
-                    "promedio_productos_por_tienda": round(total_productos / total_tiendas, 2) if total_tiendas > 0 else 0
-                },
-                "rankings": {
-                    "mejor_precio_promedio": mejor_por_precio,
-                    "mayor_variedad": mejor_por_variedad,
-                    "mas_actualizada": max(stores_data, key=lambda x: x["ultima_actualizacion"]) if stores_data else None
-                },
-                "detalle_tiendas": stores_data,
-                "generado_en": datetime.now().isoformat()
-            }
-            
-        except Exception as e:
-            print(f"Error en generate_store_comparison_report: {e}")
-            return _get_mock_store_report(categoria)
+        start_date = inicio_periodo(days_back)
+
+        def consulta(db):
+            if StoreRollupService.asegurar(db):
+                stores_data = StoreRollupService.tiendas(db, categoria, start_date)
+            else:
+                stores_data = ejecutar_agregacion(
+                    db["archivos"], _pipeline_tiendas(categoria, start_date), "store_comparison_report"
+                )
+            return _reporte_tiendas(stores_data, categoria, days_back, start_date)
+
+        return consultar_protegido(
+            ("store_comparison_report", categoria, days_back), consulta, lambda: _get_mock_store_report(categoria)
+        )
+
+    @staticmethod
+    async def generate_store_comparison_report_async(
+        categoria: Optional[str] = None,
+        days_back: int = 30
+    ) -> Dict[str, Any]:
+        """Versión asíncrona de generate_store_comparison_report para las vistas ASGI"""
+        start_date = inicio_periodo(days_back)
+
+        async def consulta(adb):
+            if await StoreRollupService.asegurar_async(adb):
+                stores_data = await StoreRollupService.tiendas_async(adb, categoria, start_date)
+            else:
+                stores_data = await agregar(
+                    adb["archivos"], _pipeline_tiendas(categoria, start_date), "store_comparison_report"
+                )
+            return _reporte_tiendas(stores_data, categoria, days_back, start_date)
+
+        return await consultar_protegido_async(
+            ("store_comparison_report", categoria, days_back), consulta, lambda: _get_mock_store_report(categoria)
+        )
     
     @staticmethod
     def generate_price_analysis_report(categoria: str, days_back: int = 30) -> Dict[str, Any]:
@@ -112,97 +82,245 @@ class ReportService:
         Returns:
             Reporte de análisis de precios
         """
-        if not MONGO_AVAILABLE or db is None:
-            return _get_mock_price_analysis(categoria)
-        
-        try:
+        start_date = inicio_periodo(days_back)
+
+        def consulta(db):
             collection = db["archivos"]
-            start_date = datetime.now() - timedelta(days=days_back)
-            
-            pipeline = [
-                {
-                    "$match": {
-                        "categoria": categoria,
-                        "fecha_extraccion": {"$gte": start_date.strftime("%Y-%m-%d")},
-                        "precio_valor": {"$exists": True, "$ne": None}
-                    }
-                },
-                {
-                    "$group": {
-                        "_id": None,
-                        "precio_promedio": {"$avg": "$precio_valor"},
-                        "precio_min": {"$min": "$precio_valor"},
-                        "precio_max": {"$max": "$precio_valor"},
-                        "total_productos": {"$sum": 1},
-                        "precios": {"$push": "$precio_valor"}
-                    }
-                },
-                {
-                    "$addFields": {
-                        "rango_precios": {"$subtract": ["$precio_max", "$precio_min"]},
-                        "precios_ordenados": {"$sortArray": {"input": "$precios", "sortBy": 1}}
-                    }
-                }
-            ]
-            
-            result = list(collection.aggregate(pipeline))
-            
+            result = ejecutar_agregacion(
+                collection, _pipeline_analisis_precios(categoria, start_date), "price_analysis_report"
+            )
             if not result:
-                return {"error": f"No se encontraron datos para la categoría {categoria}"}
-            
-            data = result[0]
-            precios = data["precios_ordenados"]
-            
-            # Calcular percentiles
-            def get_percentile(prices, percentile):
-                if not prices:
-                    return 0
-                k = (len(prices) - 1) * percentile / 100
-                f = math.floor(k)
-                c = math.ceil(k)
-                if f == c:
-                    return prices[int(k)]
-                return prices[int(f)] * (c - k) + prices[int(c)] * (k - f)
-            
-            # Análisis por rangos de precio
-            ranges = {
-                "economico": len([p for p in precios if p <= get_percentile(precios, 33)]),
-                "medio": len([p for p in precios if get_percentile(precios, 33) < p <= get_percentile(precios, 66)]),
-                "premium": len([p for p in precios if p > get_percentile(precios, 66)])
+                return _reporte_analisis_precios(result, None, categoria, days_back, start_date)
+
+            limites = opciones("price_analysis_distribution")
+            cursor = (collection
+                      .find(_filtro_analisis_precios(categoria, start_date), {"_id": 0, "precio_valor": 1})
+                      .sort("precio_valor", ASCENDING)
+                      .max_time_ms(limites["maxTimeMS"])
+                      .batch_size(limites["batchSize"]))
+            with medir("price_analysis_distribution"):
+                distribucion = recorrer_ordenado(
+                    (d["precio_valor"] for d in cursor), result[0]["total_productos"],
+                    PERCENTILES_REPORTE, CORTES_RANGOS
+                )
+            cursor.close()
+            return _reporte_analisis_precios(result, distribucion, categoria, days_back, start_date)
+
+        return consultar_protegido(
+            ("price_analysis_report", categoria, days_back), consulta, lambda: _get_mock_price_analysis(categoria)
+        )
+
+    @staticmethod
+    async def generate_price_analysis_report_async(categoria: str, days_back: int = 30) -> Dict[str, Any]:
+        """Versión asíncrona de generate_price_analysis_report para las vistas ASGI"""
+        start_date = inicio_periodo(days_back)
+
+        async def consulta(adb):
+            collection = adb["archivos"]
+            result = await agregar(
+                collection, _pipeline_analisis_precios(categoria, start_date), "price_analysis_report"
+            )
+            if not result:
+                return _reporte_analisis_precios(result, None, categoria, days_back, start_date)
+
+            limites = opciones("price_analysis_distribution")
+            cursor = (collection
+                      .find(_filtro_analisis_precios(categoria, start_date), {"_id": 0, "precio_valor": 1})
+                      .sort("precio_valor", ASCENDING)
+                      .max_time_ms(limites["maxTimeMS"])
+                      .batch_size(limites["batchSize"]))
+            with medir("price_analysis_distribution"):
+                distribucion = await recorrer_ordenado_async(
+                    (d["precio_valor"] async for d in cursor), result[0]["total_productos"],
+                    PERCENTILES_REPORTE, CORTES_RANGOS
+                )
+            await cursor.close()
+            return _reporte_analisis_precios(result, distribucion, categoria, days_back, start_date)
+
+        return await consultar_protegido_async(
+            ("price_analysis_report", categoria, days_back), consulta, lambda: _get_mock_price_analysis(categoria)
+        )
+
+
+def inicio_periodo(days_back: int, ahora: Optional[datetime] = None) -> datetime:
+    """
+    Inicio del día days_back días atrás (mismo corte que la antigua
+    comparación contra "%Y-%m-%d"). Lo usan también los rankings de ofertas.
+    """
+    return ((ahora or datetime.now()) - timedelta(days=days_back)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _pipeline_tiendas(categoria: Optional[str], start_date: datetime) -> List[Dict[str, Any]]:
+    """
+    Pipeline del reporte de comparación entre tiendas sobre archivos, para
+    mientras reporte_tiendas_diario no está construido. Da las mismas filas
+    que resumen_por_tienda (solo precios numéricos, sin categorías ni marcas
+    nulas, listas ordenadas).
+    """
+    match_filter = {
+        "fecha_extraccion": {"$gte": start_date},
+        "precio_valor": {"$type": "number"},
+        "fuente": {"$ne": None},
+    }
+    if categoria:
+        match_filter["categoria"] = categoria
+
+    return [
+        {"$match": match_filter},
+        {
+            "$group": {
+                "_id": "$fuente",
+                "total_productos": {"$sum": 1},
+                "precio_promedio": {"$avg": "$precio_valor"},
+                "precio_min": {"$min": "$precio_valor"},
+                "precio_max": {"$max": "$precio_valor"},
+                "categorias": {"$addToSet": "$categoria"},
+                "marcas": {"$addToSet": "$marca"},
+                "ultima_actualizacion": {"$max": "$fecha_extraccion"}
             }
-            
-            return {
-                "categoria": categoria,
-                "periodo_analisis": {
-                    "fecha_inicio": start_date.strftime("%Y-%m-%d"),
-                    "fecha_fin": datetime.now().strftime("%Y-%m-%d"),
-                    "dias_analizados": days_back
-                },
-                "estadisticas_generales": {
-                    "total_productos": data["total_productos"],
-                    "precio_promedio": round(data["precio_promedio"], 2),
-                    "precio_minimo": data["precio_min"],
-                    "precio_maximo": data["precio_max"],
-                    "rango_precios": round(data["rango_precios"], 2)
-                },
-                "percentiles": {
-                    "p25": round(get_percentile(precios, 25), 2),
-                    "p50_mediana": round(get_percentile(precios, 50), 2),
-                    "p75": round(get_percentile(precios, 75), 2),
-                    "p90": round(get_percentile(precios, 90), 2)
-                },
-                "distribucion_rangos": ranges,
-                "recomendaciones": {
-                    "precio_competitivo": round(get_percentile(precios, 25), 2),
-                    "precio_premium_aceptable": round(get_percentile(precios, 75), 2),
-                    "oportunidad_descuento": round(data["precio_promedio"] * 0.8, 2)
-                },
-                "generado_en": datetime.now().isoformat()
+        },
+        {
+            "$addFields": {
+                campo: {"$sortArray": {
+                    "input": {"$filter": {"input": f"${campo}", "cond": {"$ne": ["$$this", None]}}},
+                    "sortBy": 1,
+                }}
+                for campo in ("categorias", "marcas")
             }
-            
-        except Exception as e:
-            print(f"Error en generate_price_analysis_report: {e}")
-            return _get_mock_price_analysis(categoria)
+        },
+        {
+            "$addFields": {
+                "total_categorias": {"$size": "$categorias"},
+                "total_marcas": {"$size": "$marcas"},
+                "rango_precios": {"$subtract": ["$precio_max", "$precio_min"]}
+            }
+        },
+        {"$sort": {"total_productos": -1}}
+    ]
+
+
+def _reporte_tiendas(
+    stores_data: List[Dict[str, Any]],
+    categoria: Optional[str],
+    days_back: int,
+    start_date: datetime
+) -> Dict[str, Any]:
+    """Arma el reporte a partir de las filas por tienda (StoreRollupService.tiendas o _pipeline_tiendas)"""
+    # Calcular estadísticas generales
+    total_productos = sum(store["total_productos"] for store in stores_data)
+    total_tiendas = len(stores_data)
+
+    # Calcular mejor tienda por diferentes métricas
+    mejor_por_precio = min(stores_data, key=lambda x: x["precio_promedio"]) if stores_data else None
+    mejor_por_variedad = max(stores_data, key=lambda x: x["total_productos"]) if stores_data else None
+
+    return {
+        "periodo_analisis": {
+            "fecha_inicio": start_date.strftime("%Y-%m-%d"),
+            "fecha_fin": datetime.now().strftime("%Y-%m-%d"),
+            "dias_analizados": days_back
+        },
+        "resumen_general": {
+            "total_tiendas": total_tiendas,
+            "total_productos": total_productos,
+            "categoria_filtro": categoria,
+            "promedio_productos_por_tienda": round(total_productos / total_tiendas, 2) if total_tiendas > 0 else 0
+        },
+        "rankings": {
+            "mejor_precio_promedio": mejor_por_precio,
+            "mayor_variedad": mejor_por_variedad,
+            "mas_actualizada": max(stores_data, key=lambda x: x["ultima_actualizacion"]) if stores_data else None
+        },
+        "detalle_tiendas": stores_data,
+        "generado_en": datetime.now().isoformat()
+    }
+
+
+def _filtro_analisis_precios(categoria: str, start_date: datetime) -> Dict[str, Any]:
+    """Filtro común del resumen y del recorrido de precios del análisis"""
+    return {
+        "categoria": categoria,
+        "fecha_extraccion": {"$gte": start_date},
+        "precio_valor": {"$exists": True, "$ne": None}
+    }
+
+
+def _pipeline_analisis_precios(categoria: str, start_date: datetime) -> List[Dict[str, Any]]:
+    """
+    Pipeline del resumen del análisis de precios por categoría. Los
+    percentiles no salen de aquí (antes se hacía $push de todos los precios
+    en un único documento, con el límite de 16MB): se calculan recorriendo
+    los precios ordenados por el índice categoria_precio (ver percentiles.py).
+    """
+    return [
+        {"$match": _filtro_analisis_precios(categoria, start_date)},
+        {
+            "$group": {
+                "_id": None,
+                "precio_promedio": {"$avg": "$precio_valor"},
+                "precio_min": {"$min": "$precio_valor"},
+                "precio_max": {"$max": "$precio_valor"},
+                "total_productos": {"$sum": 1}
+            }
+        },
+        {
+            "$addFields": {
+                "rango_precios": {"$subtract": ["$precio_max", "$precio_min"]}
+            }
+        }
+    ]
+
+
+def _reporte_analisis_precios(
+    result: List[Dict[str, Any]],
+    distribucion: Optional[Dict[str, Dict[float, Any]]],
+    categoria: str,
+    days_back: int,
+    start_date: datetime
+) -> Dict[str, Any]:
+    """Arma el reporte a partir del resumen de _pipeline_analisis_precios y del recorrido ordenado"""
+    if not result:
+        return {"error": f"No se encontraron datos para la categoría {categoria}"}
+
+    data = result[0]
+    percentiles = distribucion["percentiles"]
+    hasta_corte = distribucion["hasta_corte"]
+
+    # Análisis por rangos de precio (<= p33, hasta p66, > p66)
+    ranges = {
+        "economico": hasta_corte[33],
+        "medio": hasta_corte[66] - hasta_corte[33],
+        "premium": data["total_productos"] - hasta_corte[66]
+    }
+
+    return {
+        "categoria": categoria,
+        "periodo_analisis": {
+            "fecha_inicio": start_date.strftime("%Y-%m-%d"),
+            "fecha_fin": datetime.now().strftime("%Y-%m-%d"),
+            "dias_analizados": days_back
+        },
+        "estadisticas_generales": {
+            "total_productos": data["total_productos"],
+            "precio_promedio": round(data["precio_promedio"], 2),
+            "precio_minimo": data["precio_min"],
+            "precio_maximo": data["precio_max"],
+            "rango_precios": round(data["rango_precios"], 2)
+        },
+        "percentiles": {
+            "p25": round(percentiles[25], 2),
+            "p50_mediana": round(percentiles[50], 2),
+            "p75": round(percentiles[75], 2),
+            "p90": round(percentiles[90], 2)
+        },
+        "distribucion_rangos": ranges,
+        "recomendaciones": {
+            "precio_competitivo": round(percentiles[25], 2),
+            "precio_premium_aceptable": round(percentiles[75], 2),
+            "oportunidad_descuento": round(data["precio_promedio"] * 0.8, 2)
+        },
+        "generado_en": datetime.now().isoformat()
+    }
 
 
 def _get_mock_store_report(categoria: Optional[str]) -> Dict[str, Any]:
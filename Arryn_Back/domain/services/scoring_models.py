@@ -0,0 +1,241 @@
+"""
+Servicio de modelos de scoring para el ranking de ofertas por valor
+"""
+import json
+import os
+from typing import List, Dict, Any, Iterable, Optional
+
+# Curvas de frescura según los días desde la extracción (d). Hasta
+# dias_gracia, o sin fecha Date, la frescura es 1.0 en todas.
+#   hiperbolico: 1 / (1 + d x tasa)
+#   exponencial: e^(-tasa x d)
+#   lineal: max(0, 1 - d x tasa)
+DECAIMIENTOS = ("hiperbolico", "exponencial", "lineal")
+# Factores del vector de preferencias de un usuario
+FACTORES_PREFERENCIA = ("marca", "categoria", "precio")
+
+CAMPO_DIAS = "$dias_desde_extraccion"
+
+
+class ModeloScoring:
+    """
+    Modelo de scoring de rank_offers_by_value:
+
+        score_total = peso_precio x score_precio
+                    + peso_frescura x score_freshness (curva `decaimiento`)
+                    + boost de la marca (boost_marcas)
+                    + pesos_preferencias[f] por cada factor f del usuario que cumple la oferta
+
+    Las expresiones de agregación de la parte fija se compilan al crear el
+    modelo; por request solo se agregan los términos de preferencias, así
+    que un ranking personalizado sigue siendo una sola agregación sobre los
+    candidatos. El motor snapshot evalúa los mismos términos con NumPy.
+    """
+
+    def __init__(
+        self,
+        nombre: str,
+        peso_precio: float = 0.6,
+        peso_frescura: float = 0.4,
+        decaimiento: str = "hiperbolico",
+        tasa_decaimiento: float = 0.1,
+        dias_gracia: float = 1,
+        boost_marcas: Optional[Dict[str, float]] = None,
+        pesos_preferencias: Optional[Dict[str, float]] = None,
+        descripcion: str = ""
+    ):
+        if decaimiento not in DECAIMIENTOS:
+            raise ValueError(f"Decaimiento inválido: {decaimiento} (opciones: {', '.join(DECAIMIENTOS)})")
+        pesos_preferencias = pesos_preferencias or {}
+        invalidos = set(pesos_preferencias) - set(FACTORES_PREFERENCIA)
+        if invalidos:
+            raise ValueError(f"Factores de preferencia inválidos: {', '.join(sorted(invalidos))}")
+
+        self.nombre = nombre
+        self.peso_precio = float(peso_precio)
+        self.peso_frescura = float(peso_frescura)
+        self.decaimiento = decaimiento
+        self.tasa_decaimiento = float(tasa_decaimiento)
+        self.dias_gracia = float(dias_gracia)
+        self.boost_marcas = {str(marca).upper(): float(boost) for marca, boost in (boost_marcas or {}).items()}
+        self.pesos_preferencias = {f: float(p) for f, p in pesos_preferencias.items() if p}
+        self.descripcion = descripcion
+
+        self._frescura = self._compilar_frescura()
+        self._terminos_base = self._compilar_terminos_base()
+
+    def _compilar_frescura(self) -> Dict[str, Any]:
+        tasa = self.tasa_decaimiento
+        if self.decaimiento == "exponencial":
+            curva = {"$exp": {"$multiply": [-tasa, CAMPO_DIAS]}}
+        elif self.decaimiento == "lineal":
+            curva = {"$max": [0, {"$subtract": [1, {"$multiply": [CAMPO_DIAS, tasa]}]}]}
+        else:
+            curva = {"$divide": [1, {"$add": [1, {"$multiply": [CAMPO_DIAS, tasa]}]}]}
+        # Sin fecha Date, $lte null x es verdadero: frescura 1.0
+        return {"$cond": {"if": {"$lte": [CAMPO_DIAS, self.dias_gracia]}, "then": 1.0, "else": curva}}
+
+    def _compilar_terminos_base(self) -> List[Dict[str, Any]]:
+        terminos = [
+            {"$multiply": ["$score_precio", self.peso_precio]},
+            {"$multiply": ["$score_freshness", self.peso_frescura]},
+        ]
+        if self.boost_marcas:
+            terminos.append({"$switch": {
+                "branches": [
+                    {"case": {"$eq": [{"$toUpper": "$marca"}, marca]}, "then": boost}
+                    for marca, boost in sorted(self.boost_marcas.items())
+                ],
+                "default": 0,
+            }})
+        return terminos
+
+    def etapa_frescura(self) -> Dict[str, Any]:
+        """$addFields de score_freshness (requiere dias_desde_extraccion)"""
+        return {"$addFields": {"score_freshness": self._frescura}}
+
+    def etapa_score(self, preferencias: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """$addFields de score_total (requiere score_precio y score_freshness)"""
+        return {"$addFields": {"score_total": {"$add": self._terminos_base + self._terminos_preferencias(preferencias)}}}
+
+    def _terminos_preferencias(self, preferencias: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        terminos = []
+        for factor, peso in self.factores_activos(preferencias):
+            if factor == "marca":
+                condicion = {"$in": [{"$toUpper": "$marca"}, sorted(preferencias["marcas"])]}
+            elif factor == "categoria":
+                condicion = {"$in": ["$categoria", sorted(preferencias["categorias"])]}
+            else:
+                condicion = {"$and": [
+                    {operador: ["$precio_valor", preferencias[limite]]}
+                    for limite, operador in (("precio_min", "$gte"), ("precio_max", "$lte"))
+                    if limite in preferencias
+                ]}
+            terminos.append({"$cond": [condicion, peso, 0]})
+        return terminos
+
+    def factores_activos(self, preferencias: Optional[Dict[str, Any]]) -> List[tuple]:
+        """(factor, peso) del modelo que el vector de preferencias permite evaluar"""
+        if not preferencias:
+            return []
+        return [
+            (factor, self.pesos_preferencias[factor])
+            for factor in FACTORES_PREFERENCIA
+            if factor in self.pesos_preferencias and _tiene_factor(preferencias, factor)
+        ]
+
+    def personaliza(self, preferencias: Optional[Dict[str, Any]]) -> bool:
+        """Si las preferencias del usuario (sin normalizar) cambian el score con este modelo"""
+        return bool(self.factores_activos(vector_preferencias(preferencias)))
+
+    def describir(self) -> Dict[str, Any]:
+        return {
+            "nombre": self.nombre,
+            "descripcion": self.descripcion,
+            "peso_precio": self.peso_precio,
+            "peso_frescura": self.peso_frescura,
+            "decaimiento": self.decaimiento,
+            "tasa_decaimiento": self.tasa_decaimiento,
+            "dias_gracia": self.dias_gracia,
+            "boost_marcas": self.boost_marcas,
+            "pesos_preferencias": self.pesos_preferencias,
+        }
+
+
+def _tiene_factor(preferencias: Dict[str, Any], factor: str) -> bool:
+    if factor == "marca":
+        return bool(preferencias.get("marcas"))
+    if factor == "categoria":
+        return bool(preferencias.get("categorias"))
+    return "precio_min" in preferencias or "precio_max" in preferencias
+
+
+def vector_preferencias(preferencias: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Normaliza preferencias de usuario (marcas_favoritas, categorias_favoritas,
+    precio_min, precio_max: las mismas claves que usa BestPricesView) al
+    vector que evalúan los modelos. Retorna None si no queda ningún factor.
+    """
+    if not preferencias:
+        return None
+    vector: Dict[str, Any] = {}
+    marcas = frozenset(str(m).upper() for m in preferencias.get("marcas_favoritas") or [])
+    categorias = frozenset(preferencias.get("categorias_favoritas") or [])
+    if marcas:
+        vector["marcas"] = marcas
+    if categorias:
+        vector["categorias"] = categorias
+    for limite in ("precio_min", "precio_max"):
+        if preferencias.get(limite) is not None:
+            vector[limite] = float(preferencias[limite])
+    return vector or None
+
+
+def clave_preferencias(vector: Optional[Dict[str, Any]]) -> Optional[tuple]:
+    """Representación estable del vector para claves de caché"""
+    if not vector:
+        return None
+    return tuple(
+        (campo, tuple(sorted(valor)) if isinstance(valor, frozenset) else valor)
+        for campo, valor in sorted(vector.items())
+    )
+
+
+MODELOS: Dict[str, ModeloScoring] = {}
+
+
+def registrar_modelo(modelo: ModeloScoring) -> None:
+    MODELOS[modelo.nombre] = modelo
+
+
+def obtener_modelo(nombre: Optional[str] = None) -> ModeloScoring:
+    """Modelo registrado con ese nombre (el por defecto si es None); ValueError si no existe"""
+    modelo = MODELOS.get(nombre or RANKING_DEFAULT_MODEL)
+    if modelo is None:
+        raise ValueError(f"Modelo de scoring desconocido: {nombre} (opciones: {', '.join(sorted(MODELOS))})")
+    return modelo
+
+
+def modelos_disponibles() -> List[Dict[str, Any]]:
+    return [MODELOS[nombre].describir() for nombre in sorted(MODELOS)]
+
+
+def _cargar_modelos(configuracion: str, modelos: Iterable[ModeloScoring]) -> None:
+    for modelo in modelos:
+        registrar_modelo(modelo)
+    if not configuracion:
+        return
+    # RANKING_MODELS='{"nombre": {"peso_precio": 0.5, "decaimiento": "exponencial", ...}}'
+    try:
+        definiciones = json.loads(configuracion)
+    except ValueError as e:
+        print(f"⚠️  RANKING_MODELS no es JSON válido: {e}")
+        return
+    for nombre, parametros in definiciones.items():
+        try:
+            registrar_modelo(ModeloScoring(nombre, **parametros))
+        except (TypeError, ValueError) as e:
+            print(f"⚠️  Modelo de scoring '{nombre}' inválido en RANKING_MODELS: {e}")
+
+
+_cargar_modelos(os.getenv("RANKING_MODELS", ""), [
+    # El ranking histórico de la API: 60% precio, 40% frescura
+    ModeloScoring("valor", descripcion="60% precio contra la categoría, 40% frescura"),
+    ModeloScoring(
+        "precio", peso_precio=0.85, peso_frescura=0.15,
+        descripcion="Prioriza el precio; la frescura solo desempata",
+    ),
+    ModeloScoring(
+        "reciente", peso_precio=0.3, peso_frescura=0.7, decaimiento="exponencial", tasa_decaimiento=0.3,
+        descripcion="Prioriza ofertas extraídas en los últimos días",
+    ),
+    ModeloScoring(
+        "personalizado", pesos_preferencias={"marca": 0.2, "categoria": 0.1, "precio": 0.15},
+        descripcion="Modelo valor más las marcas, categorías y rango de precios preferidos del usuario",
+    ),
+])
+
+RANKING_DEFAULT_MODEL = os.getenv("RANKING_DEFAULT_MODEL", "valor")
+if RANKING_DEFAULT_MODEL not in MODELOS:
+    print(f"⚠️  RANKING_DEFAULT_MODEL={RANKING_DEFAULT_MODEL} no existe; se usa 'valor'")
+    RANKING_DEFAULT_MODEL = "valor"
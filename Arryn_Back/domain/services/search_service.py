@@ -0,0 +1,66 @@
+"""
+Servicio de búsqueda de productos sobre el índice de texto de 'archivos'
+"""
+import os
+import re
+import unicodedata
+from typing import List, Dict, Any
+from .mongo_service import get_db
+from .query_runner import ejecutar_busqueda
+
+
+MAX_TERMINOS = 8
+MAX_RESULTADOS = int(os.getenv("SEARCH_MAX_RESULTS", 200))
+_NO_ALFANUMERICO = re.compile(r"[^a-z0-9]+")
+
+
+def normalizar_texto(texto: str) -> str:
+    """Minúsculas, sin tildes y solo caracteres alfanuméricos separados por un espacio"""
+    if not isinstance(texto, str):
+        return ""
+    sin_tildes = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("ascii")
+    return _NO_ALFANUMERICO.sub(" ", sin_tildes.lower()).strip()
+
+
+def consulta_texto(query: str) -> str:
+    """
+    Construye el $search de Mongo: cada término va entre comillas para que
+    todos sean obligatorios (AND) en lugar del OR por defecto. El texto del
+    usuario nunca se interpreta como regex.
+    """
+    terminos = normalizar_texto(query).split()[:MAX_TERMINOS]
+    return " ".join(f'"{termino}"' for termino in terminos)
+
+
+class ProductSearchService:
+    """Servicio de búsqueda de productos por título"""
+
+    @staticmethod
+    def match_busqueda(query: str) -> Dict[str, Any]:
+        """Filtro $match que usa el índice de texto sobre titulo_normalizado"""
+        return {"$text": {"$search": consulta_texto(query)}}
+
+    @staticmethod
+    def buscar(query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Busca productos por título, ordenados por relevancia (textScore)
+
+        Args:
+            query: Texto libre a buscar
+            limit: Número máximo de resultados
+
+        Returns:
+            Lista de productos con su score_busqueda
+        """
+        db = get_db()
+        if db is None or not consulta_texto(query):
+            return []
+
+        cursor = (db["archivos"]
+                  .find(ProductSearchService.match_busqueda(query), {"score_busqueda": {"$meta": "textScore"}})
+                  .sort([("score_busqueda", {"$meta": "textScore"})])
+                  .limit(min(int(limit), MAX_RESULTADOS)))
+        docs = ejecutar_busqueda(cursor, "search")
+        for d in docs:
+            d["_id"] = str(d["_id"])
+        return docs
@@ -0,0 +1,309 @@
+"""
+Servicio de acumulados diarios por tienda y categoría para el reporte de comparación entre tiendas
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Iterable, Optional, Set, Tuple
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
+from .mongo_service import get_db
+from .async_mongo_service import buscar
+from .query_runner import ejecutar_busqueda, medir, opciones
+
+
+ROLLUP_COLLECTION = "reporte_tiendas_diario"
+ROLLUP_ON_INGEST = os.getenv("STORE_ROLLUP_ON_INGEST", "True").lower() in ("true", "1", "yes")
+# Documento que indica que la colección ya se construyó completa al menos una vez
+MARCA_RECONSTRUCCION = "reconstruccion_completa"
+# Bloqueo compartido (cache) para que un solo proceso haga la reconstrucción inicial;
+# vence solo si el proceso muere a mitad de la reconstrucción
+CLAVE_BLOQUEO = "store_rollup_reconstruccion"
+BLOQUEO_TIMEOUT = 1800
+CAMPOS_ROLLUP = {"_id": 0, "fuente": 1, "categoria": 1, "marca": 1, "precio_valor": 1, "fecha_extraccion": 1}
+
+# (dia, fuente, categoria)
+Clave = Tuple[datetime, str, Optional[str]]
+
+
+def inicio_dia(fecha: datetime) -> datetime:
+    return fecha.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def clave_rollup(doc: Dict[str, Any]) -> Optional[Clave]:
+    """
+    Bucket del documento, o None si no entra en el reporte: sin fuente,
+    sin fecha_extraccion Date (la ventana del reporte compara fechas) o sin
+    precio numérico.
+    """
+    fuente = doc.get("fuente")
+    fecha = doc.get("fecha_extraccion")
+    precio = doc.get("precio_valor")
+    if fuente is None or not isinstance(fecha, datetime):
+        return None
+    if isinstance(precio, bool) or not isinstance(precio, (int, float)):
+        return None
+    return inicio_dia(fecha), fuente, doc.get("categoria")
+
+
+def claves_de(docs: Iterable[Dict[str, Any]]) -> Set[Clave]:
+    """Buckets a los que pertenecen los documentos"""
+    return {clave for clave in map(clave_rollup, docs) if clave is not None}
+
+
+def acumular(docs: Iterable[Dict[str, Any]]) -> Dict[Clave, Dict[str, Any]]:
+    """Suma los documentos por bucket: total, suma, mínimo, máximo, marcas y última extracción"""
+    buckets: Dict[Clave, Dict[str, Any]] = {}
+    for doc in docs:
+        clave = clave_rollup(doc)
+        if clave is None:
+            continue
+        precio = doc["precio_valor"]
+        bucket = buckets.get(clave)
+        if bucket is None:
+            bucket = buckets[clave] = {
+                "total": 0, "suma": 0, "precio_min": precio, "precio_max": precio,
+                "marcas": set(), "ultima_extraccion": doc["fecha_extraccion"],
+            }
+        bucket["total"] += 1
+        bucket["suma"] += precio
+        bucket["precio_min"] = min(bucket["precio_min"], precio)
+        bucket["precio_max"] = max(bucket["precio_max"], precio)
+        bucket["ultima_extraccion"] = max(bucket["ultima_extraccion"], doc["fecha_extraccion"])
+        if doc.get("marca") is not None:
+            bucket["marcas"].add(doc["marca"])
+    return buckets
+
+
+def _filtro_clave(clave: Clave) -> Dict[str, Any]:
+    dia, fuente, categoria = clave
+    return {"dia": dia, "fuente": fuente, "categoria": categoria}
+
+
+def _documento(clave: Clave, bucket: Dict[str, Any], ahora: datetime) -> Dict[str, Any]:
+    return {**_filtro_clave(clave), **bucket, "marcas": sorted(bucket["marcas"], key=str), "actualizado_en": ahora}
+
+
+def resumen_por_tienda(buckets: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Combina los buckets diarios de la ventana en una fila por tienda, con
+    los mismos campos que antes devolvía el $group sobre los productos.
+    """
+    tiendas: Dict[str, Dict[str, Any]] = {}
+    for bucket in buckets:
+        tienda = tiendas.get(bucket["fuente"])
+        if tienda is None:
+            tienda = tiendas[bucket["fuente"]] = {
+                "_id": bucket["fuente"], "total_productos": 0, "suma": 0,
+                "precio_min": bucket["precio_min"], "precio_max": bucket["precio_max"],
+                "categorias": set(), "marcas": set(), "ultima_actualizacion": bucket["ultima_extraccion"],
+            }
+        tienda["total_productos"] += bucket["total"]
+        tienda["suma"] += bucket["suma"]
+        tienda["precio_min"] = min(tienda["precio_min"], bucket["precio_min"])
+        tienda["precio_max"] = max(tienda["precio_max"], bucket["precio_max"])
+        tienda["ultima_actualizacion"] = max(tienda["ultima_actualizacion"], bucket["ultima_extraccion"])
+        if bucket.get("categoria") is not None:
+            tienda["categorias"].add(bucket["categoria"])
+        tienda["marcas"].update(bucket.get("marcas", []))
+
+    resultado = []
+    for tienda in tiendas.values():
+        suma = tienda.pop("suma")
+        tienda["precio_promedio"] = suma / tienda["total_productos"]
+        tienda["categorias"] = sorted(tienda["categorias"], key=str)
+        tienda["marcas"] = sorted(tienda["marcas"], key=str)
+        tienda["total_categorias"] = len(tienda["categorias"])
+        tienda["total_marcas"] = len(tienda["marcas"])
+        tienda["rango_precios"] = tienda["precio_max"] - tienda["precio_min"]
+        resultado.append(tienda)
+    return sorted(resultado, key=lambda t: t["total_productos"], reverse=True)
+
+
+def filtro_ventana(categoria: Optional[str], start_date: datetime) -> Dict[str, Any]:
+    filtro: Dict[str, Any] = {"dia": {"$gte": inicio_dia(start_date)}}
+    if categoria:
+        filtro["categoria"] = categoria
+    return filtro
+
+
+class StoreRollupService:
+    """
+    Servicio para mantener la colección reporte_tiendas_diario: un documento
+    por (día de fecha_extraccion, fuente, categoría) con total, suma, mínimo
+    y máximo de precio_valor, marcas distintas y última extracción. El
+    reporte de tiendas suma los buckets de la ventana en lugar de recorrer
+    los productos, así que su costo depende de días x tiendas x categorías.
+    """
+
+    @staticmethod
+    def aplicar_deltas(docs: Iterable[Dict[str, Any]]) -> int:
+        """
+        Suma documentos recién insertados (modo insert, append) a sus
+        buckets con $inc/$min/$max/$addToSet. No sirve para documentos que
+        reemplazan a otros (ver recalcular).
+
+        Returns:
+            Número de buckets actualizados
+        """
+        db = get_db()
+        if db is None:
+            return 0
+
+        ahora = datetime.now()
+        operaciones = [
+            UpdateOne(
+                _filtro_clave(clave),
+                {
+                    "$inc": {"total": bucket["total"], "suma": bucket["suma"]},
+                    "$min": {"precio_min": bucket["precio_min"]},
+                    "$max": {"precio_max": bucket["precio_max"], "ultima_extraccion": bucket["ultima_extraccion"]},
+                    "$addToSet": {"marcas": {"$each": sorted(bucket["marcas"], key=str)}},
+                    "$set": {"actualizado_en": ahora},
+                },
+                upsert=True,
+            )
+            for clave, bucket in acumular(docs).items()
+        ]
+        if operaciones:
+            db[ROLLUP_COLLECTION].bulk_write(operaciones, ordered=False)
+        return len(operaciones)
+
+    @staticmethod
+    def recalcular(claves: Iterable[Clave]) -> int:
+        """
+        Recalcula desde archivos los buckets indicados (upsert y
+        deduplicación, donde un snapshot reemplaza o elimina a otro). Solo
+        se leen los productos de esos días, tiendas y categorías.
+
+        Returns:
+            Número de buckets recalculados
+        """
+        db = get_db()
+        claves = {clave for clave in claves if clave is not None}
+        if db is None or not claves:
+            return 0
+
+        filtro = {"$or": [
+            {
+                "fuente": fuente,
+                "categoria": categoria,
+                "fecha_extraccion": {"$gte": dia, "$lt": dia + timedelta(days=1)},
+            }
+            for dia, fuente, categoria in claves
+        ]}
+        cursor = db["archivos"].find(filtro, CAMPOS_ROLLUP)
+        buckets = acumular(ejecutar_busqueda(cursor, "store_rollup"))
+
+        ahora = datetime.now()
+        operaciones = [
+            ReplaceOne(_filtro_clave(clave), _documento(clave, buckets[clave], ahora), upsert=True)
+            if clave in buckets else DeleteOne(_filtro_clave(clave))
+            for clave in claves
+        ]
+        db[ROLLUP_COLLECTION].bulk_write(operaciones, ordered=False)
+        return len(operaciones)
+
+    @staticmethod
+    def reconstruir(desde: Optional[datetime] = None) -> int:
+        """
+        Reconstruye los buckets desde `desde` (todos si es None) con una
+        pasada sobre archivos. Para el primer despliegue y después de
+        migraciones que cambian fechas o precios fuera de la ingesta.
+
+        Returns:
+            Número de buckets escritos
+        """
+        db = get_db()
+        if db is None:
+            return 0
+
+        filtro_archivos: Dict[str, Any] = {"fecha_extraccion": {"$type": "date"}}
+        filtro_rollup: Dict[str, Any] = {"dia": {"$type": "date"}}
+        if desde is not None:
+            filtro_archivos["fecha_extraccion"]["$gte"] = inicio_dia(desde)
+            filtro_rollup["dia"]["$gte"] = inicio_dia(desde)
+
+        limites = opciones("store_rollup_rebuild")
+        cursor = (db["archivos"]
+                  .find(filtro_archivos, CAMPOS_ROLLUP)
+                  .max_time_ms(limites["maxTimeMS"])
+                  .batch_size(limites["batchSize"]))
+        with medir("store_rollup_rebuild"):
+            buckets = acumular(cursor)
+
+        ahora = datetime.now()
+        rollup = db[ROLLUP_COLLECTION]
+        # Upserts en lugar de borrar e insertar: una ingesta o una reconstrucción
+        # concurrente no choca con el índice único de los buckets
+        obsoletos = [
+            DeleteOne({"_id": doc["_id"]})
+            for doc in rollup.find(filtro_rollup, {"dia": 1, "fuente": 1, "categoria": 1})
+            if (doc["dia"], doc.get("fuente"), doc.get("categoria")) not in buckets
+        ]
+        operaciones = obsoletos + [
+            ReplaceOne(_filtro_clave(clave), _documento(clave, bucket, ahora), upsert=True)
+            for clave, bucket in buckets.items()
+        ]
+        if operaciones:
+            rollup.bulk_write(operaciones, ordered=False)
+        if desde is None:
+            rollup.replace_one({"_id": MARCA_RECONSTRUCCION}, {"reconstruido_en": ahora}, upsert=True)
+        return len(buckets)
+
+    @staticmethod
+    def asegurar(db) -> bool:
+        """
+        Indica si los acumulados ya se construyeron completos al menos una
+        vez (rebuild_store_rollups al desplegar). Si no, lanza la
+        reconstrucción en un hilo (un solo proceso a la vez) y retorna
+        False: mientras tanto el reporte se calcula desde archivos.
+        """
+        if db[ROLLUP_COLLECTION].count_documents({"_id": MARCA_RECONSTRUCCION}, limit=1):
+            return True
+        _reconstruir_en_fondo()
+        return False
+
+    @staticmethod
+    async def asegurar_async(adb) -> bool:
+        """Versión asíncrona de asegurar"""
+        if await adb[ROLLUP_COLLECTION].count_documents({"_id": MARCA_RECONSTRUCCION}, limit=1):
+            return True
+        await sync_to_async(_reconstruir_en_fondo, thread_sensitive=False)()
+        return False
+
+    @staticmethod
+    def tiendas(db, categoria: Optional[str], start_date: datetime) -> List[Dict[str, Any]]:
+        """Filas por tienda de la ventana, a partir de los buckets"""
+        cursor = db[ROLLUP_COLLECTION].find(filtro_ventana(categoria, start_date), {"_id": 0})
+        return resumen_por_tienda(ejecutar_busqueda(cursor, "store_comparison_report"))
+
+    @staticmethod
+    async def tiendas_async(adb, categoria: Optional[str], start_date: datetime) -> List[Dict[str, Any]]:
+        """Versión asíncrona de tiendas"""
+        cursor = adb[ROLLUP_COLLECTION].find(filtro_ventana(categoria, start_date), {"_id": 0})
+        return resumen_por_tienda(await buscar(cursor, "store_comparison_report"))
+
+
+def _reconstruir_en_fondo() -> None:
+    try:
+        if not cache.add(CLAVE_BLOQUEO, True, BLOQUEO_TIMEOUT):
+            return
+    except Exception as e:
+        print(f"Error tomando el bloqueo de reconstrucción de {ROLLUP_COLLECTION}: {e}")
+        return
+    threading.Thread(target=_reconstruir_y_liberar, name="store-rollup-rebuild", daemon=True).start()
+
+
+def _reconstruir_y_liberar() -> None:
+    try:
+        buckets = StoreRollupService.reconstruir()
+        print(f"✅ {ROLLUP_COLLECTION} construido: {buckets} acumulados diarios")
+    except Exception as e:
+        print(f"Error reconstruyendo {ROLLUP_COLLECTION}: {e}")
+    finally:
+        try:
+            cache.delete(CLAVE_BLOQUEO)
+        except Exception as e:
+            print(f"Error liberando el bloqueo de reconstrucción de {ROLLUP_COLLECTION}: {e}")
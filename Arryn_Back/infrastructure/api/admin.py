@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User
+from .models import User, UserPreference
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
@@ -7,3 +7,9 @@ class UserAdmin(admin.ModelAdmin):
     list_filter = ('is_active', 'is_staff', 'date_joined')
     search_fields = ('username', 'email')
     ordering = ('-date_joined',)
+
+
+@admin.register(UserPreference)
+class UserPreferenceAdmin(admin.ModelAdmin):
+    list_display = ('user', 'precio_min', 'precio_max', 'actualizado_en')
+    search_fields = ('user__username',)
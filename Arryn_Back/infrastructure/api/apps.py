@@ -1,6 +1,57 @@
+import logging
+import os
+import threading
+
 from django.apps import AppConfig
 
+logger = logging.getLogger('arryn')
+
+
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Arryn_Back.infrastructure.api'  # ruta completa del paquete
-    label = 'api'  
\ No newline at end of file
+    label = 'api'
+
+    def ready(self):
+        # Invalidar la cache de respuestas cuando cambian los productos
+        from ...domain.services.events import suscribir_ingesta
+        from ..cache.tags import invalidar_por_ingesta
+        suscribir_ingesta(invalidar_por_ingesta)
+
+        # Preferencias de usuario: borrar la lectura cacheada y las respuestas personalizadas
+        from django.db.models.signals import post_delete, post_save
+        from .models import UserPreference
+        post_save.connect(_preferencias_cambiadas, sender=UserPreference, dispatch_uid="preferencias_guardadas")
+        post_delete.connect(_preferencias_cambiadas, sender=UserPreference, dispatch_uid="preferencias_eliminadas")
+
+        # Motor de ranking en memoria (RANKING_ENGINE=snapshot): carga inicial en segundo plano
+        from ...domain.services.ranking_snapshot_service import motor_snapshot
+        motor_snapshot.precalentar()
+
+        # Crear índices de Mongo al arrancar (opcional, en segundo plano para no bloquear el arranque)
+        if os.getenv("MONGO_ENSURE_INDEXES_ON_STARTUP", "False").lower() in ("true", "1", "yes"):
+            threading.Thread(target=_asegurar_indices, name="ensure-mongo-indexes", daemon=True).start()
+
+
+def _preferencias_cambiadas(sender, instance, **kwargs):
+    from django.db import transaction
+    from .preferences import UserPreferenceService
+    from ..cache.tags import invalidar, tag_usuario
+
+    def invalidar_usuario():
+        UserPreferenceService.invalidar(instance.user_id)
+        invalidar([tag_usuario(instance.user_id)])
+
+    # Después del commit: antes, una lectura concurrente volvería a cachear los valores anteriores
+    transaction.on_commit(invalidar_usuario)
+
+
+def _asegurar_indices():
+    from ...domain.services.mongo_indexes import asegurar_indices
+
+    try:
+        creados = [i["nombre"] for i in asegurar_indices() if i["estado"] == "creado"]
+        if creados:
+            logger.info(f"Índices de Mongo creados: {', '.join(creados)}")
+    except Exception as e:
+        logger.error(f"No se pudieron asegurar los índices de Mongo: {e}")
@@ -0,0 +1,203 @@
+"""
+Vistas asíncronas (ASGI) de los endpoints respaldados por Mongo.
+
+Mismos parámetros y respuestas que sus equivalentes en views.py, pero la
+E/S con Mongo usa AsyncMongoClient y no bloquea al worker mientras corre una
+agregación. Se enrutan en lugar de las síncronas con ASYNC_VIEWS_ENABLED=True
+y deben servirse con un servidor ASGI (uvicorn); ver config/asgi.py.
+
+Son APIView de adrf (DRF asíncrono): pasan por la misma negociación de
+contenido, renderers y manejo de excepciones de DRF que las síncronas.
+"""
+from adrf.views import APIView
+from asgiref.sync import sync_to_async
+from rest_framework import status
+from rest_framework.response import Response
+
+from .preferences import UserPreferenceService
+from ...domain.services.async_mongo_service import (
+    obtener_marcas_async,
+    obtener_por_categoria_ordenado_async,
+)
+from ...domain.services.circuit_breaker import MongoNoDisponible
+from ...domain.services.ranking_service import OfferRankingService
+from ...domain.services.report_service import ReportService
+from ...domain.services.scoring_models import MODELOS, obtener_modelo
+
+
+def _respuesta(data, status_code=status.HTTP_200_OK):
+    return Response(data, status=status_code)
+
+
+def _mongo_no_disponible(error: MongoNoDisponible):
+    return Response(
+        {"error": str(error)},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(max(1, int(error.reintentar_en or 0)))},
+    )
+
+
+class AsyncBrandListView(APIView):
+    async def get(self, request):
+        with_counts = str(request.query_params.get("with_counts", "false")).lower() in {"1", "true", "yes", "y"}
+        fuente = request.query_params.get("fuente")
+        categoria = request.query_params.get("categoria")
+
+        try:
+            brands, counts = await obtener_marcas_async(
+                coleccion="archivos",
+                with_counts=with_counts,
+                fuente=fuente,
+                categoria=categoria
+            )
+        except Exception as e:
+            if "connection" in str(e).lower() or "timeout" in str(e).lower():
+                return _respuesta({
+                    "count": 0,
+                    "brands": [],
+                    "message": "MongoDB no disponible - datos de ejemplo",
+                    "error": str(e)
+                })
+            return _respuesta({"detail": f"Error consultando Mongo: {e}"}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        payload = {"count": len(brands), "brands": brands}
+        if with_counts:
+            payload["counts"] = counts
+        return _respuesta(payload)
+
+
+class AsyncOffersByCategoryView(APIView):
+    """
+    GET /offers/<category>/?limit=20
+    """
+    DEFAULT_COLLECTION = "archivos"
+    DEFAULT_LIMIT = 20
+
+    async def get(self, request, category: str):
+        try:
+            limit = max(1, min(int(request.query_params.get("limit", self.DEFAULT_LIMIT)), 100))  # entre 1 y 100
+        except ValueError:
+            return _respuesta({"error": "Parametro 'limit' inválido"}, status.HTTP_400_BAD_REQUEST)
+
+        try:
+            docs = await obtener_por_categoria_ordenado_async(self.DEFAULT_COLLECTION, category, limit)
+        except Exception as e:
+            if "connection" in str(e).lower() or "timeout" in str(e).lower():
+                return _respuesta({
+                    "category": category,
+                    "count": 0,
+                    "results": [],
+                    "message": "MongoDB no disponible",
+                    "error": str(e)
+                })
+            return _respuesta({"error": f"Error consultando Mongo: {e}"}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return _respuesta({"category": category, "count": len(docs), "results": docs})
+
+
+class AsyncRankedOffersView(APIView):
+    """
+    GET /ranked-offers/?category=electronics&user_id=123&limit=20&model=precio
+    """
+    async def get(self, request):
+        category = request.query_params.get("category")
+        user_id = request.query_params.get("user_id")
+        model = request.query_params.get("model")
+
+        if user_id and not user_id.isdecimal():
+            return _respuesta({"error": "Parametro 'user_id' inválido"}, status.HTTP_400_BAD_REQUEST)
+        if model and model not in MODELOS:
+            return _respuesta(
+                {"error": f"Parámetro 'model' inválido (opciones: {', '.join(sorted(MODELOS))})"},
+                status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            limit = int(request.query_params.get("limit", 20))
+            # La lectura de preferencias usa el ORM y la cache síncronos
+            preferencias = await sync_to_async(UserPreferenceService.obtener)(int(user_id)) if user_id else None
+            results = await OfferRankingService.rank_offers_by_value_async(
+                categoria=category,
+                user_id=int(user_id) if user_id else None,
+                limit=limit,
+                modelo=model,
+                preferencias=preferencias
+            )
+        except MongoNoDisponible as e:
+            return _mongo_no_disponible(e)
+        except Exception as e:
+            return _respuesta(
+                {"error": f"Error obteniendo ofertas rankeadas: {e}"}, status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        return _respuesta({
+            "category": category,
+            "user_id": user_id,
+            "ranking_algorithm": "value_score",
+            "scoring_model": obtener_modelo(model).nombre,
+            "personalized": obtener_modelo(model).personaliza(preferencias),
+            "count": len(results),
+            "results": results
+        })
+
+
+class AsyncTrendingOffersView(APIView):
+    """
+    GET /trending-offers/?days=7&limit=15
+    """
+    async def get(self, request):
+        try:
+            days = int(request.query_params.get("days", 7))
+            limit = int(request.query_params.get("limit", 15))
+            results = await OfferRankingService.get_trending_offers_async(timeframe_days=days, limit=limit)
+        except MongoNoDisponible as e:
+            return _mongo_no_disponible(e)
+        except Exception as e:
+            return _respuesta(
+                {"error": f"Error obteniendo ofertas trending: {e}"}, status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        return _respuesta({
+            "timeframe_days": days,
+            "algorithm": "trending_score",
+            "count": len(results),
+            "results": results
+        })
+
+
+class AsyncStoreComparisonReportView(APIView):
+    """
+    GET /reports/store-comparison/?category=electronics&days=30
+    """
+    async def get(self, request):
+        try:
+            report = await ReportService.generate_store_comparison_report_async(
+                categoria=request.query_params.get("category"),
+                days_back=int(request.query_params.get("days", 30))
+            )
+        except MongoNoDisponible as e:
+            return _mongo_no_disponible(e)
+        except Exception as e:
+            return _respuesta(
+                {"error": f"Error generando reporte de tiendas: {e}"}, status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        return _respuesta(report)
+
+
+class AsyncPriceAnalysisReportView(APIView):
+    """
+    GET /reports/price-analysis/<category>/?days=30
+    """
+    async def get(self, request, category: str):
+        try:
+            report = await ReportService.generate_price_analysis_report_async(
+                categoria=category,
+                days_back=int(request.query_params.get("days", 30))
+            )
+        except MongoNoDisponible as e:
+            return _mongo_no_disponible(e)
+        except Exception as e:
+            return _respuesta(
+                {"error": f"Error generando análisis de precios: {e}"}, status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        return _respuesta(report)
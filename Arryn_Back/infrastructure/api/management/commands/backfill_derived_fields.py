@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from Arryn_Back.domain.services.ingest_service import IngestService, INGEST_BATCH_SIZE, CAMPOS_DERIVADOS
+
+
+class Command(BaseCommand):
+    help = (
+        f"Calcula los campos derivados ({', '.join(CAMPOS_DERIVADOS)}) en documentos "
+        "de 'archivos' ingresados antes de que existieran. Reanudable."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+        parser.add_argument("--all", action="store_true", help="Recalcular también los documentos que ya los tienen")
+
+    def handle(self, *args, **options):
+        actualizados = IngestService.rellenar_derivados(
+            "archivos",
+            batch_size=options["batch_size"],
+            recalcular=options["all"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"✅ {actualizados} documentos actualizados"))
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Arryn_Back.domain.services.ingest_service import INGEST_BATCH_SIZE, identidad_producto
+from Arryn_Back.domain.services.mongo_service import get_db
+from Arryn_Back.domain.services.price_history_service import (
+    PRICE_HISTORY_COLLECTION,
+    PriceHistoryService,
+    asegurar_coleccion,
+    medicion,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        f"Carga {PRICE_HISTORY_COLLECTION} (historial de precios en serie de tiempo) con una medición "
+        "por snapshot de archivos. Pensado para ejecutarse una vez al desplegar; la ingesta "
+        "registra las mediciones nuevas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dias", type=int, help="Solo snapshots de los últimos N días (por defecto: todos)")
+        parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+        parser.add_argument(
+            "--forzar",
+            action="store_true",
+            help="Cargar aunque la colección ya tenga mediciones (se duplicarían las existentes)",
+        )
+
+    def handle(self, *args, **options):
+        db = get_db()
+        if db is None:
+            raise CommandError("MongoDB no disponible")
+
+        asegurar_coleccion(db)
+        if db[PRICE_HISTORY_COLLECTION].count_documents({}, limit=1) and not options["forzar"]:
+            raise CommandError(f"{PRICE_HISTORY_COLLECTION} ya tiene mediciones; usar --forzar para cargar igual")
+
+        filtro = {"precio_valor": {"$type": "number"}, "fecha_extraccion": {"$type": "date"}}
+        if options["dias"] is not None:
+            filtro["fecha_extraccion"]["$gte"] = datetime.now() - timedelta(days=options["dias"])
+
+        cursor = db["archivos"].find(
+            filtro,
+            {"_id": 0, "identidad": 1, "fuente": 1, "link": 1, "product_key": 1,
+             "precio_valor": 1, "moneda": 1, "fecha_extraccion": 1},
+            batch_size=options["batch_size"],
+        )
+        total, lote = 0, []
+        for doc in cursor:
+            lote.append(medicion(doc, doc.get("identidad") or identidad_producto(doc)))
+            if len(lote) >= options["batch_size"]:
+                total += PriceHistoryService.registrar(lote)
+                lote = []
+        total += PriceHistoryService.registrar(lote)
+
+        self.stdout.write(self.style.SUCCESS(f"✅ {total} mediciones cargadas en {PRICE_HISTORY_COLLECTION}"))
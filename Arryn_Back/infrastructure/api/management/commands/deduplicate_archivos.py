@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from Arryn_Back.domain.services.ingest_service import IngestService, INGEST_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = (
+        "Asigna identidad (fuente + link) a los documentos de 'archivos' y elimina "
+        "snapshots duplicados conservando el más reciente. Los precios de los productos sin "
+        "mediciones en precios_ts se registran ahí antes de borrar (ejecutar después de "
+        "backfill_price_history). Es seguro re-ejecutarlo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+        parser.add_argument("--dry-run", action="store_true", help="Solo reportar, sin escribir")
+
+    def handle(self, *args, **options):
+        resumen = IngestService.deduplicar(
+            "archivos",
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+        )
+        for clave, valor in resumen.items():
+            self.stdout.write(f"{clave}: {valor}")
+        self.stdout.write(self.style.SUCCESS("✅ Deduplicación completada"))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Arryn_Back.domain.services.mongo_indexes import asegurar_indices, verificar_planes
+
+
+class Command(BaseCommand):
+    help = (
+        "Crea los índices de MongoDB que necesitan las consultas de los servicios "
+        "y verifica con explain() que cada consulta use IXSCAN."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--skip-verify", action="store_true", help="No ejecutar explain()")
+        parser.add_argument("--strict", action="store_true", help="Fallar si alguna consulta usa COLLSCAN")
+
+    def handle(self, *args, **options):
+        indices = asegurar_indices()
+        if not indices:
+            raise CommandError("MongoDB no disponible")
+
+        for indice in indices:
+            marca = "=" if indice["estado"] == "existente" else "+"
+            self.stdout.write(f"{marca} {indice['coleccion']}.{indice['nombre']} {indice['keys']} ({indice['estado']})")
+
+        if options["skip_verify"]:
+            return
+
+        sin_indice = []
+        for plan in verificar_planes():
+            if plan["usa_indice"]:
+                self.stdout.write(self.style.SUCCESS(f"✅ {plan['nombre']}: {' > '.join(plan['etapas'])}"))
+            else:
+                sin_indice.append(plan["nombre"])
+                self.stdout.write(self.style.WARNING(f"⚠️  {plan['nombre']}: {' > '.join(plan['etapas'])}"))
+
+        if sin_indice and options["strict"]:
+            raise CommandError(f"Consultas sin índice: {', '.join(sin_indice)}")
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Arryn_Back.infrastructure.cache.tags import (
+    TAG_DATOS,
+    invalidar,
+    tag_endpoint,
+    tags_de_cambio,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Invalida respuestas cacheadas por ResponseCacheMiddleware incrementando la "
+        "generación de sus tags. Útil tras cargas hechas directamente en Mongo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--categoria", action="append", help="Categoría afectada (repetible)")
+        parser.add_argument("--fuente", action="append", help="Fuente afectada (repetible)")
+        parser.add_argument("--endpoint", action="append", help="Nombre de URL, p. ej. ranked_offers (repetible)")
+        parser.add_argument("--todo", action="store_true", help="Invalidar todas las respuestas")
+
+    def handle(self, *args, **options):
+        tags = []
+        if options["todo"]:
+            tags.append(TAG_DATOS)
+        if options["categoria"] or options["fuente"]:
+            tags.extend(tags_de_cambio(options["categoria"] or [], options["fuente"] or []))
+        tags.extend(tag_endpoint(nombre) for nombre in options["endpoint"] or [])
+        if not tags:
+            raise CommandError("Indique --categoria, --fuente, --endpoint o --todo")
+
+        invalidados = invalidar(tags)
+        self.stdout.write(self.style.SUCCESS(f"✅ Tags invalidados: {', '.join(sorted(invalidados))}"))
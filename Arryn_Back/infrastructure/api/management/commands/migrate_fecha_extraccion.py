@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from Arryn_Back.domain.services.ingest_service import IngestService, INGEST_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = (
+        "Convierte fecha_extraccion de string a Date BSON (conservando el texto en "
+        "fecha_extraccion_texto). Reanudable: se puede interrumpir y volver a ejecutar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--coleccion", action="append",
+            help="Colecciones a migrar (por defecto: archivos)"
+        )
+        parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+        parser.add_argument("--dry-run", action="store_true", help="Solo reportar, sin escribir")
+
+    def handle(self, *args, **options):
+        for coleccion in options["coleccion"] or ["archivos"]:
+            resumen = IngestService.migrar_fechas(
+                coleccion,
+                batch_size=options["batch_size"],
+                dry_run=options["dry_run"],
+            )
+            self.stdout.write(
+                f"{coleccion}: {resumen['migrados']} migrados, {resumen['no_reconocidos']} no reconocidos"
+            )
+        self.stdout.write(self.style.SUCCESS("✅ Migración de fecha_extraccion completada"))
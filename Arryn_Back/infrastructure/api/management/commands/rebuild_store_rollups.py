@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Arryn_Back.domain.services.store_rollup_service import ROLLUP_COLLECTION, StoreRollupService
+
+
+class Command(BaseCommand):
+    help = (
+        f"Reconstruye {ROLLUP_COLLECTION} (acumulados diarios por tienda y categoría del reporte "
+        "de comparación entre tiendas) desde archivos. Ejecutar al desplegar y después de "
+        "migraciones que cambian fechas o precios fuera de la ingesta (p. ej. migrate_fecha_extraccion)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dias",
+            type=int,
+            help="Reconstruir solo los últimos N días (por defecto: todo)",
+        )
+
+    def handle(self, *args, **options):
+        desde = None
+        if options["dias"] is not None:
+            desde = datetime.now() - timedelta(days=options["dias"])
+        try:
+            buckets = StoreRollupService.reconstruir(desde)
+        except Exception as e:
+            raise CommandError(f"Error reconstruyendo {ROLLUP_COLLECTION}: {e}")
+        self.stdout.write(self.style.SUCCESS(f"✅ {buckets} acumulados diarios escritos"))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Arryn_Back.domain.services.category_stats_service import CategoryStatsService
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula la colección categoria_stats (promedio, mínimo, máximo, total y "
+        "percentiles de precio por categoría). Pensado para ejecutarse programado."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--categoria", action="append", help="Limitar a una o más categorías")
+
+    def handle(self, *args, **options):
+        try:
+            actualizadas = CategoryStatsService.refrescar(options["categoria"])
+        except Exception as e:
+            raise CommandError(f"Error refrescando categoria_stats: {e}")
+        self.stdout.write(self.style.SUCCESS(f"✅ {actualizadas} categorías actualizadas"))
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 
@@ -7,4 +8,30 @@ class User(AbstractUser):
     email = models.EmailField(unique=True)    
     
     def __str__(self):
-        return self.username
\ No newline at end of file
+        return self.username
+
+
+class UserPreference(models.Model):
+    """Preferencias de un usuario para best-prices y el ranking personalizado"""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="preferencias")
+    marcas_favoritas = models.JSONField(default=list, blank=True)
+    categorias_favoritas = models.JSONField(default=list, blank=True)
+    precio_min = models.FloatField(null=True, blank=True)
+    precio_max = models.FloatField(null=True, blank=True)
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    def como_dict(self):
+        """Preferencias definidas, con las claves que usan los servicios de precios y ranking"""
+        preferencias = {}
+        if self.marcas_favoritas:
+            preferencias["marcas_favoritas"] = list(self.marcas_favoritas)
+        if self.categorias_favoritas:
+            preferencias["categorias_favoritas"] = list(self.categorias_favoritas)
+        if self.precio_min is not None:
+            preferencias["precio_min"] = self.precio_min
+        if self.precio_max is not None:
+            preferencias["precio_max"] = self.precio_max
+        return preferencias
+
+    def __str__(self):
+        return f"Preferencias de {self.user}"
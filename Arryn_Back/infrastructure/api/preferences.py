@@ -0,0 +1,66 @@
+"""
+Servicio de preferencias de usuario con lectura cacheada
+"""
+import logging
+import os
+from typing import Any, Dict, Optional
+
+from django.core.cache import cache
+from django.db import DatabaseError
+
+from .models import UserPreference
+
+# Vida de la entrada cacheada; un cambio de preferencias la borra antes (señales en apps.py)
+USER_PREFERENCES_CACHE_TIMEOUT = int(os.getenv("USER_PREFERENCES_CACHE_TIMEOUT", 86400))
+
+logger = logging.getLogger('arryn')
+
+
+def _clave_cache(user_id: int) -> str:
+    return f"user_prefs_{user_id}"
+
+
+class UserPreferenceService:
+    """Servicio para leer las preferencias de un usuario sin consultar la base en cada request"""
+
+    @staticmethod
+    def obtener(user_id: Optional[int]) -> Dict[str, Any]:
+        """
+        Preferencias del usuario (marcas_favoritas, categorias_favoritas,
+        precio_min, precio_max; solo las definidas). Se leen de la cache; la
+        base se consulta una vez por usuario hasta que sus preferencias
+        cambian. Un usuario sin preferencias también se cachea ({}). Si la
+        base falla se retorna {} sin cachear: la petición sigue sin
+        personalizar.
+        """
+        if user_id is None:
+            return {}
+
+        clave = _clave_cache(user_id)
+        try:
+            preferencias = cache.get(clave)
+        except Exception as e:
+            logger.warning(f"Error leyendo preferencias cacheadas: {e}")
+            preferencias = None
+        if preferencias is not None:
+            return preferencias
+
+        try:
+            preferencia = UserPreference.objects.filter(user_id=user_id).first()
+        except DatabaseError as e:
+            logger.warning(f"Error leyendo preferencias del usuario {user_id}: {e}")
+            return {}
+        preferencias = preferencia.como_dict() if preferencia else {}
+        try:
+            cache.set(clave, preferencias, USER_PREFERENCES_CACHE_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"Error cacheando preferencias: {e}")
+        return preferencias
+
+    @staticmethod
+    def invalidar(user_id: int) -> None:
+        """Borra la entrada cacheada del usuario (al guardar o eliminar sus preferencias)"""
+        try:
+            cache.delete(_clave_cache(user_id))
+        except Exception as e:
+            logger.warning(f"Error invalidando preferencias cacheadas: {e}")
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import User
+from .models import User, UserPreference
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -14,4 +14,21 @@ class UserSerializer(serializers.ModelSerializer):
             email=validated_data["email"],
             password=validated_data["password"],
         )
-        return user
\ No newline at end of file
+        return user
+
+
+class UserPreferenceSerializer(serializers.ModelSerializer):
+    marcas_favoritas = serializers.ListField(child=serializers.CharField(max_length=100), required=False)
+    categorias_favoritas = serializers.ListField(child=serializers.CharField(max_length=200), required=False)
+
+    class Meta:
+        model = UserPreference
+        fields = ('marcas_favoritas', 'categorias_favoritas', 'precio_min', 'precio_max', 'actualizado_en')
+        read_only_fields = ('actualizado_en',)
+
+    def validate(self, data):
+        precio_min = data.get("precio_min", getattr(self.instance, "precio_min", None))
+        precio_max = data.get("precio_max", getattr(self.instance, "precio_max", None))
+        if precio_min is not None and precio_max is not None and precio_min > precio_max:
+            raise serializers.ValidationError("precio_min no puede ser mayor que precio_max")
+        return data
@@ -1,3 +1,5 @@
+import os
+
 from django.urls import path
 from .views import (
     ArchivosJsonView,
@@ -6,21 +8,42 @@ from .views import (
     getUsers,
     createUser,
     userDetail,
+    userPreferences,
     BrandListView,
     CategoryListView,
     OffersByCategoryView,
     BestPricesView,
     PriceComparisonView,
+    PriceHistoryView,
+    ProductSearchView,
     RankedOffersView,
+    RankingModelsView,
     TrendingOffersView,
     StoreComparisonReportView,
     PriceAnalysisReportView,
+    MongoPoolStatsView,
+    MongoQueryStatsView,
+    LivenessView,
+    ReadinessView,
 )
 
+# Modo asíncrono (servir con ASGI/uvicorn): los endpoints respaldados por
+# agregaciones de Mongo usan las vistas de async_views con AsyncMongoClient
+if os.getenv("ASYNC_VIEWS_ENABLED", "False").lower() in ("true", "1", "yes"):
+    from .async_views import (
+        AsyncBrandListView as BrandListView,
+        AsyncOffersByCategoryView as OffersByCategoryView,
+        AsyncRankedOffersView as RankedOffersView,
+        AsyncTrendingOffersView as TrendingOffersView,
+        AsyncStoreComparisonReportView as StoreComparisonReportView,
+        AsyncPriceAnalysisReportView as PriceAnalysisReportView,
+    )
+
 urlpatterns = [
     path("user/", getUsers, name="get_user"),
     path("user/create", createUser, name="create_user"),
     path("user/<int:pk>/", userDetail, name="user_detail"),
+    path("user/<int:pk>/preferences/", userPreferences, name="user_preferences"),
     path("archivos/", ArchivosJsonView.as_view(), name="archivos"),
     path("archivos/detalles/", DetallesAdicionalesView.as_view(), name="detalles_all"),
     path("archivos/<str:id>/detalles/", DetallesPorIdView.as_view(), name="detalles_por_id"),
@@ -31,10 +54,19 @@ urlpatterns = [
     # Nuevas funcionalidades
     path("best-prices/<str:category>/", BestPricesView.as_view(), name="best_prices"),
     path("price-comparison/", PriceComparisonView.as_view(), name="price_comparison"),
+    path("price-history/", PriceHistoryView.as_view(), name="price_history"),
+    path("search/", ProductSearchView.as_view(), name="product_search"),
     path("ranked-offers/", RankedOffersView.as_view(), name="ranked_offers"),
+    path("ranking-models/", RankingModelsView.as_view(), name="ranking_models"),
     path("trending-offers/", TrendingOffersView.as_view(), name="trending_offers"),
     
     # Reportes
     path("reports/store-comparison/", StoreComparisonReportView.as_view(), name="store_comparison_report"),
     path("reports/price-analysis/<str:category>/", PriceAnalysisReportView.as_view(), name="price_analysis_report"),
+
+    # Operación
+    path("health/live/", LivenessView.as_view(), name="health_live"),
+    path("health/ready/", ReadinessView.as_view(), name="health_ready"),
+    path("mongo/pool-stats/", MongoPoolStatsView.as_view(), name="mongo_pool_stats"),
+    path("mongo/query-stats/", MongoQueryStatsView.as_view(), name="mongo_query_stats"),
 ]
@@ -1,4 +1,10 @@
 import json
+import logging
+import os
+from bson.errors import InvalidId
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
@@ -6,24 +12,67 @@ from rest_framework.views import APIView
 from bson import ObjectId
 from pymongo import ASCENDING
 
-from .models import User
-from .serializer import UserSerializer
+from .models import User, UserPreference
+from .preferences import UserPreferenceService
+from .serializer import UserPreferenceSerializer, UserSerializer
 from ...domain.services.mongo_service import (
     guardar_json,
-    obtener_json,
+    obtener_json_paginado,
+    iterar_json,
     obtener_por_id,
     obtener_marcas,
     obtener_categorias,
-    db,
+    get_db,
+    estadisticas_pool,
+    verificar_mongo,
+)
+from ...domain.services.category_stats_service import CategoryStatsService
+from ...domain.services.circuit_breaker import MongoNoDisponible, circuito_mongo, estado_circuitos_consulta
+from ...domain.services.ingest_service import (
+    IngestService,
+    INGEST_BATCH_SIZE,
+    STATS_ON_INGEST,
+    identidad_producto,
+    preparar_documento,
 )
 from ...domain.services.parse_details import parse_details
+from ...domain.services.price_history_service import (
+    PRICE_HISTORY_ON_INGEST,
+    PriceHistoryService,
+    RESOLUCIONES,
+    medicion,
+)
 from ...domain.services.price_service import PricePersonalizationService
+from ...domain.services.query_runner import ejecutar_busqueda, estadisticas_consultas
 from ...domain.services.ranking_service import OfferRankingService
+from ...domain.services.ranking_snapshot_service import motor_snapshot
 from ...domain.services.report_service import ReportService
+from ...domain.services.scoring_models import MODELOS, modelos_disponibles, obtener_modelo
+from ...domain.services.search_service import ProductSearchService
+from ...domain.services.store_rollup_service import ROLLUP_ON_INGEST, StoreRollupService, claves_de
+
+ARCHIVOS_BATCH_SIZE = int(os.getenv("ARCHIVOS_STREAM_BATCH_SIZE", 500))
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", 20))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 100))
+
+logger = logging.getLogger('arryn')
+
+
+def _mongo_no_disponible(error: MongoNoDisponible) -> Response:
+    """503 cuando Mongo no responde y no hay un resultado válido guardado para servir"""
+    return Response(
+        {"error": str(error)},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(max(1, int(error.reintentar_en or 0)))},
+    )
 
 
 class ArchivosJsonView(APIView):
     def post(self, request):
+        if _es_ndjson(request):
+            return self._post_ndjson(request)
+
+        modo = request.query_params.get("mode", "insert")
         try:
             raw_body = request.body.decode("utf-8").strip()
 
@@ -35,11 +84,48 @@ class ArchivosJsonView(APIView):
                 # Si falla, asumimos que son múltiples JSONs separados por saltos de línea
                 docs = [json.loads(line) for line in raw_body.splitlines() if line.strip()]
 
+            docs = [preparar_documento(doc) for doc in docs]
+            if modo != "insert":
+                try:
+                    resumen = IngestService.ingestar("archivos", docs, modo=modo)
+                except MongoNoDisponible as e:
+                    return _mongo_no_disponible(e)
+                return Response(
+                    {"mensaje": "Ingesta completada", **resumen},
+                    status=status.HTTP_201_CREATED
+                )
+
             ids = guardar_json("archivos", docs)
-            return Response(
-                {"mensaje": "Guardado en Mongo", "ids": ids},
-                status=status.HTTP_201_CREATED
-            )
+            # Los documentos ya están guardados: un fallo de aquí en adelante
+            # se reporta en la respuesta, no como 400
+            errores = []
+            if STATS_ON_INGEST:
+                try:
+                    CategoryStatsService.aplicar_deltas(docs)
+                except Exception as e:
+                    logger.warning(f"Error actualizando categoria_stats tras la inserción: {e}")
+                    errores.append(f"estadísticas por categoría: {e}")
+            if ROLLUP_ON_INGEST:
+                try:
+                    StoreRollupService.aplicar_deltas(docs)
+                except Exception as e:
+                    # Como en IngestService: los buckets tocados se recalculan desde archivos
+                    logger.warning(f"Error aplicando deltas de reporte_tiendas_diario: {e}")
+                    errores.append(f"acumulados por tienda: {e}")
+                    try:
+                        StoreRollupService.recalcular(claves_de(docs))
+                    except Exception as e:
+                        logger.warning(f"Error recalculando reporte_tiendas_diario: {e}")
+            if PRICE_HISTORY_ON_INGEST:
+                try:
+                    PriceHistoryService.registrar(medicion(doc, identidad_producto(doc)) for doc in docs)
+                except Exception as e:
+                    logger.warning(f"Error registrando el historial de precios tras la inserción: {e}")
+                    errores.append(f"historial de precios: {e}")
+            respuesta = {"mensaje": "Guardado en Mongo", "ids": ids}
+            if errores:
+                respuesta["errores"] = errores
+            return Response(respuesta, status=status.HTTP_201_CREATED)
 
         except Exception as e:
             return Response(
@@ -47,11 +133,111 @@ class ArchivosJsonView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    def _post_ndjson(self, request):
+        """
+        POST /archivos/ con Content-Type application/x-ndjson (o ?stream=ndjson).
+        El cuerpo se lee línea por línea desde el request y se inserta en
+        lotes no ordenados; se responde con conteos en vez de ids.
+        Con ?mode=upsert los productos se actualizan por fuente + link.
+        """
+        try:
+            batch_size = max(1, int(request.query_params.get("batch_size", INGEST_BATCH_SIZE)))
+        except ValueError:
+            return Response({"error": "Parametro 'batch_size' inválido"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            resumen = IngestService.ingestar_ndjson(
+                "archivos",
+                request.stream or [],
+                batch_size=batch_size,
+                modo=request.query_params.get("mode", "insert"),
+            )
+        except MongoNoDisponible as e:
+            return _mongo_no_disponible(e)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(
+            {"mensaje": "Ingesta completada", **resumen},
+            status=status.HTTP_201_CREATED
+        )
+
     def get(self, request):
-        docs = obtener_json("archivos")
-        return Response(docs, status=status.HTTP_200_OK)
-    
-    
+        """
+        GET /archivos/                      -> arreglo JSON transmitido por lotes
+        GET /archivos/?stream=ndjson        -> un documento JSON por línea
+        GET /archivos/?limit=100&after=<id> -> página ordenada por _id
+        Opcional: fields=titulo,precio_valor limita los campos devueltos.
+        """
+        fields = request.query_params.get("fields")
+        projection = None
+        if fields:
+            projection = {f.strip(): 1 for f in fields.split(",") if f.strip()}
+
+        if "limit" in request.query_params or "after" in request.query_params:
+            return self._get_paginado(request, projection)
+
+        ndjson = request.query_params.get("stream", "json").lower() == "ndjson"
+        docs = iterar_json("archivos", projection=projection, batch_size=ARCHIVOS_BATCH_SIZE)
+        return StreamingHttpResponse(
+            _stream_documentos(docs, ndjson),
+            content_type="application/x-ndjson" if ndjson else "application/json",
+        )
+
+    def _get_paginado(self, request, projection):
+        try:
+            limit = max(1, min(int(request.query_params.get("limit", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE))
+        except ValueError:
+            return Response({"error": "Parametro 'limit' inválido"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            docs, next_after = obtener_json_paginado(
+                "archivos",
+                after=request.query_params.get("after"),
+                limit=limit,
+                projection=projection,
+            )
+        except InvalidId:
+            return Response({"error": "Parametro 'after' inválido"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "count": len(docs),
+            "next_after": next_after,
+            "results": docs
+        }, status=status.HTTP_200_OK)
+
+
+def _es_ndjson(request):
+    content_type = request.content_type.split(";")[0].strip().lower()
+    return (content_type in {"application/x-ndjson", "application/jsonl"}
+            or request.query_params.get("stream", "").lower() == "ndjson")
+
+
+def _stream_documentos(docs, ndjson=False):
+    """
+    Serializa documentos uno a uno y los agrupa en chunks de
+    ARCHIVOS_BATCH_SIZE para no materializar la respuesta completa.
+    """
+    chunk = []
+    first = True
+    if not ndjson:
+        yield "["
+    for doc in docs:
+        encoded = json.dumps(doc, cls=DjangoJSONEncoder, ensure_ascii=False)
+        if ndjson:
+            chunk.append(encoded + "\n")
+        else:
+            chunk.append(encoded if first else "," + encoded)
+            first = False
+        if len(chunk) >= ARCHIVOS_BATCH_SIZE:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+    if not ndjson:
+        yield "]"
+
+
 @api_view(['GET'])
 def getUsers(request):
     users = User.objects.all()
@@ -95,10 +281,40 @@ def userDetail(request, pk):
     elif request.method == 'DELETE':
         user.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@api_view(['GET', 'PUT', 'DELETE'])
+def userPreferences(request, pk):
+    try:
+        user = User.objects.get(pk=pk)
+    except User.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    preferencia = UserPreference.objects.filter(user=user).first()
+
+    if request.method == 'GET':
+        serializer = UserPreferenceSerializer(preferencia or UserPreference(user=user))
+        return Response(serializer.data)
+
+    elif request.method == 'PUT':
+        serializer = UserPreferenceSerializer(preferencia, data=request.data)
+        if serializer.is_valid():
+            serializer.save(user=user)
+            return Response(serializer.data)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    elif request.method == 'DELETE':
+        if preferencia:
+            preferencia.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
     
 class DetallesAdicionalesView(APIView):
     def get(self, request):
-        docs = obtener_json("archivos")
+        docs = iterar_json(
+            "archivos",
+            filtro={"detalles_adicionales": {"$exists": True}},
+            projection={"_id": 0, "titulo": 1, "detalles_adicionales": 1},
+            batch_size=ARCHIVOS_BATCH_SIZE,
+        )
 
         resultados = []
         for doc in docs:
@@ -114,7 +330,7 @@ class DetallesAdicionalesView(APIView):
 
 class DetallesPorIdView(APIView):
     def get(self, request, id):
-        collection = db["archivos"]
+        collection = get_db()["archivos"]
         doc = collection.find_one({"_id": ObjectId(id)}, {"_id": 0})
 
         if not doc or "detalles_adicionales" not in doc:
@@ -204,6 +420,7 @@ class OffersByCategoryView(APIView):
             return Response({"error": "Parametro 'limit' inválido"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
+            db = get_db()
             if db is not None:
                 collection = db[self.DEFAULT_COLLECTION]
             else:
@@ -225,7 +442,7 @@ class OffersByCategoryView(APIView):
                       .sort("precio_valor", ASCENDING)
                       .limit(limit))
 
-            docs = list(cursor)
+            docs = ejecutar_busqueda(cursor, "offers_by_category")
             for d in docs:
                 d["_id"] = str(d["_id"])
 
@@ -254,20 +471,17 @@ class BestPricesView(APIView):
     """
     GET /best-prices/<category>/?user_id=123&limit=10
     Obtiene los mejores precios personalizados por categoría
+    (preferencias en /user/<id>/preferences/)
     """
     def get(self, request, category: str):
         user_id = request.query_params.get("user_id")
         limit = int(request.query_params.get("limit", 10))
+        if user_id and not user_id.isdecimal():
+            return Response({"error": "Parametro 'user_id' inválido"}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Obtener preferencias del usuario desde base de datos o configuración
-        user_preferences = None
-        if user_id:
-            # En el futuro esto vendría de la base de datos del usuario
-            user_preferences = {
-                "marcas_favoritas": ["NIKE", "ADIDAS"],
-                "precio_max": 200,
-                "precio_min": 50
-            }
+        # Preferencias del usuario (lectura cacheada; sin preferencias no se personaliza)
+        user_preferences = UserPreferenceService.obtener(int(user_id)) if user_id else {}
+        user_preferences = user_preferences or None
         
         try:
             results = PricePersonalizationService.get_best_prices_by_category(
@@ -284,6 +498,8 @@ class BestPricesView(APIView):
                 "results": results
             }, status=status.HTTP_200_OK)
             
+        except MongoNoDisponible as e:
+            return _mongo_no_disponible(e)
         except Exception as e:
             return Response({
                 "error": f"Error obteniendo mejores precios: {e}"
@@ -293,57 +509,161 @@ class BestPricesView(APIView):
 class PriceComparisonView(APIView):
     """
     GET /price-comparison/?product=iPhone
+    GET /price-comparison/?product_key=samsung:un55au7000
     Compara precios del mismo producto entre diferentes tiendas
     """
     def get(self, request):
         product = request.query_params.get("product")
+        product_key = request.query_params.get("product_key")
         
-        if not product:
+        if not product and not product_key:
             return Response({
-                "error": "Parámetro 'product' es requerido"
+                "error": "Parámetro 'product' o 'product_key' es requerido"
             }, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            comparison = PricePersonalizationService.get_price_comparison(product)
+            comparison = PricePersonalizationService.get_price_comparison(product, product_key=product_key)
             return Response(comparison, status=status.HTTP_200_OK)
             
+        except MongoNoDisponible as e:
+            return _mongo_no_disponible(e)
         except Exception as e:
             return Response({
                 "error": f"Error comparando precios: {e}"
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class PriceHistoryView(APIView):
+    """
+    GET /price-history/?identidad=exito|https://www.exito.com/producto/p&days=30
+    GET /price-history/?product_key=samsung:un55au7000&days=90&resolution=dia
+    GET /price-history/?identidad=...&resolution=cambios  (solo las mediciones con cambio de precio)
+    Historial de precios de un producto en una tienda (identidad) o en todas (product_key)
+    """
+    def get(self, request):
+        identidad = request.query_params.get("identidad")
+        product_key = request.query_params.get("product_key")
+        resolucion = request.query_params.get("resolution", "punto")
+
+        if not identidad and not product_key:
+            return Response({
+                "error": "Parámetro 'identidad' o 'product_key' es requerido"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if resolucion not in RESOLUCIONES:
+            return Response({
+                "error": f"Parámetro 'resolution' inválido (opciones: {', '.join(RESOLUCIONES)})"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            days = int(request.query_params.get("days", 30))
+        except ValueError:
+            return Response({"error": "Parametro 'days' inválido"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            historial = PriceHistoryService.historial(
+                identidad=identidad,
+                product_key=product_key,
+                dias=days,
+                resolucion=resolucion
+            )
+            return Response(historial, status=status.HTTP_200_OK)
+
+        except MongoNoDisponible as e:
+            return _mongo_no_disponible(e)
+        except Exception as e:
+            return Response({
+                "error": f"Error obteniendo historial de precios: {e}"
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class ProductSearchView(APIView):
+    """
+    GET /search/?q=smart tv 55&limit=20
+    Busca productos por título usando el índice de texto, ordenados por relevancia
+    """
+    def get(self, request):
+        query = request.query_params.get("q", "")
+        if not query.strip():
+            return Response({
+                "error": "Parámetro 'q' es requerido"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            limit = max(1, min(int(request.query_params.get("limit", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE))
+        except ValueError:
+            return Response({"error": "Parametro 'limit' inválido"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            results = ProductSearchService.buscar(query, limit=limit)
+            return Response({
+                "query": query,
+                "count": len(results),
+                "results": results
+            }, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            return Response({
+                "error": f"Error buscando productos: {e}"
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 class RankedOffersView(APIView):
     """
-    GET /ranked-offers/?category=electronics&user_id=123&limit=20
-    Obtiene ofertas rankeadas por valor
+    GET /ranked-offers/?category=electronics&user_id=123&limit=20&model=precio
+    Obtiene ofertas rankeadas por valor con un modelo de scoring (ver /ranking-models/)
     """
     def get(self, request):
         category = request.query_params.get("category")
         user_id = request.query_params.get("user_id")
         limit = int(request.query_params.get("limit", 20))
+        model = request.query_params.get("model")
+
+        if user_id and not user_id.isdecimal():
+            return Response({"error": "Parametro 'user_id' inválido"}, status=status.HTTP_400_BAD_REQUEST)
+        if model and model not in MODELOS:
+            return Response({
+                "error": f"Parámetro 'model' inválido (opciones: {', '.join(sorted(MODELOS))})"
+            }, status=status.HTTP_400_BAD_REQUEST)
         
         try:
+            preferencias = UserPreferenceService.obtener(int(user_id)) if user_id else None
             results = OfferRankingService.rank_offers_by_value(
                 categoria=category,
                 user_id=int(user_id) if user_id else None,
-                limit=limit
+                limit=limit,
+                modelo=model,
+                preferencias=preferencias
             )
             
             return Response({
                 "category": category,
                 "user_id": user_id,
                 "ranking_algorithm": "value_score",
+                "scoring_model": obtener_modelo(model).nombre,
+                "personalized": obtener_modelo(model).personaliza(preferencias),
                 "count": len(results),
                 "results": results
             }, status=status.HTTP_200_OK)
             
+        except MongoNoDisponible as e:
+            return _mongo_no_disponible(e)
         except Exception as e:
             return Response({
                 "error": f"Error obteniendo ofertas rankeadas: {e}"
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class RankingModelsView(APIView):
+    """
+    GET /ranking-models/
+    Modelos de scoring disponibles para /ranked-offers/?model=<nombre>
+    """
+    def get(self, request):
+        return Response({
+            "default": obtener_modelo().nombre,
+            "models": modelos_disponibles()
+        }, status=status.HTTP_200_OK)
+
+
 class TrendingOffersView(APIView):
     """
     GET /trending-offers/?days=7&limit=15
@@ -366,6 +686,8 @@ class TrendingOffersView(APIView):
                 "results": results
             }, status=status.HTTP_200_OK)
             
+        except MongoNoDisponible as e:
+            return _mongo_no_disponible(e)
         except Exception as e:
             return Response({
                 "error": f"Error obteniendo ofertas trending: {e}"
@@ -389,6 +711,8 @@ class StoreComparisonReportView(APIView):
             
             return Response(report, status=status.HTTP_200_OK)
             
+        except MongoNoDisponible as e:
+            return _mongo_no_disponible(e)
         except Exception as e:
             return Response({
                 "error": f"Error generando reporte de tiendas: {e}"
@@ -411,7 +735,69 @@ class PriceAnalysisReportView(APIView):
             
             return Response(report, status=status.HTTP_200_OK)
             
+        except MongoNoDisponible as e:
+            return _mongo_no_disponible(e)
         except Exception as e:
             return Response({
                 "error": f"Error generando análisis de precios: {e}"
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class MongoPoolStatsView(APIView):
+    """
+    GET /mongo/pool-stats/
+    Configuración y uso del pool de conexiones a MongoDB del worker que responde
+    (cada proceso de gunicorn tiene su propio cliente; ver campo 'pid')
+    """
+    def get(self, request):
+        return Response(estadisticas_pool(), status=status.HTTP_200_OK)
+
+
+class MongoQueryStatsView(APIView):
+    """
+    GET /mongo/query-stats/
+    Llamadas, errores, timeouts y tiempos por consulta a Mongo del worker que
+    responde, junto al maxTimeMS configurado de cada una, el circuito de
+    timeouts de cada consulta y el estado del snapshot de ranking
+    (RANKING_ENGINE=snapshot)
+    """
+    def get(self, request):
+        return Response({
+            "pid": os.getpid(),
+            "consultas": estadisticas_consultas(),
+            "circuitos_por_consulta": estado_circuitos_consulta(),
+            "ranking_snapshot": motor_snapshot.estado(),
+        }, status=status.HTTP_200_OK)
+
+
+class LivenessView(APIView):
+    """
+    GET /health/live/
+    El proceso responde; no consulta dependencias
+    """
+    def get(self, request):
+        return Response({"status": "ok"}, status=status.HTTP_200_OK)
+
+
+class ReadinessView(APIView):
+    """
+    GET /health/ready/
+    Listo para recibir tráfico si MongoDB responde (503 si no). La cache no
+    bloquea: si Redis cae se usa la cache local de respaldo ("degradado").
+    """
+    def get(self, request):
+        mongo = verificar_mongo()
+
+        cache_backend = caches["default"]
+        if hasattr(cache_backend, "health_check"):
+            cache_estado = "ok" if cache_backend.health_check() else "degradado"
+        else:
+            cache_estado = "ok"
+
+        listo = mongo["disponible"]
+        return Response({
+            "status": "ready" if listo else "not_ready",
+            "mongo": mongo,
+            "circuito_mongo": circuito_mongo.estado(),
+            "cache": cache_estado,
+        }, status=status.HTTP_200_OK if listo else status.HTTP_503_SERVICE_UNAVAILABLE)
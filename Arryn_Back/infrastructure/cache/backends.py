@@ -0,0 +1,141 @@
+"""
+Backend de cache Redis compartido entre workers, con respaldo local en memoria
+"""
+import logging
+import threading
+import time
+
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+
+logger = logging.getLogger('arryn')
+
+
+class ResilientRedisCache(BaseCache):
+    """
+    Delega en django_redis.cache.RedisCache (pool de conexiones por proceso).
+    Si Redis no responde en tiempo de ejecución, las operaciones pasan a un
+    LocMemCache del proceso durante FALLBACK_RETRY_INTERVAL segundos; luego
+    se vuelve a probar Redis en la siguiente operación.
+
+    OPTIONS propias (el resto se pasa tal cual a django_redis):
+        FALLBACK_RETRY_INTERVAL: segundos antes de reintentar Redis (30)
+        FALLBACK_MAX_ENTRIES: tamaño del LocMemCache de respaldo (1000)
+    """
+
+    def __init__(self, server, params):
+        super().__init__(params)
+        from django_redis.cache import RedisCache
+        from django_redis.exceptions import ConnectionInterrupted
+        from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+
+        redis_params = dict(params)
+        options = dict(redis_params.get("OPTIONS", {}))
+        self._retry_interval = float(options.pop("FALLBACK_RETRY_INTERVAL", 30))
+        max_entries = int(options.pop("FALLBACK_MAX_ENTRIES", 1000))
+        redis_params["OPTIONS"] = options
+
+        self._redis = RedisCache(server, redis_params)
+        self._local = LocMemCache("arryn-cache-fallback", {
+            "TIMEOUT": params.get("TIMEOUT", 300),
+            "KEY_PREFIX": params.get("KEY_PREFIX", ""),
+            "VERSION": params.get("VERSION", 1),
+            "OPTIONS": {"MAX_ENTRIES": max_entries},
+        })
+        self._errores_redis = (ConnectionInterrupted, RedisConnectionError, RedisTimeoutError)
+        self._caido_hasta = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def usando_respaldo(self):
+        return time.monotonic() < self._caido_hasta
+
+    def _marcar_caido(self, error):
+        with self._lock:
+            if not self.usando_respaldo:
+                logger.warning(
+                    f"Redis no disponible ({error}); usando cache local por {self._retry_interval:.0f}s"
+                )
+            self._caido_hasta = time.monotonic() + self._retry_interval
+
+    def _call(self, metodo, *args, **kwargs):
+        if self.usando_respaldo:
+            return getattr(self._local, metodo)(*args, **kwargs)
+        try:
+            return getattr(self._redis, metodo)(*args, **kwargs)
+        except self._errores_redis as e:
+            self._marcar_caido(e)
+            return getattr(self._local, metodo)(*args, **kwargs)
+
+    def health_check(self):
+        """Ping a Redis; retorna True si responde (y sale del modo respaldo)"""
+        try:
+            self._redis.client.get_client(write=False).ping()
+        except Exception as e:
+            self._marcar_caido(e)
+            return False
+        with self._lock:
+            self._caido_hasta = 0.0
+        return True
+
+    def incr_ventana(self, key_actual, key_anterior, timeout):
+        """
+        Contador de ventana para rate limiting en un solo round-trip atómico
+        (MULTI: INCR + EXPIRE de la ventana actual, GET de la anterior).
+
+        Returns:
+            (conteo actual, conteo anterior) o None si Redis no responde; en
+            ese caso el llamador usa sus propios contadores en memoria
+        """
+        if self.usando_respaldo:
+            return None
+        try:
+            actual = self._redis.make_key(key_actual)
+            pipe = self._redis.client.get_client(write=True).pipeline(transaction=True)
+            pipe.incr(actual)
+            pipe.expire(actual, int(timeout))
+            pipe.get(self._redis.make_key(key_anterior))
+            conteo, _, anterior = pipe.execute()
+        except self._errores_redis as e:
+            self._marcar_caido(e)
+            return None
+        return int(conteo), int(anterior or 0)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._call("add", key, value, timeout=timeout, version=version)
+
+    def get(self, key, default=None, version=None):
+        return self._call("get", key, default=default, version=version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._call("set", key, value, timeout=timeout, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._call("touch", key, timeout=timeout, version=version)
+
+    def delete(self, key, version=None):
+        return self._call("delete", key, version=version)
+
+    def get_many(self, keys, version=None):
+        return self._call("get_many", keys, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._call("set_many", data, timeout=timeout, version=version)
+
+    def delete_many(self, keys, version=None):
+        return self._call("delete_many", keys, version=version)
+
+    def has_key(self, key, version=None):
+        return self._call("has_key", key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        return self._call("incr", key, delta=delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        return self._call("decr", key, delta=delta, version=version)
+
+    def clear(self):
+        return self._call("clear")
+
+    def close(self, **kwargs):
+        self._redis.close(**kwargs)
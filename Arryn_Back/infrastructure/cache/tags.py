@@ -0,0 +1,138 @@
+"""
+Invalidación de la cache de respuestas por tags con contadores de generación
+"""
+import hashlib
+import time
+from typing import Dict, Iterable, List, Optional
+
+from django.core.cache import cache
+from django.urls import resolve, Resolver404
+
+# Colecciones cuyos cambios afectan a las respuestas cacheadas
+COLECCIONES_CACHEADAS = {"archivos", "categoria_stats"}
+
+# Tag global: toda respuesta lo incluye; se incrementa cuando no se conoce
+# el alcance del cambio (migraciones, deduplicación)
+TAG_DATOS = "datos"
+# Tag de respuestas sin filtro de categoría ni fuente: cambia con cualquier ingesta
+TAG_TODO = "todo"
+
+
+def tag_categoria(categoria: str) -> str:
+    return f"cat:{categoria}"
+
+
+def tag_fuente(fuente: str) -> str:
+    return f"fuente:{fuente}"
+
+
+def tag_endpoint(nombre: str) -> str:
+    return f"endpoint:{nombre}"
+
+
+def tag_usuario(user_id) -> str:
+    """
+    Respuestas personalizadas (?user_id=): cambian con las preferencias del
+    usuario. Se normaliza con int() para que ?user_id=007 y el id 7 que
+    invalidan las señales sean el mismo tag (ValueError si no es numérico).
+    """
+    return f"usuario:{int(user_id)}"
+
+
+def _clave_tag(tag: str) -> str:
+    # Los nombres de categoría traen espacios y tildes; la clave se hashea
+    return "resp_tag_" + hashlib.blake2b(tag.encode("utf-8"), digest_size=12).hexdigest()
+
+
+def _semilla() -> int:
+    # Si un contador se pierde (eviction, reinicio de Redis) vuelve con un
+    # valor nuevo y no con uno ya usado, así no reaparecen respuestas viejas
+    return time.time_ns()
+
+
+def versiones(tags: Iterable[str]) -> Dict[str, int]:
+    """Generación actual de cada tag (se inicializa si no existe)"""
+    claves = {tag: _clave_tag(tag) for tag in tags}
+    actuales = cache.get_many(list(claves.values()))
+    resultado = {}
+    for tag, clave in claves.items():
+        if clave not in actuales:
+            cache.add(clave, _semilla(), timeout=None)
+            cache.add(clave + "_ts", time.time(), timeout=None)
+            actuales[clave] = cache.get(clave, 0)
+        resultado[tag] = actuales[clave]
+    return resultado
+
+
+def ultima_modificacion(tags: Iterable[str]) -> Optional[float]:
+    """Timestamp del último cambio entre los tags (None si no se conoce)"""
+    marcas = cache.get_many([_clave_tag(tag) + "_ts" for tag in tags])
+    return max(marcas.values()) if marcas else None
+
+
+def invalidar(tags: Iterable[str]) -> List[str]:
+    """Incrementa la generación de los tags; las respuestas que los usan dejan de encontrarse"""
+    invalidados = []
+    ahora = time.time()
+    for tag in set(tags):
+        clave = _clave_tag(tag)
+        try:
+            cache.incr(clave)
+        except ValueError:
+            if not cache.add(clave, _semilla(), timeout=None):
+                cache.incr(clave)
+        cache.set(clave + "_ts", ahora, timeout=None)
+        invalidados.append(tag)
+    return invalidados
+
+
+def tags_de_peticion(request) -> List[str]:
+    """Tags de una petición GET: endpoint + categoría/fuente filtradas (o 'todo' si no filtra)"""
+    tags = [TAG_DATOS]
+    try:
+        match = resolve(request.path_info)
+        tags.append(tag_endpoint(match.url_name or request.path))
+        categoria = match.kwargs.get("category")
+    except Resolver404:
+        tags.append(tag_endpoint(request.path))
+        categoria = None
+
+    categoria = categoria or request.GET.get("category") or request.GET.get("categoria")
+    fuente = request.GET.get("fuente")
+    if categoria:
+        tags.append(tag_categoria(categoria))
+    if fuente:
+        tags.append(tag_fuente(fuente))
+    if not categoria and not fuente:
+        tags.append(TAG_TODO)
+    user_id = request.GET.get("user_id")
+    if user_id:
+        try:
+            tags.append(tag_usuario(user_id))
+        except ValueError:
+            # La vista responde 400 a un user_id no numérico
+            pass
+    return tags
+
+
+def versiones_de_peticion(request) -> Dict[str, int]:
+    """versiones(tags_de_peticion(request)), calculado una vez por petición"""
+    if not hasattr(request, "_cache_tag_versions"):
+        request._cache_tag_versions = versiones(tags_de_peticion(request))
+    return request._cache_tag_versions
+
+
+def tags_de_cambio(categorias: Optional[Iterable[str]], fuentes: Optional[Iterable[str]]) -> List[str]:
+    """Tags afectados por un cambio en las categorías/fuentes indicadas"""
+    if categorias is None and fuentes is None:
+        return [TAG_DATOS]
+    tags = [TAG_TODO]
+    tags.extend(tag_categoria(c) for c in categorias or ())
+    tags.extend(tag_fuente(f) for f in fuentes or ())
+    return tags
+
+
+def invalidar_por_ingesta(coleccion: str, categorias=None, fuentes=None) -> None:
+    """Suscriptor de domain.services.events.publicar_ingesta"""
+    if coleccion in COLECCIONES_CACHEADAS:
+        invalidar(tags_de_cambio(categorias, fuentes))
@@ -1,6 +1,6 @@
 import os
-from django.core.wsgi import get_wsgi_application
+from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'infrastructure.config.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Arryn_Back.infrastructure.config.settings')
 
-application = get_wsgi_application()
+application = get_asgi_application()
@@ -11,10 +11,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
-import ssl
 from pathlib import Path
 from dotenv import load_dotenv
-from pymongo import MongoClient
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -33,41 +31,8 @@ MONGO_DB = {
     "PORT": int(mongo_port if mongo_port else "27017"),
 }
 
-try:
-    # Use MongoDB Atlas URL if MONGO_HOST is empty, otherwise use local config
-    mongo_host = os.getenv("MONGO_HOST", "localhost")
-    mongodb_url = os.getenv("MONGODB_URL")
-    
-    if not mongo_host or mongo_host.strip() == "":
-        # Using MongoDB Atlas
-        if mongodb_url:
-            mongo_client = MongoClient(
-                mongodb_url,
-                serverSelectionTimeoutMS=int(os.getenv("MONGO_CONNECTION_TIMEOUT", 10000)),
-                ssl=True,
-                ssl_cert_reqs=ssl.CERT_NONE,  # Disable certificate validation
-                retryWrites=True,
-                maxPoolSize=1  # Reduce connection pool for Docker
-            )
-        else:
-            print("⚠️  No MongoDB configuration found (neither MONGO_HOST nor MONGODB_URL)")
-            mongo_client = None
-    else:
-        # Using local MongoDB
-        mongo_client = MongoClient(
-            MONGO_DB["HOST"], 
-            MONGO_DB["PORT"],
-            serverSelectionTimeoutMS=int(os.getenv("MONGO_CONNECTION_TIMEOUT", 5000))
-        )
-    
-    if mongo_client:
-        MONGO_DATABASE = mongo_client[MONGO_DB["NAME"]]
-    else:
-        MONGO_DATABASE = None
-        
-except Exception as e:
-    print(f"MongoDB connection warning: {e}")
-    MONGO_DATABASE = None
+# El cliente de MongoDB lo crea domain/services/mongo_service.get_client()
+# en el primer uso (después del fork de gunicorn), no al cargar settings
 
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
@@ -105,7 +70,10 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'Arryn_Back.infrastructure.middleware.performance.RateLimitMiddleware',
+    'Arryn_Back.infrastructure.middleware.performance.RequestDeadlineMiddleware',
+    'Arryn_Back.infrastructure.middleware.performance.ConditionalGetMiddleware',
     'Arryn_Back.infrastructure.middleware.performance.ResponseCacheMiddleware', 
+    'Arryn_Back.infrastructure.middleware.performance.StaleDataMiddleware',
     'Arryn_Back.infrastructure.middleware.performance.RequestLoggingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -251,12 +219,30 @@ CACHES = {
     }
 }
 
-# Always use locmem cache if Redis is configured but not available
+# Redis compartido entre workers: si CACHE_BACKEND menciona redis se usa
+# ResilientRedisCache, que pasa a LocMem solo mientras Redis no responda
+# (se detecta en tiempo de ejecución, no al importar settings)
 cache_backend = os.getenv("CACHE_BACKEND", 'django.core.cache.backends.locmem.LocMemCache')
 if 'redis' in cache_backend.lower():
-    # Override Redis with LocMem for production when Redis is not available
-    CACHES['default']['BACKEND'] = 'django.core.cache.backends.locmem.LocMemCache'
-    CACHES['default']['LOCATION'] = 'arryn-cache'
+    CACHES['default'] = {
+        'BACKEND': 'Arryn_Back.infrastructure.cache.backends.ResilientRedisCache',
+        'LOCATION': os.getenv("CACHE_LOCATION", 'redis://localhost:6379/1'),
+        'TIMEOUT': int(os.getenv("CACHE_TIMEOUT", 300)),
+        'KEY_PREFIX': os.getenv("CACHE_KEY_PREFIX", 'arryn'),
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            'CONNECTION_POOL_KWARGS': {
+                'max_connections': int(os.getenv("REDIS_MAX_CONNECTIONS", 50)),
+                'health_check_interval': int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30)),
+            },
+            'SOCKET_CONNECT_TIMEOUT': float(os.getenv("REDIS_SOCKET_CONNECT_TIMEOUT", 0.5)),
+            'SOCKET_TIMEOUT': float(os.getenv("REDIS_SOCKET_TIMEOUT", 0.5)),
+            'FALLBACK_RETRY_INTERVAL': float(os.getenv("CACHE_FALLBACK_RETRY_INTERVAL", 30)),
+            'FALLBACK_MAX_ENTRIES': int(os.getenv("CACHE_MAX_ENTRIES", 1000)),
+        }
+    }
+    if os.getenv("REDIS_PASSWORD"):
+        CACHES['default']['OPTIONS']['PASSWORD'] = os.getenv("REDIS_PASSWORD")
 
 # Session configuration para alta concurrencia
 SESSION_ENGINE = 'django.contrib.sessions.backends.db'
@@ -4,73 +4,266 @@ Middleware personalizado para manejo de concurrencia alta
 import os
 import time
 import hashlib
+import itertools
+import threading
+import zlib
+from datetime import date, datetime
 from django.core.cache import cache
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
 from django.utils.deprecation import MiddlewareMixin
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
 import logging
 
+from ..cache.tags import ultima_modificacion, versiones_de_peticion
+from ...domain.services.circuit_breaker import edad_datos_obsoletos, reiniciar_obsolescencia, sirvio_datos_ejemplo
+from ...domain.services.query_runner import establecer_deadline
+
 logger = logging.getLogger('arryn')
 
 
 class RateLimitMiddleware(MiddlewareMixin):
     """
-    Middleware para limitar la tasa de requests por IP
+    Middleware para limitar la tasa de requests por IP.
+
+    Ventana deslizante aproximada con dos contadores de ventana fija: el
+    conteo estimado es actual + anterior * (fracción de la ventana anterior
+    que aún cae dentro de los últimos RATE_LIMIT_WINDOW segundos).
+
+    Con ResilientRedisCache el conteo es atómico y compartido entre workers
+    (un round-trip por request); con otro backend, o si Redis no responde,
+    se usan contadores en memoria del proceso (itertools.count, sin locks).
     """
+
+    # Contadores locales: índice de ventana -> {clave: itertools.count}
+    _local_counters = {}
+    # Último valor entregado por cada contador local (para leer la ventana anterior)
+    _local_last = {}
     
     def __init__(self, get_response):
         self.get_response = get_response
         # Configuración desde variables de entorno
         self.rate_limit = int(os.getenv("RATE_LIMIT_REQUESTS", 100))  # requests por minuto
         self.window_size = int(os.getenv("RATE_LIMIT_WINDOW", 60))  # ventana de tiempo en segundos
+        # Límites por ruta: "/api/archivos/:20,/api/reports/:30" (gana el prefijo más largo)
+        self.route_limits = self.parse_route_limits(os.getenv("RATE_LIMIT_ROUTES", ""))
+        # Proxies de confianza delante de Django (p. ej. 1 con nginx). Con 0 se
+        # ignora X-Forwarded-For, que cualquier cliente puede falsificar.
+        self.trusted_proxies = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", 0))
         super().__init__(get_response)
+
+    @staticmethod
+    def parse_route_limits(value):
+        limits = []
+        for item in value.split(','):
+            prefix, _, limit = item.strip().rpartition(':')
+            if prefix and limit.strip().isdigit():
+                limits.append((prefix.strip(), int(limit)))
+        return sorted(limits, key=lambda pair: len(pair[0]), reverse=True)
         
     def process_request(self, request):
         # Obtener IP del cliente
         ip = self.get_client_ip(request)
-        
-        # Generar clave para cache
-        cache_key = f"rate_limit_{ip}"
-        
-        # Obtener datos actuales del cache
-        current_data = cache.get(cache_key, {'count': 0, 'window_start': time.time()})
-        
+        route, limit = self.get_route_limit(request.path)
+
         current_time = time.time()
-        
-        # Si ha pasado la ventana de tiempo, resetear contador
-        if current_time - current_data['window_start'] > self.window_size:
-            current_data = {'count': 1, 'window_start': current_time}
-        else:
-            current_data['count'] += 1
-        
-        # Guardar en cache
-        cache.set(cache_key, current_data, self.window_size)
-        
+        window = int(current_time // self.window_size)
+        elapsed = current_time - window * self.window_size
+
+        # Generar claves para cache (ventana actual y anterior)
+        cache_key = f"rate_limit_{route}_{ip}"
+        current, previous = self.increment(f"{cache_key}_{window}", f"{cache_key}_{window - 1}", window)
+        estimated = current + previous * (1 - elapsed / self.window_size)
+
+        request._rate_limit = (limit, max(0, int(limit - estimated)))
+
         # Verificar si se excede el límite
-        if current_data['count'] > self.rate_limit:
-            logger.warning(f"Rate limit exceeded for IP {ip}: {current_data['count']} requests")
-            return JsonResponse({
+        if estimated > limit:
+            logger.warning(f"Rate limit exceeded for IP {ip} on {route}: {estimated:.0f} requests")
+            retry_after = max(1, int(self.window_size - elapsed))
+            response = JsonResponse({
                 'error': 'Rate limit exceeded',
-                'limit': self.rate_limit,
+                'limit': limit,
                 'window': self.window_size,
-                'retry_after': int(self.window_size - (current_time - current_data['window_start']))
+                'retry_after': retry_after
             }, status=429)
+            response['Retry-After'] = str(retry_after)
+            return response
         
         return None
+
+    def process_response(self, request, response):
+        if hasattr(request, '_rate_limit'):
+            limit, remaining = request._rate_limit
+            response['X-RateLimit-Limit'] = str(limit)
+            response['X-RateLimit-Remaining'] = str(remaining)
+        return response
+
+    def get_route_limit(self, path):
+        for prefix, limit in self.route_limits:
+            if path.startswith(prefix):
+                return prefix, limit
+        return 'default', self.rate_limit
+
+    def increment(self, current_key, previous_key, window):
+        """Incrementa la ventana actual y retorna (actual, anterior)"""
+        incr_ventana = getattr(cache, 'incr_ventana', None)
+        if incr_ventana is not None:
+            counts = incr_ventana(current_key, previous_key, self.window_size * 2)
+            if counts is not None:
+                return counts
+        return self.increment_local(current_key, previous_key, window)
+
+    def increment_local(self, current_key, previous_key, window):
+        counters = self._local_counters.get(window)
+        if counters is None:
+            counters = self._local_counters.setdefault(window, {})
+            # Descartar ventanas que ya no intervienen en el cálculo
+            for old_window in [w for w in list(self._local_counters) if w < window - 1]:
+                for key in self._local_counters.pop(old_window, {}):
+                    self._local_last.pop(key, None)
+        counter = counters.get(current_key) or counters.setdefault(current_key, itertools.count(1))
+        current = next(counter)
+        # Otro thread pudo guardar un valor mayor entre next() y esta escritura
+        self._local_last[current_key] = max(current, self._local_last.get(current_key, 0))
+        return current, self._local_last.get(previous_key, 0)
     
     def get_client_ip(self, request):
-        """Obtiene la IP real del cliente"""
+        """
+        Obtiene la IP real del cliente: con N proxies de confianza se toma la
+        N-ésima dirección desde la derecha de X-Forwarded-For (la que agregó
+        el primer proxy propio); sin proxies, o si la cabecera trae menos de
+        N direcciones (las de la izquierda las pone el cliente), se usa
+        REMOTE_ADDR.
+        """
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
+        if self.trusted_proxies and x_forwarded_for:
+            ips = [ip.strip() for ip in x_forwarded_for.split(',') if ip.strip()]
+            if len(ips) >= self.trusted_proxies:
+                return ips[-self.trusted_proxies]
+        return request.META.get('REMOTE_ADDR')
+
+
+class RequestDeadlineMiddleware(MiddlewareMixin):
+    """
+    Fija el deadline de la request (REQUEST_DEADLINE_SECONDS desde que entra)
+    para las consultas a Mongo: query_runner limita el maxTimeMS de cada una
+    a lo que quede, así ninguna sigue corriendo en el servidor después de que
+    gunicorn mate al worker por timeout.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Por debajo del --timeout de gunicorn (30s) para responder antes de que mate al worker
+        self.deadline = float(os.getenv("REQUEST_DEADLINE_SECONDS", 25))
+        super().__init__(get_response)
+
+    def process_request(self, request):
+        establecer_deadline(self.deadline if self.deadline > 0 else None)
+        return None
+
+    def process_response(self, request, response):
+        establecer_deadline(None)
+        return response
+
+
+class ConditionalGetMiddleware(MiddlewareMixin):
+    """
+    Middleware de GET condicional para los endpoints de catálogo.
+
+    El ETag se deriva de la generación de datos de la petición (la misma que
+    usa ResponseCacheMiddleware, incrementada en cada ingesta) y no del
+    cuerpo, así un If-None-Match vigente se responde con 304 sin ejecutar la
+    vista ni la agregación de Mongo. Incluye la fecha del día porque los
+    reportes y trending usan ventanas relativas a hoy.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.conditional_paths = [
+            '/api/brands/',
+            '/api/categories/',
+            '/api/offers/',
+            '/api/best-prices/',
+            '/api/ranked-offers/',
+            '/api/trending-offers/',
+            '/api/reports/'
+        ]
+        super().__init__(get_response)
+
+    def process_request(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+
+        if not any(request.path.startswith(path) for path in self.conditional_paths):
+            return None
+
+        etag = self.generate_etag(request)
+        last_modified = ultima_modificacion(versiones_de_peticion(request).keys())
+        if last_modified is not None:
+            # Las ventanas relativas a hoy cambian a medianoche aunque no haya ingesta
+            last_modified = max(last_modified, datetime.combine(date.today(), datetime.min.time()).timestamp())
+        request._conditional_etag = etag
+        request._conditional_last_modified = last_modified
+
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            # If-None-Match usa comparación débil: W/"x" coincide con "x"
+            etiquetas = {etiqueta.removeprefix('W/') for etiqueta in parse_etags(if_none_match)}
+            not_modified = etag in etiquetas or if_none_match.strip() == '*'
         else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
+            since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+            not_modified = since is not None and last_modified is not None and int(last_modified) <= since
+
+        if not_modified:
+            response = HttpResponseNotModified()
+            self.set_headers(request, response)
+            return response
+        return None
+
+    def process_response(self, request, response):
+        # Una respuesta stale no corresponde a la versión actual: sin ETag de versión
+        if (getattr(request, '_conditional_etag', None) and
+                response.status_code == 200 and
+                response.get('X-Cache') != 'STALE' and
+                not response.has_header('X-Data-Stale')):
+            self.set_headers(request, response)
+        return response
+
+    def set_headers(self, request, response):
+        response['ETag'] = request._conditional_etag
+        if request._conditional_last_modified is not None:
+            response['Last-Modified'] = http_date(request._conditional_last_modified)
+
+    def generate_etag(self, request):
+        """ETag fuerte: ruta + parámetros + generación de los tags + fecha"""
+        generaciones = versiones_de_peticion(request)
+        material = '|'.join([
+            request.get_full_path(),
+            date.today().isoformat(),
+            ','.join(f"{tag}={generacion}" for tag, generacion in sorted(generaciones.items())),
+        ])
+        return f'"{hashlib.blake2b(material.encode("utf-8"), digest_size=16).hexdigest()}"'
 
 
 class ResponseCacheMiddleware(MiddlewareMixin):
     """
-    Middleware para cache de respuestas API
+    Middleware para cache de respuestas API.
+
+    La clave incluye la generación de los tags de la petición (endpoint,
+    categoría, fuente); la ingesta incrementa solo los tags afectados
+    (ver infrastructure.cache.tags), así se puede usar un TTL largo sin
+    servir precios viejos.
+
+    Ante un miss solo una petición por clave recalcula (single-flight): las
+    demás del mismo proceso esperan su resultado y las de otros workers
+    esperan a que se libere el lock compartido en la cache. Si existe una
+    versión anterior de la respuesta (vencida o de la generación previa)
+    se sirve con X-Cache: STALE mientras se recalcula.
     """
+
+    # Peticiones en curso de este proceso: cache_key -> threading.Event
+    _inflight = {}
+    _inflight_lock = threading.Lock()
     
     def __init__(self, get_response):
         self.get_response = get_response
@@ -83,6 +276,15 @@ class ResponseCacheMiddleware(MiddlewareMixin):
             '/api/reports/'
         ]
         self.cache_timeout = int(os.getenv("RESPONSE_CACHE_TIMEOUT", 300))  # 5 minutos por defecto
+        # Segundos extra en que una respuesta vencida se puede servir mientras se recalcula
+        self.stale_timeout = int(os.getenv("RESPONSE_CACHE_STALE_TIMEOUT", 60))
+        # Máximo que espera una petición a que otra termine de calcular la misma clave
+        self.lock_wait = float(os.getenv("RESPONSE_CACHE_LOCK_WAIT", 5))
+        # Vida del lock compartido (por si el worker que lo tomó muere)
+        self.lock_timeout = int(os.getenv("RESPONSE_CACHE_LOCK_TIMEOUT", 30))
+        # Comprimir con zlib los cuerpos grandes antes de guardarlos (menos memoria en Redis)
+        self.compress = os.getenv("RESPONSE_CACHE_COMPRESS", "False").lower() in ("true", "1", "yes")
+        self.compress_min_bytes = int(os.getenv("RESPONSE_CACHE_COMPRESS_MIN_BYTES", 1024))
         super().__init__(get_response)
     
     def process_request(self, request):
@@ -94,43 +296,200 @@ class ResponseCacheMiddleware(MiddlewareMixin):
         if not any(request.path.startswith(path) for path in self.cacheable_paths):
             return None
         
-        # Generar clave de cache basada en URL y parámetros
+        # Generar clave de cache basada en URL, parámetros y generación de tags.
+        # Se calcula una sola vez: si llega una ingesta durante la petición, la
+        # respuesta queda guardada con la generación anterior y no se sirve.
         cache_key = self.generate_cache_key(request)
         
-        # Intentar obtener respuesta del cache
-        cached_response = cache.get(cache_key)
-        if cached_response:
+        # Intentar obtener respuesta del cache: se retornan los bytes tal cual
+        cached = self.get_entry(cache_key)
+        if cached and cached['fresh_until'] > time.time():
             logger.info(f"Cache hit for {request.path}")
-            return JsonResponse(cached_response)
-        
+            return self.build_cached_response(request, cached, 'HIT')
+
+        if self.acquire(cache_key):
+            # Esta petición recalcula; process_response guarda y libera el lock
+            request._response_cache_key = cache_key
+            request._response_cache_owner = True
+            return None
+
+        stale = cached or self.get_previous_entry(request, cache_key)
+        if stale:
+            logger.info(f"Cache stale for {request.path} (recalculando en otra petición)")
+            return self.build_cached_response(request, stale, 'STALE')
+
+        cached = self.wait_for(cache_key)
+        if cached:
+            logger.info(f"Cache hit for {request.path} (tras esperar)")
+            return self.build_cached_response(request, cached, 'HIT')
+
+        # La otra petición tardó demasiado o falló: se calcula sin lock
+        request._response_cache_key = cache_key
         return None
     
     def process_response(self, request, response):
-        # Solo cachear respuestas exitosas de GET
-        if (request.method == 'GET' and 
+        cache_key = getattr(request, '_response_cache_key', None)
+
+        # Solo cachear respuestas JSON exitosas de GET ya renderizadas (y con datos
+        # actuales: las armadas con el respaldo de Mongo no se guardan)
+        if (cache_key and
             response.status_code == 200 and
-            any(request.path.startswith(path) for path in self.cacheable_paths)):
-            
-            cache_key = self.generate_cache_key(request)
+            not response.streaming and
+            not response.has_header('X-Data-Stale') and
+            response.get('Content-Type', '').startswith('application/json')):
             
-            # Cachear el contenido de la respuesta
             try:
-                import json
-                response_data = json.loads(response.content.decode('utf-8'))
-                cache.set(cache_key, response_data, self.cache_timeout)
+                body = response.content
+                etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+                compressed = self.compress and len(body) >= self.compress_min_bytes
+                cache.set_many({
+                    cache_key: {
+                        'body': zlib.compress(body) if compressed else body,
+                        'compressed': compressed,
+                        'content_type': response['Content-Type'],
+                        'etag': etag,
+                        'fresh_until': time.time() + self.cache_timeout,
+                    },
+                    # Última clave calculada para esta URL: respaldo stale tras una invalidación
+                    self.previous_key(request): cache_key,
+                }, self.cache_timeout + self.stale_timeout)
+                response['ETag'] = etag
+                response['X-Cache'] = 'MISS'
                 logger.info(f"Cached response for {request.path}")
             except Exception as e:
                 logger.error(f"Failed to cache response: {e}")
+
+        if getattr(request, '_response_cache_owner', False):
+            self.release(cache_key)
         
         return response
-    
+
+    def get_entry(self, cache_key):
+        cached = cache.get(cache_key)
+        if isinstance(cached, dict) and 'body' in cached and 'fresh_until' in cached:
+            return cached
+        return None
+
+    def get_previous_entry(self, request, cache_key):
+        """Respuesta de la generación anterior de la misma URL (si stale está habilitado)"""
+        if self.stale_timeout <= 0:
+            return None
+        previous_key = cache.get(self.previous_key(request))
+        if not previous_key or previous_key == cache_key:
+            return None
+        return self.get_entry(previous_key)
+
+    def acquire(self, cache_key):
+        """
+        Toma el derecho a recalcular la clave: primero en el proceso, luego en
+        la cache compartida. El mutex del proceso solo protege _inflight; el
+        round-trip a la cache se hace fuera para no serializar las demás claves.
+        """
+        with self._inflight_lock:
+            if cache_key in self._inflight:
+                return False
+            event = self._inflight[cache_key] = threading.Event()
+
+        tomado = False
+        try:
+            tomado = cache.add(f"{cache_key}_lock", 1, self.lock_timeout)
+        finally:
+            if not tomado:
+                # Otro worker recalcula: las peticiones de este proceso que esperaban
+                # esta reserva pasan a esperar en la cache compartida (ver wait_for)
+                with self._inflight_lock:
+                    self._inflight.pop(cache_key, None)
+                event.set()
+        return tomado
+
+    def release(self, cache_key):
+        cache.delete(f"{cache_key}_lock")
+        with self._inflight_lock:
+            event = self._inflight.pop(cache_key, None)
+        if event:
+            event.set()
+
+    def wait_for(self, cache_key):
+        """Espera a que otra petición guarde la clave; retorna la entrada o None"""
+        deadline = time.monotonic() + self.lock_wait
+        event = self._inflight.get(cache_key)
+        if event:
+            # Misma clave en este proceso: se espera el aviso sin consultar la cache
+            event.wait(self.lock_wait)
+            cached = self.get_entry(cache_key)
+            if cached or cache.get(f"{cache_key}_lock") is None:
+                return cached
+            # La reserva del proceso no consiguió el lock: lo tiene otro worker
+
+        # Otro worker tiene el lock: se consulta la cache hasta que aparezca o se libere
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            cached = self.get_entry(cache_key)
+            if cached:
+                return cached
+            if cache.get(f"{cache_key}_lock") is None:
+                return self.get_entry(cache_key)
+        return None
+
+    def build_cached_response(self, request, cached, status='HIT'):
+        """
+        Respuesta a partir de la entrada cacheada, sin volver a serializar
+        JSON. Los 304 los resuelve ConditionalGetMiddleware (antes en la
+        cadena, con parse_etags) para todas las rutas cacheables.
+        """
+        body = zlib.decompress(cached['body']) if cached['compressed'] else cached['body']
+        response = HttpResponse(body, content_type=cached['content_type'])
+        response['ETag'] = cached['etag']
+        response['X-Cache'] = status
+        return response
+
+    def previous_key(self, request):
+        hash_key = hashlib.blake2b(request.get_full_path().encode('utf-8')).hexdigest()
+        return f"api_cache_latest_{hash_key}"
+
     def generate_cache_key(self, request):
         """Genera una clave única para el cache"""
-        url_with_params = request.get_full_path()
+        generaciones = versiones_de_peticion(request)
+        url_with_params = request.get_full_path() + '|' + ','.join(
+            f"{tag}={generacion}" for tag, generacion in sorted(generaciones.items())
+        )
         hash_key = hashlib.blake2b(url_with_params.encode('utf-8')).hexdigest()
         return f"api_cache_{hash_key}"
 
 
+class StaleDataMiddleware(MiddlewareMixin):
+    """
+    Marca las respuestas armadas con el último resultado válido de Mongo
+    (circuito abierto o base caída, ver domain.services.circuit_breaker):
+    X-Data-Stale: true y Age con la antigüedad del dato en segundos. Las
+    armadas con datos de ejemplo (MONGO_MOCK_FALLBACK) llevan X-Data-Stale
+    y X-Data-Mock: true.
+    Va después de ResponseCacheMiddleware para que esta vea la marca y no
+    guarde la respuesta.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        super().__init__(get_response)
+
+    def process_request(self, request):
+        # El contexto se reutiliza entre requests del mismo thread
+        reiniciar_obsolescencia()
+        return None
+
+    def process_response(self, request, response):
+        edad = edad_datos_obsoletos()
+        if edad is not None:
+            response['X-Data-Stale'] = 'true'
+            response['Age'] = str(int(edad))
+            logger.warning(f"Respuesta con datos de respaldo ({int(edad)}s) para {request.path}")
+        if sirvio_datos_ejemplo():
+            response['X-Data-Stale'] = 'true'
+            response['X-Data-Mock'] = 'true'
+            logger.warning(f"Respuesta con datos de ejemplo para {request.path}")
+        return response
+
+
 class RequestLoggingMiddleware(MiddlewareMixin):
     """
     Middleware para logging de requests para monitoreo de performance
@@ -0,0 +1,102 @@
+"""
+Tests de ResilientRedisCache con un Redis en memoria (fakeredis): respaldo
+local cuando Redis cae, regreso a Redis tras el intervalo de reintento y
+contadores de incr_ventana compartidos entre workers. Requiere fakeredis
+(requirements-dev.txt).
+"""
+import time
+from unittest import skipIf
+
+from django.test import SimpleTestCase
+from django_redis.pool import ConnectionFactory
+
+from Arryn_Back.infrastructure.cache.backends import ResilientRedisCache
+
+try:
+    import fakeredis
+except ImportError:  # pragma: no cover - solo en entornos sin dependencias de desarrollo
+    fakeredis = None
+
+RETRY_INTERVAL = 0.2
+
+
+def crear_cache(server, location="redis://localhost:6379/1"):
+    """Una instancia por worker: cada LOCATION distinta tiene su propio pool de conexiones"""
+    return ResilientRedisCache(location, {
+        "TIMEOUT": 300,
+        "KEY_PREFIX": "test",
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            "CONNECTION_POOL_KWARGS": {"connection_class": fakeredis.FakeRedisConnection, "server": server},
+            "FALLBACK_RETRY_INTERVAL": RETRY_INTERVAL,
+        },
+    })
+
+
+@skipIf(fakeredis is None, "fakeredis no está instalado (pip install -r requirements-dev.txt)")
+class ResilientRedisCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        # django_redis guarda los pools por URL a nivel de clase
+        ConnectionFactory._pools.clear()
+        self.server = fakeredis.FakeServer()
+        self.cache = crear_cache(self.server)
+        # El LocMemCache de respaldo se comparte por nombre entre instancias
+        self.cache._local.clear()
+
+    def tearDown(self):
+        ConnectionFactory._pools.clear()
+
+    def test_usa_redis_mientras_responde(self):
+        self.cache.set("clave", "valor")
+
+        self.assertFalse(self.cache.usando_respaldo)
+        self.assertEqual(self.cache.get("clave"), "valor")
+        self.assertEqual(crear_cache(self.server, "redis://127.0.0.1:6379/1").get("clave"), "valor")
+
+    def test_pasa_a_cache_local_si_redis_no_responde(self):
+        self.cache.set("clave", "en redis")
+        self.server.connected = False
+
+        self.assertIsNone(self.cache.get("clave"))
+        self.assertTrue(self.cache.usando_respaldo)
+
+        self.cache.set("clave", "local")
+        self.assertEqual(self.cache.get("clave"), "local")
+        self.assertIsNone(self.cache.incr_ventana("actual", "anterior", 60))
+
+    def test_vuelve_a_redis_tras_el_intervalo(self):
+        self.server.connected = False
+        self.cache.set("clave", "local")
+        self.assertTrue(self.cache.usando_respaldo)
+
+        self.server.connected = True
+        # Dentro del intervalo se sigue usando el respaldo aunque Redis ya responda
+        self.assertEqual(self.cache.get("clave"), "local")
+
+        time.sleep(RETRY_INTERVAL + 0.05)
+        self.assertFalse(self.cache.usando_respaldo)
+        self.assertIsNone(self.cache.get("clave"))
+        self.cache.set("clave", "en redis")
+        self.assertEqual(self.cache.get("clave"), "en redis")
+
+    def test_health_check(self):
+        self.server.connected = False
+        self.assertFalse(self.cache.health_check())
+        self.assertTrue(self.cache.usando_respaldo)
+
+        self.server.connected = True
+        self.assertTrue(self.cache.health_check())
+        self.assertFalse(self.cache.usando_respaldo)
+
+    def test_incr_ventana_compartido_entre_instancias(self):
+        otro_worker = crear_cache(self.server, "redis://127.0.0.1:6379/1")
+
+        self.assertEqual(self.cache.incr_ventana("rl:ip:2", "rl:ip:1", 120), (1, 0))
+        self.assertEqual(otro_worker.incr_ventana("rl:ip:2", "rl:ip:1", 120), (2, 0))
+        self.assertEqual(self.cache.incr_ventana("rl:ip:2", "rl:ip:1", 120), (3, 0))
+
+        # La ventana siguiente ve el conteo de la anterior y tiene vencimiento
+        self.assertEqual(otro_worker.incr_ventana("rl:ip:3", "rl:ip:2", 120), (1, 3))
+        cliente = fakeredis.FakeRedis(server=self.server, db=1)
+        self.assertTrue(0 < cliente.ttl(self.cache._redis.make_key("rl:ip:3")) <= 120)
@@ -65,7 +65,13 @@ main() {
             collect_static
             create_superuser
             
-            log "🌟 Iniciando servidor Gunicorn..."
+            # Con workers de uvicorn se sirve la aplicación ASGI (vistas async si ASYNC_VIEWS_ENABLED=True)
+            APP_MODULE="Arryn_Back.infrastructure.config.wsgi:application"
+            case "${GUNICORN_WORKER_CLASS:-sync}" in
+                *uvicorn*) APP_MODULE="Arryn_Back.infrastructure.config.asgi:application" ;;
+            esac
+
+            log "🌟 Iniciando servidor Gunicorn ($APP_MODULE)..."
             exec gunicorn \
                 --bind 0.0.0.0:8000 \
                 --workers ${GUNICORN_WORKERS:-3} \
@@ -78,7 +84,7 @@ main() {
                 --log-level ${GUNICORN_LOG_LEVEL:-info} \
                 --access-logfile - \
                 --error-logfile - \
-                Arryn_Back.infrastructure.config.wsgi:application
+                "$APP_MODULE"
             ;;
         
         "development"|"dev")
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""
+Benchmark de los percentiles y rangos del análisis de precios por categoría
+(ReportService.generate_price_analysis_report). Compara el esquema anterior
+($push de todos los precios en un documento, lista completa en Python y
+get_percentile recalculado dentro de cada comprensión) con el recorrido
+ordenado de percentiles.py, y verifica que ambos den el mismo resultado.
+No necesita Mongo: los precios ordenados simulan el cursor con sort por el
+índice categoria_precio.
+
+Uso: python scripts/bench_price_analysis.py [--tamanos 10000 100000 1000000] [--repeticiones 3]
+"""
+
+import argparse
+import math
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import bson
+
+# Agregar el directorio raíz al path
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from Arryn_Back.domain.services.percentiles import recorrer_ordenado  # noqa: E402
+from Arryn_Back.domain.services.report_service import CORTES_RANGOS, PERCENTILES_REPORTE  # noqa: E402
+
+LIMITE_DOCUMENTO = 16 * 1024 * 1024
+
+
+def esquema_anterior(precios):
+    """Cálculo que hacía _reporte_analisis_precios sobre precios_ordenados"""
+    def get_percentile(prices, percentile):
+        if not prices:
+            return 0
+        k = (len(prices) - 1) * percentile / 100
+        f = math.floor(k)
+        c = math.ceil(k)
+        if f == c:
+            return prices[int(k)]
+        return prices[int(f)] * (c - k) + prices[int(c)] * (k - f)
+
+    ranges = {
+        "economico": len([p for p in precios if p <= get_percentile(precios, 33)]),
+        "medio": len([p for p in precios if get_percentile(precios, 33) < p <= get_percentile(precios, 66)]),
+        "premium": len([p for p in precios if p > get_percentile(precios, 66)])
+    }
+    return {p: get_percentile(precios, p) for p in PERCENTILES_REPORTE}, ranges
+
+
+def esquema_actual(precios):
+    """Recorrido ordenado: una pasada que se corta al resolver el último corte"""
+    distribucion = recorrer_ordenado(iter(precios), len(precios), PERCENTILES_REPORTE, CORTES_RANGOS)
+    hasta = distribucion["hasta_corte"]
+    ranges = {
+        "economico": hasta[33],
+        "medio": hasta[66] - hasta[33],
+        "premium": len(precios) - hasta[66]
+    }
+    return distribucion["percentiles"], ranges
+
+
+def generar_precios(cantidad, semilla):
+    """Precios redondeados a miles (muchos empates, como en las tiendas)"""
+    azar = random.Random(semilla)
+    return sorted(round(azar.lognormvariate(13.5, 0.8), -3) for _ in range(cantidad))
+
+
+def medir(funcion, precios, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion(precios)
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos), resultado
+
+
+def iguales(a, b):
+    percentiles_a, rangos_a = a
+    percentiles_b, rangos_b = b
+    return rangos_a == rangos_b and all(
+        math.isclose(percentiles_a[p], percentiles_b[p], rel_tol=1e-12) for p in PERCENTILES_REPORTE
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args()
+
+    # Casos borde: pocos elementos y todos iguales
+    for precios in ([], [5.0], [1.0, 2.0], [3.0, 3.0, 3.0], [1.0, 2.0, 2.0, 2.0, 9.0]):
+        if precios and not iguales(esquema_anterior(precios), esquema_actual(precios)):
+            sys.exit(f"❌ Resultados distintos para {precios}")
+
+    print(f"{'precios':>10}  {'$push (MB)':>10}  {'anterior':>10}  {'actual':>10}  {'mejora':>7}")
+    for cantidad in args.tamanos:
+        precios = generar_precios(cantidad, args.semilla)
+        tamano = len(bson.encode({"precios": precios}))
+        anterior, resultado_anterior = medir(esquema_anterior, precios, args.repeticiones)
+        actual, resultado_actual = medir(esquema_actual, precios, args.repeticiones)
+        if not iguales(resultado_anterior, resultado_actual):
+            sys.exit(f"❌ Resultados distintos con {cantidad} precios: {resultado_anterior} != {resultado_actual}")
+        aviso = "  (supera 16MB: la agregación falla)" if tamano > LIMITE_DOCUMENTO else ""
+        print(f"{cantidad:>10}  {tamano / 1024 / 1024:>10.1f}  {anterior * 1000:>8.1f}ms  "
+              f"{actual * 1000:>8.1f}ms  {anterior / actual:>6.1f}x{aviso}")
+
+    print("\n✅ Percentiles y rangos idénticos en todos los tamaños")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Benchmark de los motores de ranking (RANKING_ENGINE): pipelines de
+agregación de Mongo vs snapshot en memoria con NumPy
+(ranking_snapshot_service). Usa la colección archivos de la base
+configurada (MONGO_HOST, MONGO_DB_NAME...), así que necesita Mongo con datos
+y NumPy instalado. Verifica que ambos motores den los mismos scores en el
+mismo orden.
+
+Uso: python scripts/bench_ranking_engine.py [--categoria TV] [--limit 20] [--dias 7] [--repeticiones 5]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from Arryn_Back.domain.services.category_stats_service import CategoryStatsService  # noqa: E402
+from Arryn_Back.domain.services.mongo_service import get_db  # noqa: E402
+from Arryn_Back.domain.services.ranking_service import _pipeline_ranking, _pipeline_trending  # noqa: E402
+from Arryn_Back.domain.services.ranking_snapshot_service import SnapshotCatalogo, np  # noqa: E402
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos), resultado
+
+
+def comparar(nombre, campo, mongo, snapshot):
+    """
+    Los empates pueden salir en otro orden: se comparan los scores posición a
+    posición (redondeados: el pipeline toma su propio datetime.now())
+    """
+    scores_mongo = [round(doc[campo], 6) for doc in mongo]
+    scores_snapshot = [round(campos[campo], 6) for _, campos in snapshot]
+    if scores_mongo != scores_snapshot:
+        sys.exit(f"❌ {nombre}: scores distintos\n  mongo:    {scores_mongo}\n  snapshot: {scores_snapshot}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--categoria", default=None)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--dias", type=int, default=7)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    if np is None:
+        sys.exit("❌ NumPy no está instalado (pip install numpy)")
+    db = get_db()
+    if db is None:
+        sys.exit("❌ No hay conexión a MongoDB")
+
+    # El pipeline de ranking lee categoria_stats: se recalcula para comparar con datos al día
+    CategoryStatsService.refrescar([args.categoria] if args.categoria else None)
+
+    inicio = time.perf_counter()
+    snapshot = SnapshotCatalogo.desde_mongo(db)
+    construccion = time.perf_counter() - inicio
+    print(f"Snapshot: {len(snapshot)} productos en {construccion * 1000:.0f}ms")
+
+    ahora = datetime.now()
+    ranking_mongo, resultado_mongo = medir(
+        lambda: list(db["archivos"].aggregate(_pipeline_ranking(args.categoria, args.limit))), args.repeticiones
+    )
+    ranking_snapshot, resultado_snapshot = medir(
+        lambda: snapshot.ranking_por_valor(args.categoria, args.limit, ahora), args.repeticiones
+    )
+    comparar("ranking", "score_total", resultado_mongo, resultado_snapshot)
+
+    trending_mongo, tendencias_mongo = medir(
+        lambda: list(db["archivos"].aggregate(_pipeline_trending(args.dias, args.limit))), args.repeticiones
+    )
+    trending_snapshot, tendencias_snapshot = medir(
+        lambda: snapshot.trending(args.dias, args.limit, ahora), args.repeticiones
+    )
+    comparar("trending", "trending_score", tendencias_mongo, tendencias_snapshot)
+
+    print(f"{'consulta':>10}  {'mongo':>10}  {'snapshot':>10}  {'mejora':>7}")
+    for nombre, mongo, memoria in (("ranking", ranking_mongo, ranking_snapshot),
+                                   ("trending", trending_mongo, trending_snapshot)):
+        print(f"{nombre:>10}  {mongo * 1000:>8.1f}ms  {memoria * 1000:>8.2f}ms  {mongo / memoria:>6.0f}x")
+
+    print("\n✅ Mismos scores en el mismo orden con ambos motores")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+Benchmark del costo por request de RateLimitMiddleware
+Compara el esquema anterior (cache.get + cache.set de un dict) con la
+ventana deslizante actual, usando el backend de cache configurado:
+
+  python scripts/bench_rate_limit.py                       # LocMem (contadores en memoria)
+  CACHE_BACKEND=django_redis.cache.RedisCache \\
+  CACHE_LOCATION=redis://localhost:6379/1 \\
+  python scripts/bench_rate_limit.py --requests 20000      # Redis compartido
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("DEBUG", "True")
+os.environ.setdefault("MONGO_CONNECTION_TIMEOUT", "100")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "Arryn_Back.infrastructure.config.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.cache import cache, caches  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+
+from Arryn_Back.infrastructure.middleware.performance import RateLimitMiddleware  # noqa: E402
+
+
+def limite_anterior(ip, window_size=60):
+    """Implementación previa: lectura y escritura no atómicas de un dict"""
+    cache_key = f"rate_limit_{ip}"
+    current_data = cache.get(cache_key, {'count': 0, 'window_start': time.time()})
+    current_time = time.time()
+    if current_time - current_data['window_start'] > window_size:
+        current_data = {'count': 1, 'window_start': current_time}
+    else:
+        current_data['count'] += 1
+    cache.set(cache_key, current_data, window_size)
+
+
+def medir(nombre, funcion, requests):
+    funcion(0)
+    inicio_cpu, inicio = time.process_time(), time.perf_counter()
+    for i in range(requests):
+        funcion(i)
+    cpu = (time.process_time() - inicio_cpu) / requests * 1e6
+    real = (time.perf_counter() - inicio) / requests * 1e6
+    print(f"  {nombre:<28} {cpu:>8.1f} µs CPU/request  {real:>8.1f} µs/request")
+    return real
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--ips", type=int, default=100, help="IPs distintas simuladas")
+    args = parser.parse_args()
+
+    middleware = RateLimitMiddleware(lambda request: None)
+    middleware.rate_limit = 10 ** 9  # medir solo el costo, sin rechazar
+    factory = RequestFactory()
+    requests = [factory.get("/api/offers/Smart%20TV/", REMOTE_ADDR=f"10.0.{i // 256}.{i % 256}")
+                for i in range(args.ips)]
+
+    print(f"Backend: {type(caches['default']).__name__}")
+    anterior = medir("get + set de dict (anterior)",
+                     lambda i: limite_anterior(f"10.0.{i % args.ips}"), args.requests)
+    actual = medir("ventana deslizante",
+                   lambda i: middleware.process_request(requests[i % args.ips]), args.requests)
+    print(f"  diferencia: {actual - anterior:+.1f} µs/request")
+
+
+if __name__ == "__main__":
+    main()
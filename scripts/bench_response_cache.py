@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+Benchmark del costo por hit de ResponseCacheMiddleware
+Compara el esquema anterior (dict + JsonResponse en cada hit) con el actual
+(bytes pre-serializados, opcionalmente comprimidos). No necesita Mongo ni Redis.
+
+Uso: python scripts/bench_response_cache.py [--productos 200] [--iteraciones 5000]
+"""
+
+import argparse
+import os
+import pickle
+import sys
+import time
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("DEBUG", "True")
+os.environ.setdefault("MONGO_CONNECTION_TIMEOUT", "100")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "Arryn_Back.infrastructure.config.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.cache import cache  # noqa: E402
+from django.http import JsonResponse  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+
+from Arryn_Back.infrastructure.middleware.performance import ResponseCacheMiddleware  # noqa: E402
+
+
+def payload(productos):
+    """Respuesta parecida a /api/offers/<category>/"""
+    return {
+        "category": "Smart TV",
+        "count": productos,
+        "results": [
+            {
+                "_id": f"{i:024x}",
+                "titulo": f"Televisor LED {i} pulgadas Smart TV UHD 4K",
+                "marca": "Samsung",
+                "precio_texto": f"${1_000_000 + i:,}",
+                "precio_valor": 1_000_000.0 + i,
+                "moneda": "COP",
+                "categoria": "Smart TV",
+                "imagen": f"https://images.example.com/{i}.jpg",
+                "link": f"https://www.exito.com/producto-{i}/p",
+                "fuente": "exito",
+                "fecha_extraccion": "2025-09-20T10:00:00",
+            }
+            for i in range(productos)
+        ],
+    }
+
+
+def medir(nombre, funcion, iteraciones):
+    funcion()
+    inicio_cpu, inicio = time.process_time(), time.perf_counter()
+    for _ in range(iteraciones):
+        funcion()
+    cpu = (time.process_time() - inicio_cpu) / iteraciones * 1e6
+    real = (time.perf_counter() - inicio) / iteraciones * 1e6
+    print(f"  {nombre:<32} {cpu:>9.1f} µs CPU/hit  {real:>9.1f} µs/hit")
+    return cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--productos", type=int, default=200)
+    parser.add_argument("--iteraciones", type=int, default=5000)
+    args = parser.parse_args()
+
+    data = payload(args.productos)
+    body = JsonResponse(data).content
+    middleware = ResponseCacheMiddleware(lambda request: None)
+    request = RequestFactory().get("/api/offers/Smart%20TV/")
+
+    # Lo que se guardaba antes: el dict; en cada hit se serializaba de nuevo
+    anterior = pickle.dumps(data)
+
+    def hit_anterior():
+        JsonResponse(pickle.loads(anterior)).content
+
+    def entrada(compressed):
+        # Se guarda con el middleware real en la cache por defecto (LocMem)
+        middleware.compress, middleware.compress_min_bytes = compressed, 0
+        request._response_cache_key = "bench_response_cache"
+        middleware.process_response(request, JsonResponse(data))
+        return pickle.dumps(cache.get("bench_response_cache"))
+
+    actual, comprimida = entrada(False), entrada(True)
+
+    def hit(serializada):
+        return lambda: middleware.build_cached_response(request, pickle.loads(serializada)).content
+
+    print(f"Respuesta de {args.productos} productos: {len(body):,} bytes")
+    print(f"  tamaño en cache: dict {len(anterior):,} B | bytes {len(actual):,} B | zlib {len(comprimida):,} B")
+    base = medir("dict + JsonResponse (anterior)", hit_anterior, args.iteraciones)
+    nuevo = medir("bytes pre-serializados", hit(actual), args.iteraciones)
+    zlib_cpu = medir("bytes comprimidos (zlib)", hit(comprimida), args.iteraciones)
+    print(f"  mejora: x{base / nuevo:.1f} sin compresión, x{base / zlib_cpu:.1f} con zlib")
+
+
+if __name__ == "__main__":
+    main()
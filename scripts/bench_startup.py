@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Benchmark del arranque de un worker: importa la aplicación WSGI y el URLconf
+(lo que gunicorn hace al iniciar cada worker, también al reciclarlos con
+--max-requests) en un proceso nuevo con `python -X importtime`, apuntando
+MongoDB a una dirección inalcanzable. Ningún import debe esperar a la red,
+así que el tiempo tiene que quedar por debajo de --max-seconds aunque Mongo
+no responda.
+
+Uso:
+  python scripts/bench_startup.py
+  python scripts/bench_startup.py --runs 5 --top 15 --max-seconds 1.0
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+CODIGO_WORKER = (
+    "from Arryn_Back.infrastructure.config.wsgi import application\n"
+    "from django.urls import get_resolver\n"
+    "get_resolver().url_patterns\n"
+)
+
+
+def ejecutar(env):
+    """Wall time del arranque y líneas de -X importtime"""
+    inicio = time.perf_counter()
+    resultado = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CODIGO_WORKER],
+        cwd=BASE_DIR, env=env, capture_output=True, text=True,
+    )
+    duracion = time.perf_counter() - inicio
+    if resultado.returncode != 0:
+        print(resultado.stderr[-2000:])
+        sys.exit(f"❌ El arranque falló (código {resultado.returncode})")
+    return duracion, resultado.stderr.splitlines()
+
+
+def modulos_mas_lentos(lineas, top, prefijo=None):
+    """(módulo, µs acumulados) ordenados por tiempo acumulado"""
+    modulos = []
+    for linea in lineas:
+        if not linea.startswith("import time:") or "cumulative" in linea:
+            continue
+        _, acumulado, nombre = linea[len("import time:"):].split("|")
+        nombre = nombre.strip()
+        if prefijo is None or nombre.startswith(prefijo):
+            modulos.append((nombre, int(acumulado)))
+    return sorted(modulos, key=lambda m: m[1], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10, help="módulos más lentos a mostrar")
+    parser.add_argument("--max-seconds", type=float, default=1.0, help="objetivo para la mediana")
+    parser.add_argument("--mongo-host", default="10.255.255.1", help="host inalcanzable (no responde ni rechaza)")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault("SECRET_KEY", "bench")
+    env.setdefault("LOG_FILE", os.devnull)
+    env.update({
+        "DEBUG": "False",
+        "MONGO_HOST": args.mongo_host,
+        "MONGO_ENSURE_INDEXES_ON_STARTUP": "False",
+        "DJANGO_SETTINGS_MODULE": "Arryn_Back.infrastructure.config.settings",
+    })
+
+    tiempos = []
+    for _ in range(args.runs):
+        duracion, lineas = ejecutar(env)
+        tiempos.append(duracion)
+    mediana = statistics.median(tiempos)
+
+    print(f"MongoDB: {args.mongo_host} (inalcanzable), timeout configurado: "
+          f"{env.get('MONGO_CONNECTION_TIMEOUT', '5000')} ms")
+    print(f"Arranque del worker: mediana {mediana:.3f}s  "
+          f"(min {min(tiempos):.3f}s, máx {max(tiempos):.3f}s, {args.runs} ejecuciones)")
+
+    print("\nMódulos del proyecto más lentos (acumulado, última ejecución):")
+    for nombre, micros in modulos_mas_lentos(lineas, args.top, "Arryn_Back"):
+        print(f"  {micros / 1000:>8.1f} ms  {nombre}")
+    print("\nMódulos más lentos en total:")
+    for nombre, micros in modulos_mas_lentos(lineas, args.top):
+        print(f"  {micros / 1000:>8.1f} ms  {nombre}")
+
+    if mediana > args.max_seconds:
+        sys.exit(f"\n❌ El arranque supera el objetivo de {args.max_seconds:.2f}s")
+    print(f"\n✅ Arranque dentro del objetivo de {args.max_seconds:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
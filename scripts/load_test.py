@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+Prueba de carga simple: requests/seg y latencias a concurrencia fija
+Sirve para comparar el modo síncrono (WSGI) con el asíncrono (ASGI + uvicorn)
+contra la misma base de datos. Usar un RATE_LIMIT_REQUESTS alto en el servidor
+y --bust-cache para que ResponseCacheMiddleware no responda desde la cache.
+
+  # Síncrono (WSGI, gevent)
+  gunicorn -w 4 -k gevent Arryn_Back.infrastructure.config.wsgi:application
+  # Asíncrono (ASGI)
+  ASYNC_VIEWS_ENABLED=True gunicorn -w 4 -k uvicorn.workers.UvicornWorker \\
+      Arryn_Back.infrastructure.config.asgi:application
+
+  python scripts/load_test.py --url "http://127.0.0.1:8000/api/ranked-offers/?category=Smart%20TV" \\
+      --concurrency 50 --duration 20 --bust-cache
+"""
+
+import argparse
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def worker(url, deadline, bust_cache, contador, latencias, errores, lock):
+    separador = "&" if "?" in url else "?"
+    while time.perf_counter() < deadline:
+        with lock:
+            numero = next(contador)
+        destino = f"{url}{separador}_bust={numero}" if bust_cache else url
+        inicio = time.perf_counter()
+        try:
+            with urllib.request.urlopen(destino, timeout=30) as respuesta:
+                respuesta.read()
+                ok = 200 <= respuesta.status < 300
+        except (urllib.error.URLError, OSError):
+            ok = False
+        duracion = time.perf_counter() - inicio
+        with lock:
+            if ok:
+                latencias.append(duracion)
+            else:
+                errores.append(duracion)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", required=True)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10.0, help="segundos")
+    parser.add_argument("--bust-cache", action="store_true", help="parámetro único por request")
+    args = parser.parse_args()
+
+    latencias, errores = [], []
+    lock = threading.Lock()
+    contador = iter(range(10 ** 12))
+    inicio = time.perf_counter()
+    deadline = inicio + args.duration
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for _ in range(args.concurrency):
+            pool.submit(worker, args.url, deadline, args.bust_cache, contador, latencias, errores, lock)
+    total = time.perf_counter() - inicio
+
+    print(f"URL: {args.url}")
+    print(f"Concurrencia: {args.concurrency}  Duración: {total:.1f}s")
+    print(f"Requests OK: {len(latencias)}  Errores: {len(errores)}")
+    print(f"Requests/seg: {len(latencias) / total:.1f}")
+    if latencias:
+        latencias.sort()
+        p95 = latencias[min(len(latencias) - 1, int(len(latencias) * 0.95))]
+        print(f"Latencia p50: {statistics.median(latencias) * 1000:.1f} ms  "
+              f"p95: {p95 * 1000:.1f} ms  máx: {latencias[-1] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()